@@ -0,0 +1,70 @@
+"""
+pytest-benchmark entry point for the DB-free ETL steps.
+
+    pip install -r requirements.txt
+    pytest benchmarks/bench_pipeline.py --benchmark-json=bench.json
+
+Loads and queries need a database and are covered by run_benchmarks.py.
+"""
+import os
+import sys
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+from data.generate_synthetic_data import generate, parse_args
+from extract import extract_json_data
+from transform import transform_song_data, transform_log_data
+from lookup import SongLookup
+from etl_pipeline import build_songplays
+from sessions import build_sessions
+from schema import SONG_SCHEMA, LOG_SCHEMA
+
+SCALES = [10_000, 100_000]
+
+
+@pytest.fixture(scope='module', params=SCALES, ids=lambda events: f"{events}-events")
+def dataset(request, tmp_path_factory):
+    events = request.param
+    out = tmp_path_factory.mktemp(f"data-{events}")
+    generate(parse_args(['--events', str(events), '--songs', str(max(1000, events // 20)), '--days', '7',
+                         '--out', str(out)]))
+    song_raw = extract_json_data(str(out / 'song_data'), schema=SONG_SCHEMA)
+    log_raw = extract_json_data(str(out / 'log_data'), schema=LOG_SCHEMA)
+    songs_df, artists_df = transform_song_data(song_raw)
+    log_df = transform_log_data(log_raw)[2]
+    return {'out': out, 'song_raw': song_raw, 'log_raw': log_raw, 'songs_df': songs_df,
+            'artists_df': artists_df, 'log_df': log_df}
+
+
+def test_extract_logs(benchmark, dataset):
+    df = benchmark(extract_json_data, str(dataset['out'] / 'log_data'), schema=LOG_SCHEMA)
+    benchmark.extra_info['rows'] = len(df)
+
+
+def test_transform_songs(benchmark, dataset):
+    benchmark(transform_song_data, dataset['song_raw'])
+    benchmark.extra_info['rows'] = len(dataset['song_raw'])
+
+
+def test_transform_logs(benchmark, dataset):
+    benchmark(transform_log_data, dataset['log_raw'])
+    benchmark.extra_info['rows'] = len(dataset['log_raw'])
+
+
+def test_fact_join(benchmark, dataset):
+    lookup = SongLookup.from_frames(dataset['songs_df'], dataset['artists_df'])
+    songplays = benchmark(build_songplays, dataset['log_df'], lookup)
+    assert songplays['song_id'].notna().all()
+    benchmark.extra_info['rows'] = len(songplays)
+
+
+def test_sessions(benchmark, dataset):
+    lookup = SongLookup.from_frames(dataset['songs_df'], dataset['artists_df'])
+    songplays = build_songplays(dataset['log_df'], lookup)
+    benchmark(build_sessions, songplays)
+    benchmark.extra_info['rows'] = len(songplays)
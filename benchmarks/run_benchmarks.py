@@ -0,0 +1,229 @@
+"""
+End-to-end benchmarks for the ETL and analytics paths.
+
+Generates seeded synthetic data at each scale (see data/generate_synthetic_data.py),
+then times extract, transform, the songplays fact join, load_to_db per table and
+every EDA/dashboard query. Each result records the best wall time over --repeat
+runs, rows/sec and the peak RSS of this process during the step (extract worker
+processes are not included). Results are written as JSON; pass --compare with an
+earlier results file to flag steps that got slower than --tolerance.
+
+Loads and queries run against --database-url, which is DROPPED AND RECREATED from
+sql/, so point it at a scratch database (e.g. the docker-compose Postgres). Without
+it, an embedded engine (DuckDB when duckdb-engine is installed, else SQLite) in
+the work directory is used; PostgreSQL-only queries are recorded as errors there.
+
+    python benchmarks/run_benchmarks.py --scales 10000 100000 --out bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks measure the queries themselves, never the result cache
+os.environ['QUERY_CACHE'] = 'false'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'dashboard'))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, text
+from data.generate_synthetic_data import generate, parse_args as generator_args
+from extract import extract_json_data
+from transform import transform_song_data, transform_log_data
+from load import load_to_db
+from lookup import SongLookup
+from etl_pipeline import build_songplays
+from sessions import build_sessions
+from user_versions import build_user_versions
+from rollups import refresh_rollups
+from schema import SONG_SCHEMA, LOG_SCHEMA
+from instrument import peak_rss_mb, reset_peak_rss
+import eda_analysis
+import generate_data
+
+def measure(name, scale, func, rows=None, repeat=1, setup=None):
+    """Time func() (best of `repeat`); rows is a count or a callable of func's result."""
+    best, result, error = None, None, None
+    reset_peak_rss()
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:  # recorded, so one unsupported query does not stop the run
+            error = f"{type(e).__name__}: {str(e).splitlines()[0]}"
+            break
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    record = {'name': name, 'scale': scale, 'seconds': best, 'peak_rss_mb': peak_rss_mb()}
+    if error is None:
+        count = rows(result) if callable(rows) else rows
+        record['rows'] = count
+        record['rows_per_sec'] = round(count / best) if count is not None and best else None
+    else:
+        record['error'] = error
+    status = f"{best:.4f}s" if error is None else f"ERROR {error}"
+    print(f"[bench] {scale:>10,} {name:32} {status}")
+    return record, result
+
+def default_database_url(workdir):
+    try:
+        import duckdb_engine  # noqa: F401
+        return f"duckdb:///{os.path.join(workdir, 'bench.duckdb')}"
+    except ImportError:
+        return f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+def reset_database(engine):
+    """Drop and recreate the star schema (PostgreSQL); embedded engines start from an empty file."""
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as conn:
+        for script in ('drop_tables.sql', 'create_tables.sql'):
+            with open(os.path.join(ROOT, 'sql', script)) as f:
+                conn.execute(text(f.read()))
+
+def query_benchmarks(engine):
+    """(name, callable) for every EDA and dashboard query."""
+    source = 'rollup' if engine.dialect.name == 'postgresql' else 'fact'
+    return [
+        ('eda.basic_stats', lambda: eda_analysis.basic_stats(engine)),
+        ('eda.user_summary', lambda: eda_analysis.user_summary(engine)),
+        ('eda.song_summary', lambda: eda_analysis.song_summary(engine)),
+        ('eda.artist_summary', lambda: eda_analysis.artist_summary(engine)),
+        ('eda.session_summary', lambda: eda_analysis.session_summary(engine)),
+        ('eda.metrics', lambda: eda_analysis.run_metrics(engine, eda_analysis.EDA_METRICS, source=source)),
+        ('dashboard.table_counts', lambda: generate_data.generate_table_counts(engine)),
+        ('dashboard.metrics', lambda: generate_data.run_metrics(
+            engine, generate_data.DASHBOARD_METRICS, generate_data.DASHBOARD_LIMITS, source=source)),
+        ('dashboard.user_levels', lambda: generate_data.generate_user_levels(engine)),
+        ('dashboard.recent_activity', lambda: generate_data.generate_recent_activity(engine)),
+        ('dashboard.daily_active_users', lambda: generate_data.generate_daily_active_users(engine, sketches=False)),
+    ]
+
+def run_scale(events, args, workdir):
+    """Benchmark every step on a fresh dataset and database of `events` log events."""
+    data_dir = os.path.join(workdir, f"data-{events}")
+    songs = max(1000, events // 20)
+    generate(generator_args(['--events', str(events), '--songs', str(songs), '--artists', str(max(100, songs // 5)),
+                             '--users', str(max(100, events // 1000)), '--days', '7', '--seed', str(args.seed),
+                             '--out', data_dir]))
+    song_path, log_path = os.path.join(data_dir, 'song_data'), os.path.join(data_dir, 'log_data')
+    results = []
+
+    def step(name, func, rows=None, repeat=args.repeat, setup=None):
+        record, result = measure(name, events, func, rows, repeat, setup)
+        results.append(record)
+        return result
+
+    song_raw = step('extract.songs', lambda: extract_json_data(song_path, schema=SONG_SCHEMA), len)
+    log_raw = step('extract.logs', lambda: extract_json_data(log_path, schema=LOG_SCHEMA), len)
+    songs_df, artists_df = step('transform.songs', lambda: transform_song_data(song_raw), len(song_raw))
+    time_df, user_df, log_df = step('transform.logs', lambda: transform_log_data(log_raw), len(log_raw))
+    lookup = step('join.lookup', lambda: SongLookup.from_frames(songs_df, artists_df), len(songs_df))
+    versions_df = step('transform.user_versions', lambda: build_user_versions(log_df), len(log_df))
+    songplays_df = step('join.songplays', lambda: build_songplays(log_df, lookup, versions_df), len)
+    sessions_df = step('transform.sessions', lambda: build_sessions(songplays_df), len(songplays_df))
+
+    url = args.database_url or default_database_url(workdir)
+    if url.startswith(('sqlite', 'duckdb')):
+        path = url.split(':///', 1)[1]
+        if os.path.exists(path):
+            os.remove(path)
+    engine = create_engine(url)
+    reset_database(engine)
+    if engine.dialect.name != 'postgresql':
+        # sessions.duration is a generated column in PostgreSQL; embedded tables get it up front
+        sessions_df = sessions_df.assign(duration=(sessions_df['end_time'] - sessions_df['start_time']).dt.total_seconds())
+    for table, df in [('artists', artists_df), ('songs', songs_df), ('time', time_df), ('users', user_df),
+                      ('user_versions', versions_df), ('songplays', songplays_df), ('sessions', sessions_df)]:
+        # Loads are not idempotent (songplays appends), so each is timed once
+        step(f"load.{table}", lambda df=df, table=table: load_to_db(df, table, engine), len(df), repeat=1)
+    if engine.dialect.name == 'postgresql':
+        step('load.refresh_rollups', lambda: refresh_rollups(engine, rebuild=True), len(songplays_df), repeat=1)
+    else:
+        # The embedded engine has no rollups; the DAU query reads a plain per-day copy instead
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS rollup_plays_user"))
+            conn.execute(text("""
+                CREATE TABLE rollup_plays_user AS
+                SELECT CAST(start_time AS date) AS play_date, user_id, COUNT(*) AS plays
+                FROM songplays GROUP BY 1, 2
+            """))
+
+    for name, func in query_benchmarks(engine):
+        step(name, func, lambda result: len(result) if hasattr(result, '__len__') else None)
+    engine.dispose()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, tolerance):
+    """Print steps slower than baseline by more than tolerance; return how many regressed."""
+    with open(baseline_path) as f:
+        baseline = {(r['name'], r['scale']): r for r in json.load(f)['results']}
+    regressions = 0
+    for record in results:
+        before = baseline.get((record['name'], record['scale']))
+        if not before or not before.get('seconds') or not record.get('seconds'):
+            continue
+        change = record['seconds'] / before['seconds'] - 1
+        if change > tolerance:
+            regressions += 1
+            print(f"[bench] REGRESSION {record['name']} @ {record['scale']:,}: "
+                  f"{before['seconds']:.4f}s -> {record['seconds']:.4f}s ({change:+.0%})")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[10_000, 100_000], help="log events per run")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per step; the best time is kept")
+    parser.add_argument('--database-url', help="scratch database (dropped and recreated); default embedded")
+    parser.add_argument('--workdir', help="where data and the embedded database go (default: a temp dir)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', help="earlier results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before flagging")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        results = [record for events in args.scales for record in run_scale(events, args, workdir)]
+    report = {
+        'meta': {
+            'created_at': datetime.datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': (args.database_url or 'embedded').split('@')[-1],
+            'scales': args.scales,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] results saved to {args.out}")
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
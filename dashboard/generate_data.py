@@ -5,9 +5,18 @@ Generates JSON data files for the analytics dashboard.
 
 import json
 import os
-from sqlalchemy import create_engine, text
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from analytics import run_metrics
+from query_cache import fetch_all
+from config import ANALYTICS_SOURCE, DASHBOARD_WORKERS, DASHBOARD_SKETCHES
+from sketches import daily_active_users, top_metrics
+from rollups import rollups_ready
+from embedded import analytics_engine
+
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
@@ -17,93 +26,60 @@ def ensure_output_dir():
     """Create output directory if it doesn't exist."""
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def get_engine():
-    """Create database engine."""
-    return create_engine(DATABASE_URL)
+def get_engine(workers=DASHBOARD_WORKERS):
+    """Create database engine with a connection for each concurrent query."""
+    return analytics_engine(pool_size=max(workers, 1))
+
+def _metrics(engine, metrics, names, limits=None):
+    """Use precomputed play metrics when given, otherwise compute just `names` in one query."""
+    return metrics if metrics is not None else run_metrics(engine, names, limits)
+
+def generate_table_counts(engine):
+    """Count the dimension tables in one round trip."""
+    tables = ['users', 'songs', 'artists']
+    query = "SELECT " + ", ".join(f"(SELECT COUNT(*) FROM {table})" for table in tables)
+    return {f'total_{table}': count for table, count in zip(tables, fetch_all(engine, query)[0])}
 
-def generate_overview_stats(engine):
+def generate_overview_stats(engine, metrics=None, counts=None):
     """Generate overview statistics."""
-    stats = {}
+    stats = dict(counts if counts is not None else generate_table_counts(engine))
     
-    tables = ['users', 'songs', 'artists', 'songplays']
-    with engine.connect() as conn:
-        for table in tables:
-            count = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
-            stats[f'total_{table}'] = count
-    
-    # Calculate total listening time
-    with engine.connect() as conn:
-        result = conn.execute(text("""
-            SELECT COALESCE(SUM(s.duration), 0) as total_duration
-            FROM songplays sp
-            JOIN songs s ON sp.song_id = s.song_id
-        """)).scalar()
-        stats['total_listening_minutes'] = round(result / 60, 1) if result else 0
+    # Play count and total listening time come from the songplays scan
+    totals = _metrics(engine, metrics, ['totals'])['totals']
+    total = totals[0] if totals else {'plays': 0, 'duration': 0}
+    stats['total_songplays'] = total['plays']
+    result = total['duration']
+    stats['total_listening_minutes'] = round(result / 60, 1) if result else 0
     
     return stats
 
-def generate_top_songs(engine, limit=10):
+def generate_top_songs(engine, limit=10, metrics=None):
     """Generate top played songs data."""
-    query = f"""
-        SELECT s.title, a.name as artist, COUNT(sp.songplay_id) as plays
-        FROM songplays sp
-        JOIN songs s ON sp.song_id = s.song_id
-        JOIN artists a ON sp.artist_id = a.artist_id
-        GROUP BY s.title, a.name
-        ORDER BY plays DESC
-        LIMIT {limit}
-    """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return [{'title': row[0], 'artist': row[1], 'plays': row[2]} for row in result]
+    rows = _metrics(engine, metrics, ['top_songs'], {'top_songs': limit})['top_songs']
+    return [{'title': row['title'], 'artist': row['artist'], 'plays': row['plays']} for row in rows]
 
-def generate_top_artists(engine, limit=10):
+def generate_top_artists(engine, limit=10, metrics=None):
     """Generate top artists data."""
-    query = f"""
-        SELECT a.name, COUNT(sp.songplay_id) as plays
-        FROM songplays sp
-        JOIN artists a ON sp.artist_id = a.artist_id
-        GROUP BY a.name
-        ORDER BY plays DESC
-        LIMIT {limit}
-    """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return [{'name': row[0], 'plays': row[1]} for row in result]
+    rows = _metrics(engine, metrics, ['top_artists'], {'top_artists': limit})['top_artists']
+    return [{'name': row['name'], 'plays': row['plays']} for row in rows]
 
-def generate_hourly_activity(engine):
+def generate_hourly_activity(engine, metrics=None):
     """Generate hourly listening activity."""
-    query = """
-        SELECT t.hour, COUNT(sp.songplay_id) as plays
-        FROM songplays sp
-        JOIN time t ON sp.start_time = t.start_time
-        GROUP BY t.hour
-        ORDER BY t.hour
-    """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        # Fill in all 24 hours
-        hourly = {i: 0 for i in range(24)}
-        for row in result:
-            hourly[row[0]] = row[1]
-        return [{'hour': h, 'plays': p} for h, p in hourly.items()]
-
-def generate_daily_activity(engine):
+    rows = _metrics(engine, metrics, ['hourly_plays'])['hourly_plays']
+    # Fill in all 24 hours
+    hourly = {i: 0 for i in range(24)}
+    for row in rows:
+        hourly[row['hour']] = row['plays']
+    return [{'hour': h, 'plays': p} for h, p in hourly.items()]
+
+def generate_daily_activity(engine, metrics=None):
     """Generate daily listening activity (by weekday)."""
     days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    query = """
-        SELECT t.weekday, COUNT(sp.songplay_id) as plays
-        FROM songplays sp
-        JOIN time t ON sp.start_time = t.start_time
-        GROUP BY t.weekday
-        ORDER BY t.weekday
-    """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        daily = {i: 0 for i in range(7)}
-        for row in result:
-            daily[row[0]] = row[1]
-        return [{'day': days[d], 'plays': p} for d, p in daily.items()]
+    rows = _metrics(engine, metrics, ['weekday_plays'])['weekday_plays']
+    daily = {i: 0 for i in range(7)}
+    for row in rows:
+        daily[row['weekday']] = row['plays']
+    return [{'day': days[d], 'plays': p} for d, p in daily.items()]
 
 def generate_user_levels(engine):
     """Generate subscription level distribution."""
@@ -112,23 +88,12 @@ def generate_user_levels(engine):
         FROM users
         GROUP BY level
     """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return [{'level': row[0].capitalize(), 'count': row[1]} for row in result]
+    return [{'level': row[0].capitalize(), 'count': row[1]} for row in fetch_all(engine, query)]
 
-def generate_top_locations(engine, limit=5):
+def generate_top_locations(engine, limit=5, metrics=None):
     """Generate top listening locations."""
-    query = f"""
-        SELECT location, COUNT(*) as plays
-        FROM songplays
-        WHERE location IS NOT NULL
-        GROUP BY location
-        ORDER BY plays DESC
-        LIMIT {limit}
-    """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return [{'location': row[0], 'plays': row[1]} for row in result]
+    rows = _metrics(engine, metrics, ['top_locations'], {'top_locations': limit})['top_locations']
+    return [{'location': row['location'], 'plays': row['plays']} for row in rows]
 
 def generate_recent_activity(engine, limit=10):
     """Generate recent listening activity."""
@@ -141,32 +106,86 @@ def generate_recent_activity(engine, limit=10):
         ORDER BY sp.start_time DESC
         LIMIT {limit}
     """
-    with engine.connect() as conn:
-        result = conn.execute(text(query))
-        return [{
-            'time': row[0].strftime('%Y-%m-%d %H:%M'),
-            'user': f"{row[1]} {row[2]}",
-            'song': row[3],
-            'artist': row[4]
-        } for row in result]
-
-def generate_all_data():
-    """Generate all dashboard data files."""
+    return [{
+        'time': row[0].strftime('%Y-%m-%d %H:%M'),
+        'user': f"{row[1]} {row[2]}",
+        'song': row[3],
+        'artist': row[4]
+    } for row in fetch_all(engine, query)]
+
+def generate_daily_active_users(engine, days=30, sketches=DASHBOARD_SKETCHES, source=ANALYTICS_SOURCE):
+    """Generate distinct users per day for the last `days` days with plays.
+
+    With sketches the counts are HyperLogLog estimates (about 0.8% standard error)
+    read from etl_sketches; otherwise they are exact counts from the user rollup, or
+    from songplays with the 'fact' source or until the rollups have been refreshed.
+    """
+    if sketches:
+        rows = daily_active_users(engine, days)
+    elif source == 'rollup' and rollups_ready(engine):
+        query = """
+            SELECT play_date, COUNT(*) FROM rollup_plays_user
+            GROUP BY play_date ORDER BY play_date DESC LIMIT :days
+        """
+        rows = sorted(fetch_all(engine, query, {'days': days}))
+    else:
+        query = """
+            SELECT CAST(start_time AS DATE) AS play_date, COUNT(DISTINCT user_id) FROM songplays
+            GROUP BY play_date ORDER BY play_date DESC LIMIT :days
+        """
+        rows = sorted(fetch_all(engine, query, {'days': days}))
+    return [{'date': str(day), 'users': users} for day, users in rows]
+
+DASHBOARD_METRICS = ['totals', 'top_songs', 'top_artists', 'hourly_plays', 'weekday_plays', 'top_locations']
+DASHBOARD_LIMITS = {'top_songs': 10, 'top_artists': 10, 'top_locations': 5}
+
+def generate_all_data(workers=DASHBOARD_WORKERS, sketches=DASHBOARD_SKETCHES):
+    """Generate all dashboard data files.
+
+    With workers > 1 the independent queries (table counts, user levels, recent
+    activity, daily active users and each play-metrics query) run concurrently, so
+    a refresh takes about as long as the slowest query. With sketches, the top-N
+    lists and daily active users are read from the ETL-maintained sketches.
+    """
     ensure_output_dir()
-    engine = get_engine()
+    engine = get_engine(workers)
     
     print("🎵 Generating dashboard data...")
     
+    sketched = list(DASHBOARD_LIMITS) if sketches else []
+    metric_names = [name for name in DASHBOARD_METRICS if name not in sketched]
+    sketch_limits = {name: DASHBOARD_LIMITS[name] for name in sketched}
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            counts = pool.submit(generate_table_counts, engine)
+            user_levels = pool.submit(generate_user_levels, engine)
+            recent_activity = pool.submit(generate_recent_activity, engine)
+            active_users = pool.submit(generate_daily_active_users, engine, sketches=sketches)
+            top = pool.submit(top_metrics, engine, sketch_limits)
+            metrics = run_metrics(engine, metric_names, DASHBOARD_LIMITS, executor=pool)
+            counts, user_levels, recent_activity = counts.result(), user_levels.result(), recent_activity.result()
+            active_users = active_users.result()
+            metrics.update(top.result())
+    else:
+        # All songplays aggregates in a single pass
+        metrics = run_metrics(engine, metric_names, DASHBOARD_LIMITS)
+        metrics.update(top_metrics(engine, sketch_limits))
+        counts = generate_table_counts(engine)
+        user_levels = generate_user_levels(engine)
+        recent_activity = generate_recent_activity(engine)
+        active_users = generate_daily_active_users(engine, sketches=sketches)
+    
     # Generate all data
     data = {
-        'overview': generate_overview_stats(engine),
-        'topSongs': generate_top_songs(engine),
-        'topArtists': generate_top_artists(engine),
-        'hourlyActivity': generate_hourly_activity(engine),
-        'dailyActivity': generate_daily_activity(engine),
-        'userLevels': generate_user_levels(engine),
-        'topLocations': generate_top_locations(engine),
-        'recentActivity': generate_recent_activity(engine),
+        'overview': generate_overview_stats(engine, metrics, counts),
+        'topSongs': generate_top_songs(engine, metrics=metrics),
+        'topArtists': generate_top_artists(engine, metrics=metrics),
+        'hourlyActivity': generate_hourly_activity(engine, metrics),
+        'dailyActivity': generate_daily_activity(engine, metrics),
+        'userLevels': user_levels,
+        'topLocations': generate_top_locations(engine, metrics=metrics),
+        'recentActivity': recent_activity,
+        'dailyActiveUsers': active_users,
         'generatedAt': __import__('datetime').datetime.now().isoformat()
     }
     
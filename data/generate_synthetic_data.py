@@ -0,0 +1,253 @@
+"""
+Seeded synthetic song catalog and listening logs for load testing.
+
+Writes NDJSON in the layout the ETL reads:
+
+    data/song_data/A/B/C/songs-00001.json       (--songs-per-file songs per file)
+    data/log_data/2018/11/2018-11-01-events.json (one file per day, or
+    data/log_data/2018/11/2018-11-01-events-001.json when a day is split)
+
+Song popularity is Zipfian, events follow hourly and weekday cycles, some free
+users upgrade to paid part way through, and about a fifth of events are
+non-NextSong pages. Every (day, part) file is generated by vectorized NumPy in a
+worker process from its own seed, so the output only depends on --seed and the
+size arguments, not on --workers.
+
+    python data/generate_synthetic_data.py --songs 1000000 --events 30000000 --days 30
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+SONG_DATA_PATH = 'data/song_data'
+LOG_DATA_PATH = 'data/log_data'
+
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 24 * MS_PER_HOUR
+SESSION_GAP_MS = 30 * 60 * 1000
+
+# Relative plays per hour of day (UTC) and per weekday (Monday first)
+HOURLY_WEIGHTS = np.array([2, 1.5, 1, 0.8, 0.7, 0.8, 1.5, 3, 4.5, 5, 5, 5.5,
+                           6, 6, 5.5, 5.5, 6, 7, 8, 8.5, 8, 6.5, 4.5, 3])
+WEEKDAY_WEIGHTS = np.array([1.0, 1.0, 1.02, 1.05, 1.12, 0.9, 0.85])
+
+PAGES = np.array(['Home', 'Logout', 'Login', 'Settings', 'Help', 'Upgrade', 'Downgrade',
+                  'About', 'Save Settings', 'Error', 'Submit Upgrade'])
+PAGE_WEIGHTS = np.array([45, 12, 12, 5, 5, 5, 4, 3, 4, 1, 4])
+NEXT_SONG_SHARE = 0.82
+
+WORDS = np.array(['Love', 'Night', 'Heart', 'Fire', 'Dream', 'Rain', 'Blue', 'Gold', 'River', 'Star',
+                  'Wild', 'Home', 'Ocean', 'Soul', 'Light', 'Shadow', 'Road', 'City', 'Summer', 'Moon',
+                  'Deep', 'Electric', 'Silver', 'Paper', 'Glass', 'Thunder', 'Velvet', 'Echo', 'Neon', 'Stone'])
+FIRST_NAMES = np.array(['Kaylee', 'Lily', 'Jacob', 'Layla', 'Tegan', 'Ryan', 'Chloe', 'Aleena', 'Mohammad',
+                        'Jayden', 'Avery', 'Sara', 'Noah', 'Emma', 'Liam', 'Olivia', 'Mason', 'Ava'])
+LAST_NAMES = np.array(['Summers', 'Koch', 'Garrison', 'Griffin', 'Levine', 'Smith', 'Cuevas', 'Kirby',
+                       'Rodriguez', 'Bell', 'Lee', 'Johnson', 'Brown', 'Miller', 'Davis', 'Wilson'])
+CITIES = np.array(['Phoenix-Mesa-Scottsdale, AZ', 'Chicago-Naperville-Elgin, IL-IN-WI',
+                   'San Francisco-Oakland-Hayward, CA', 'Lansing-East Lansing, MI', 'Memphis, TN',
+                   'New York-Newark-Jersey City, NY-NJ-PA', 'Atlanta-Sandy Springs-Roswell, GA',
+                   'Portland-South Portland, ME', 'Tampa-St. Petersburg-Clearwater, FL',
+                   'Seattle-Tacoma-Bellevue, WA', 'Houston-The Woodlands-Sugar Land, TX', 'Boston, MA'])
+USER_AGENTS = np.array([
+    'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.78.2 (KHTML, like Gecko) Version/7.0.6 Safari/537.78.2',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:31.0) Gecko/20100101 Firefox/31.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 7_1_2 like Mac OS X) AppleWebKit/537.51.2 (KHTML, like Gecko) Mobile/11D257',
+])
+
+def _rng(seed, *key):
+    """Independent generator for one part of the dataset, derived from the global seed."""
+    return np.random.default_rng(np.random.SeedSequence([seed, *key]))
+
+def _ids(prefix, index):
+    return np.char.add(prefix, np.char.mod('%016X', index))
+
+def _phrases(rng, n, words=2):
+    parts = [WORDS[rng.integers(len(WORDS), size=n)].astype(object) for _ in range(words)]
+    phrase = parts[0]
+    for part in parts[1:]:
+        phrase = phrase + ' ' + part
+    return phrase
+
+def zipf_cdf(n, s):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return np.cumsum(weights) / weights.sum()
+
+def build_catalog(seed, n_songs, n_artists):
+    """Songs and their artists as one frame; identical for the same seed and sizes."""
+    rng = _rng(seed, 0)
+    song_index = np.arange(n_songs)
+    # A few prolific artists, many with one or two songs
+    artist_index = rng.permutation(n_artists)[np.searchsorted(zipf_cdf(n_artists, 1.0), rng.random(n_songs))]
+    artist_names = _phrases(rng, n_artists) + np.char.add(' ', np.arange(n_artists).astype(str)).astype(object)
+    has_location = rng.random(n_artists) < 0.6
+    artist_city = np.where(has_location, CITIES[rng.integers(len(CITIES), size=n_artists)], '')
+    latitude = np.where(has_location & (rng.random(n_artists) < 0.7), rng.uniform(25, 48, n_artists), np.nan)
+    longitude = np.where(np.isnan(latitude), np.nan, rng.uniform(-122, -70, n_artists))
+    years = np.where(rng.random(n_songs) < 0.15, 0, rng.integers(1960, 2019, n_songs))
+    return pd.DataFrame({
+        'num_songs': 1,
+        'artist_id': _ids('AR', artist_index),
+        'artist_latitude': latitude[artist_index],
+        'artist_longitude': longitude[artist_index],
+        'artist_location': artist_city[artist_index],
+        'artist_name': artist_names[artist_index],
+        'song_id': _ids('SO', song_index),
+        'title': _phrases(rng, n_songs, 3),
+        'duration': np.round(rng.lognormal(np.log(230), 0.3, n_songs), 5),
+        'year': years,
+    })
+
+def build_users(seed, n_users, first_day_ms, days):
+    """User profiles, activity weights and the time (if any) each free user upgrades."""
+    rng = _rng(seed, 1)
+    paid = rng.random(n_users) < 0.2
+    upgrades = ~paid & (rng.random(n_users) < 0.3)
+    upgrade_ts = np.where(upgrades, first_day_ms + rng.integers(days * MS_PER_DAY, size=n_users),
+                          np.iinfo(np.int64).max)
+    return pd.DataFrame({
+        'userId': (np.arange(n_users) + 1).astype(str),
+        'firstName': FIRST_NAMES[rng.integers(len(FIRST_NAMES), size=n_users)],
+        'lastName': LAST_NAMES[rng.integers(len(LAST_NAMES), size=n_users)],
+        'gender': np.where(rng.random(n_users) < 0.5, 'F', 'M'),
+        'location': CITIES[rng.integers(len(CITIES), size=n_users)],
+        'userAgent': USER_AGENTS[rng.integers(len(USER_AGENTS), size=n_users)],
+        'registration': (first_day_ms - rng.integers(1, 365, n_users) * MS_PER_DAY).astype(float),
+        'level': np.where(paid, 'paid', 'free'),
+        'upgrade_ts': upgrade_ts,
+        'activity': rng.lognormal(0, 1, n_users),
+    })
+
+def day_events(seed, day, part, parts, n_events, day_ms, catalog, users, popularity_cdf, popularity_rank):
+    """Generate one (day, part) of events; users are split across parts so sessions never straddle files."""
+    rng = _rng(seed, 2, day, part)
+    members = np.flatnonzero(np.arange(len(users)) % parts == part)
+    activity = users['activity'].to_numpy()[members]
+    user = members[np.searchsorted(np.cumsum(activity) / activity.sum(), rng.random(n_events))]
+    hour = rng.choice(24, size=n_events, p=HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum())
+    ts = day_ms + hour * MS_PER_HOUR + rng.integers(MS_PER_HOUR, size=n_events)
+
+    order = np.lexsort((ts, user))
+    user, ts = user[order], ts[order]
+    position = np.arange(n_events)
+    new_session = np.ones(n_events, dtype=bool)
+    new_session[1:] = (user[1:] != user[:-1]) | (np.diff(ts) > SESSION_GAP_MS)
+    new_user = np.ones(n_events, dtype=bool)
+    new_user[1:] = user[1:] != user[:-1]
+    sessions = np.cumsum(new_session)
+    session_of_user = sessions - np.maximum.accumulate(np.where(new_user, sessions, 0)) + 1
+    item = position - np.maximum.accumulate(np.where(new_session, position, 0))
+
+    next_song = rng.random(n_events) < NEXT_SONG_SHARE
+    song = popularity_rank[np.searchsorted(popularity_cdf, rng.random(n_events))]
+    page = np.where(next_song, 'NextSong', PAGES[rng.choice(len(PAGES), size=n_events, p=PAGE_WEIGHTS / PAGE_WEIGHTS.sum())])
+    profile = users.iloc[user]
+    level = np.where(ts >= profile['upgrade_ts'].to_numpy(), 'paid', profile['level'].to_numpy())
+    songs = catalog.iloc[song]
+    return pd.DataFrame({
+        'artist': np.where(next_song, songs['artist_name'].to_numpy(), None),
+        'auth': 'Logged In',
+        'firstName': profile['firstName'].to_numpy(),
+        'gender': profile['gender'].to_numpy(),
+        'itemInSession': item,
+        'lastName': profile['lastName'].to_numpy(),
+        'length': np.where(next_song, songs['duration'].to_numpy(), np.nan),
+        'level': level,
+        'location': profile['location'].to_numpy(),
+        'method': np.where(next_song, 'PUT', 'GET'),
+        'page': page,
+        'registration': profile['registration'].to_numpy(),
+        'sessionId': day * 100_000 + session_of_user,
+        'song': np.where(next_song, songs['title'].to_numpy(), None),
+        'status': np.where(page == 'Error', 404, 200),
+        'ts': ts,
+        'userAgent': profile['userAgent'].to_numpy(),
+        'userId': profile['userId'].to_numpy(),
+    })
+
+# Per-process state built once by _init_worker
+_state = {}
+
+def _init_worker(args):
+    _state['args'] = args
+    _state['catalog'] = build_catalog(args.seed, args.songs, args.artists)
+    first_day_ms = int(pd.Timestamp(args.start_date).value // 1_000_000)
+    _state['first_day_ms'] = first_day_ms
+    _state['users'] = build_users(args.seed, args.users, first_day_ms, args.days)
+    _state['popularity_cdf'] = zipf_cdf(args.songs, args.zipf)
+    _state['popularity_rank'] = _rng(args.seed, 3).permutation(args.songs)
+
+def _write_lines(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_json(path, orient='records', lines=True)
+    return os.path.getsize(path)
+
+def _song_path(out, part):
+    letters = [chr(ord('A') + (part // 26 ** k) % 26) for k in (2, 1, 0)]
+    return os.path.join(out, SONG_DATA_PATH.split('/', 1)[1], *letters, f"songs-{part:05d}.json")
+
+def write_song_part(part):
+    args = _state['args']
+    catalog = _state['catalog']
+    chunk = catalog.iloc[part * args.songs_per_file:(part + 1) * args.songs_per_file]
+    return len(chunk), _write_lines(chunk, _song_path(args.out, part))
+
+def events_per_day(args):
+    """Split --events over the days by weekday weight."""
+    first = pd.Timestamp(args.start_date)
+    weights = WEEKDAY_WEIGHTS[[(first + pd.Timedelta(days=d)).weekday() for d in range(args.days)]]
+    counts = np.floor(args.events * weights / weights.sum()).astype(np.int64)
+    counts[:args.events - counts.sum()] += 1
+    return counts
+
+def write_log_part(task):
+    day, part, parts, n_events = task
+    args = _state['args']
+    day_ms = _state['first_day_ms'] + day * MS_PER_DAY
+    events = day_events(args.seed, day, part, parts, n_events, day_ms, _state['catalog'], _state['users'],
+                        _state['popularity_cdf'], _state['popularity_rank'])
+    date = pd.Timestamp(day_ms, unit='ms')
+    name = f"{date:%Y-%m-%d}-events.json" if parts == 1 else f"{date:%Y-%m-%d}-events-{part:03d}.json"
+    path = os.path.join(args.out, LOG_DATA_PATH.split('/', 1)[1], f"{date:%Y}", f"{date:%m}", name)
+    return n_events, _write_lines(events, path)
+
+def generate(args):
+    started = time.perf_counter()
+    song_parts = range(-(-args.songs // args.songs_per_file))
+    log_tasks = []
+    for day, n_events in enumerate(events_per_day(args)):
+        parts = max(1, min(args.users, -(-int(n_events) // args.rows_per_file)))
+        counts = np.full(parts, n_events // parts) + (np.arange(parts) < n_events % parts)
+        log_tasks += [(day, part, parts, int(count)) for part, count in enumerate(counts)]
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args,)) as pool:
+        songs = list(pool.map(write_song_part, song_parts))
+        logs = list(pool.map(write_log_part, log_tasks))
+
+    elapsed = time.perf_counter() - started
+    total_bytes = sum(size for _, size in songs) + sum(size for _, size in logs)
+    print(f"Generated {sum(n for n, _ in songs):,} songs in {len(songs)} files and "
+          f"{sum(n for n, _ in logs):,} events in {len(logs)} files "
+          f"({total_bytes / 1e9:.2f} GB) in {elapsed:.1f}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--songs', type=int, default=10_000)
+    parser.add_argument('--artists', type=int, default=2_000)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--events', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--start-date', default='2018-11-01')
+    parser.add_argument('--zipf', type=float, default=1.1, help="song popularity exponent")
+    parser.add_argument('--songs-per-file', type=int, default=1_000)
+    parser.add_argument('--rows-per-file', type=int, default=1_000_000, help="split days with more events")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default='data', help="directory receiving song_data/ and log_data/")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    generate(parse_args())
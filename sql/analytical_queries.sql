@@ -10,5 +10,12 @@ LIMIT 10;
 SELECT t.day, COUNT(DISTINCT sp.user_id) AS active_users
 FROM songplays sp
 JOIN time t ON sp.start_time = t.start_time
+WHERE sp.start_time >= now() - interval '30 days'
 GROUP BY t.day
-ORDER BY t.day;
\ No newline at end of file
+ORDER BY t.day;
+-- Plays by the subscription level users had when they played (type-2 users history)
+SELECT v.level, COUNT(*) AS play_count
+FROM songplays sp
+JOIN user_versions v ON v.user_id = sp.user_id AND v.valid_from = sp.user_valid_from
+GROUP BY v.level
+ORDER BY play_count DESC;
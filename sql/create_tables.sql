@@ -3,7 +3,21 @@ CREATE TABLE IF NOT EXISTS users (
     first_name varchar,
     last_name varchar,
     gender varchar,
-    level varchar
+    level varchar,
+    level_ts timestamp
+);
+
+-- Type-2 history of users: one row per version, valid over [valid_from, valid_to)
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id int NOT NULL,
+    first_name varchar,
+    last_name varchar,
+    gender varchar,
+    level varchar,
+    valid_from timestamp NOT NULL,
+    valid_to timestamp,
+    last_seen timestamp,
+    PRIMARY KEY (user_id, valid_from)
 );
 
 CREATE TABLE IF NOT EXISTS songs (
@@ -32,8 +46,10 @@ CREATE TABLE IF NOT EXISTS time (
     weekday int
 );
 
+-- Range-partitioned by month on start_time; monthly partitions (songplays_YYYY_MM)
+-- are created by the loader as data arrives
 CREATE TABLE IF NOT EXISTS songplays (
-    songplay_id SERIAL PRIMARY KEY,
+    songplay_id SERIAL,
     start_time timestamp NOT NULL REFERENCES time(start_time),
     user_id int NOT NULL REFERENCES users(user_id),
     level varchar,
@@ -41,5 +57,93 @@ CREATE TABLE IF NOT EXISTS songplays (
     artist_id varchar REFERENCES artists(artist_id),
     session_id int,
     location varchar,
-    user_agent varchar
-);
\ No newline at end of file
+    user_agent varchar,
+    user_valid_from timestamp,
+    PRIMARY KEY (songplay_id, start_time)
+) PARTITION BY RANGE (start_time);
+
+-- Join/group keys of the analytical, EDA and dashboard queries. Plays are appended in
+-- roughly start_time order, so a BRIN index serves the time-range filters at a tiny size
+CREATE INDEX IF NOT EXISTS songplays_start_time_brin ON songplays USING brin (start_time);
+CREATE INDEX IF NOT EXISTS songplays_user_session_idx ON songplays (user_id, session_id);
+CREATE INDEX IF NOT EXISTS songplays_song_id_idx ON songplays (song_id);
+CREATE INDEX IF NOT EXISTS songplays_artist_id_idx ON songplays (artist_id);
+CREATE INDEX IF NOT EXISTS songplays_location_idx ON songplays (location);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id int NOT NULL,
+    session_id int NOT NULL,
+    start_time timestamp NOT NULL,
+    end_time timestamp NOT NULL,
+    duration double precision GENERATED ALWAYS AS (EXTRACT(EPOCH FROM end_time - start_time)) STORED,
+    tracks int NOT NULL,
+    level varchar,
+    PRIMARY KEY (user_id, session_id)
+);
+
+CREATE TABLE IF NOT EXISTS etl_manifest (
+    path varchar PRIMARY KEY,
+    size bigint NOT NULL,
+    mtime double precision NOT NULL,
+    content_hash varchar NOT NULL,
+    processed_at timestamp NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS etl_generation (
+    id int PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    generation bigint NOT NULL DEFAULT 0,
+    token uuid NOT NULL DEFAULT gen_random_uuid()
+);
+
+CREATE TABLE IF NOT EXISTS etl_sketches (
+    name varchar NOT NULL,
+    bucket varchar NOT NULL,
+    sketch bytea NOT NULL,
+    PRIMARY KEY (name, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS etl_stream_offsets (
+    path varchar PRIMARY KEY,
+    inode bigint NOT NULL,
+    position bigint NOT NULL,
+    updated_at timestamp NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS etl_quarantine (
+    id bigserial PRIMARY KEY,
+    table_name varchar NOT NULL,
+    reasons varchar NOT NULL,
+    record jsonb NOT NULL,
+    quarantined_at timestamp NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS rollup_plays_hourly (
+    play_date date NOT NULL,
+    hour smallint NOT NULL,
+    weekday smallint NOT NULL,
+    level varchar,
+    location varchar,
+    plays bigint NOT NULL,
+    duration double precision NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (play_date, hour, level, location)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_plays_song (
+    play_date date NOT NULL,
+    song_id varchar,
+    artist_id varchar,
+    plays bigint NOT NULL,
+    UNIQUE NULLS NOT DISTINCT (play_date, song_id, artist_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_plays_user (
+    play_date date NOT NULL,
+    user_id int NOT NULL,
+    plays bigint NOT NULL,
+    PRIMARY KEY (play_date, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name varchar PRIMARY KEY,
+    last_songplay_id bigint NOT NULL
+);
@@ -1,5 +1,24 @@
 DROP TABLE IF EXISTS songplays;
 DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS user_versions;
 DROP TABLE IF EXISTS songs;
 DROP TABLE IF EXISTS artists;
-DROP TABLE IF EXISTS time;
\ No newline at end of file
+DROP TABLE IF EXISTS time;
+DROP TABLE IF EXISTS sessions;
+-- Permanent staging tables left by earlier loaders (they are now temporary)
+DROP TABLE IF EXISTS stage_sessions;
+DROP TABLE IF EXISTS stage_users;
+DROP TABLE IF EXISTS stage_user_versions;
+DROP TABLE IF EXISTS stage_songs;
+DROP TABLE IF EXISTS stage_artists;
+DROP TABLE IF EXISTS stage_time;
+DROP TABLE IF EXISTS etl_manifest;
+DROP TABLE IF EXISTS etl_watermark;
+DROP TABLE IF EXISTS etl_generation;
+DROP TABLE IF EXISTS etl_sketches;
+DROP TABLE IF EXISTS etl_stream_offsets;
+DROP TABLE IF EXISTS etl_quarantine;
+DROP TABLE IF EXISTS rollup_plays_hourly;
+DROP TABLE IF EXISTS rollup_plays_song;
+DROP TABLE IF EXISTS rollup_plays_user;
+DROP TABLE IF EXISTS rollup_state;
@@ -0,0 +1,59 @@
+-- One-off migration of an existing heap songplays table to the monthly
+-- range-partitioned layout in create_tables.sql. Keeps songplay_id values and
+-- the id sequence; run once in a maintenance window (it rewrites the table).
+BEGIN;
+
+ALTER TABLE songplays RENAME TO songplays_heap;
+ALTER TABLE songplays_heap RENAME CONSTRAINT songplays_pkey TO songplays_heap_pkey;
+
+CREATE TABLE songplays (
+    songplay_id integer NOT NULL DEFAULT nextval('songplays_songplay_id_seq'),
+    start_time timestamp NOT NULL REFERENCES time(start_time),
+    user_id int NOT NULL REFERENCES users(user_id),
+    level varchar,
+    song_id varchar REFERENCES songs(song_id),
+    artist_id varchar REFERENCES artists(artist_id),
+    session_id int,
+    location varchar,
+    user_agent varchar,
+    user_valid_from timestamp,
+    PRIMARY KEY (songplay_id, start_time)
+) PARTITION BY RANGE (start_time);
+
+ALTER SEQUENCE songplays_songplay_id_seq OWNED BY songplays.songplay_id;
+
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN SELECT DISTINCT date_trunc('month', start_time)::date FROM songplays_heap LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF songplays FOR VALUES FROM (%L) TO (%L)',
+            'songplays_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+-- Heaps from before migrate_user_versions.sql have no user_valid_from; it stays NULL until that runs
+DO $$
+DECLARE
+    columns text := 'songplay_id, start_time, user_id, level, song_id, artist_id, session_id, location, user_agent';
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'songplays_heap' AND column_name = 'user_valid_from') THEN
+        columns := columns || ', user_valid_from';
+    END IF;
+    EXECUTE format('INSERT INTO songplays (%s) SELECT %s FROM songplays_heap', columns, columns);
+END $$;
+
+CREATE INDEX songplays_start_time_brin ON songplays USING brin (start_time);
+CREATE INDEX songplays_user_session_idx ON songplays (user_id, session_id);
+CREATE INDEX songplays_song_id_idx ON songplays (song_id);
+CREATE INDEX songplays_artist_id_idx ON songplays (artist_id);
+CREATE INDEX songplays_location_idx ON songplays (location);
+
+DROP TABLE songplays_heap;
+
+COMMIT;
+
+ANALYZE songplays;
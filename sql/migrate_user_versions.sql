@@ -0,0 +1,37 @@
+-- One-off migration adding the type-2 users history to an existing database.
+-- Each user starts with one open version from their current row, valid since
+-- their first play; earlier songplays are linked to it.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id int NOT NULL,
+    first_name varchar,
+    last_name varchar,
+    gender varchar,
+    level varchar,
+    valid_from timestamp NOT NULL,
+    valid_to timestamp,
+    last_seen timestamp,
+    PRIMARY KEY (user_id, valid_from)
+);
+
+-- Histories created before last_seen was recorded
+ALTER TABLE user_versions ADD COLUMN IF NOT EXISTS last_seen timestamp;
+
+ALTER TABLE songplays ADD COLUMN IF NOT EXISTS user_valid_from timestamp;
+
+INSERT INTO user_versions (user_id, first_name, last_name, gender, level, valid_from, last_seen)
+SELECT u.user_id, u.first_name, u.last_name, u.gender, u.level, MIN(sp.start_time), MAX(sp.start_time)
+FROM users u
+JOIN songplays sp ON sp.user_id = u.user_id
+GROUP BY u.user_id, u.first_name, u.last_name, u.gender, u.level
+ON CONFLICT (user_id, valid_from) DO NOTHING;
+
+UPDATE songplays sp SET user_valid_from = v.valid_from
+FROM user_versions v
+WHERE v.user_id = sp.user_id AND sp.user_valid_from IS NULL
+  AND sp.start_time >= v.valid_from AND (v.valid_to IS NULL OR sp.start_time < v.valid_to);
+
+COMMIT;
+
+ANALYZE user_versions;
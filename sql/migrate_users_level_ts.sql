@@ -0,0 +1,12 @@
+-- One-off migration adding users.level_ts (the time of the event a user's current
+-- row was taken from) to an existing database. Existing rows are stamped with the
+-- user's latest play, so only newer events can change their level afterwards.
+BEGIN;
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS level_ts timestamp;
+
+UPDATE users u SET level_ts = latest.start_time
+FROM (SELECT user_id, MAX(start_time) AS start_time FROM songplays GROUP BY user_id) latest
+WHERE latest.user_id = u.user_id AND u.level_ts IS NULL;
+
+COMMIT;
@@ -0,0 +1,183 @@
+"""
+Shared analytics query engine for the EDA report and the dashboard.
+
+Callers ask for a set of named play metrics; `build_plan` combines all of them
+into one statement that scans `songplays` (joined only to the dimensions the
+metrics need) once, using GROUPING SETS with one set per metric. Top-N metrics
+are ranked per grouping set with ROW_NUMBER, so only summary rows come back.
+
+With the 'rollup' source the same plans run over the pre-aggregated rollup
+tables (see rollups.py) instead of the fact table: one statement per rollup,
+summing their `plays` counts. The fact table is scanned instead while the
+rollups have never been refreshed.
+"""
+from collections import namedtuple
+from config import ANALYTICS_SOURCE
+from query_cache import fetch_dicts
+from rollups import rollups_ready
+
+Metric = namedtuple('Metric', ['columns', 'labels', 'ranked', 'nulls'], defaults=(False,))
+
+# Play-count metrics over songplays; `columns` are the grouping keys, and rows with a NULL
+# key are dropped unless `nulls` is set
+METRICS = {
+    'hourly_plays': Metric(('t.hour',), ('hour',), False),
+    'weekday_plays': Metric(('t.weekday',), ('weekday',), False),
+    'level_plays': Metric(('sp.level',), ('level',), False, nulls=True),
+    'top_locations': Metric(('sp.location',), ('location',), True),
+    'top_songs': Metric(('s.title', 'a.name'), ('title', 'artist'), True),
+    'top_artists': Metric(('a.name',), ('name',), True),
+    'top_users': Metric(('u.user_id', 'u.first_name', 'u.last_name'), ('user_id', 'first_name', 'last_name'), True),
+    'totals': Metric((), (), False),
+}
+
+DEFAULT_LIMITS = {'top_locations': 5, 'top_songs': 10, 'top_artists': 10, 'top_users': 5}
+
+JOINS = {
+    't': "JOIN time t ON sp.start_time = t.start_time",
+    's': "LEFT JOIN songs s ON sp.song_id = s.song_id",
+    'a': "LEFT JOIN artists a ON sp.artist_id = a.artist_id",
+    'u': "JOIN users u ON sp.user_id = u.user_id",
+}
+
+# Where play counts are read from: the FROM clause, the plays/duration aggregates,
+# how metric columns map onto the source and the joins each table alias needs
+Source = namedtuple('Source', ['relation', 'plays', 'duration', 'columns', 'joins'])
+
+FACT_SOURCE = Source('songplays sp', 'COUNT(*)', 'SUM(s.duration)', {}, JOINS)
+
+ROLLUP_SOURCES = {
+    'rollup_plays_hourly': Source(
+        'rollup_plays_hourly r', 'SUM(r.plays)::bigint', 'SUM(r.duration)',
+        {'t.hour': 'r.hour', 't.weekday': 'r.weekday', 'sp.level': 'r.level', 'sp.location': 'r.location'}, {}),
+    'rollup_plays_song': Source(
+        'rollup_plays_song r', 'SUM(r.plays)::bigint', None, {},
+        {'s': "LEFT JOIN songs s ON r.song_id = s.song_id", 'a': "LEFT JOIN artists a ON r.artist_id = a.artist_id"}),
+    'rollup_plays_user': Source(
+        'rollup_plays_user r', 'SUM(r.plays)::bigint', None, {},
+        {'u': "JOIN users u ON r.user_id = u.user_id"}),
+}
+
+# Rollup answering each metric
+ROLLUP_FOR_METRIC = {
+    'hourly_plays': 'rollup_plays_hourly',
+    'weekday_plays': 'rollup_plays_hourly',
+    'level_plays': 'rollup_plays_hourly',
+    'top_locations': 'rollup_plays_hourly',
+    'totals': 'rollup_plays_hourly',
+    'top_songs': 'rollup_plays_song',
+    'top_artists': 'rollup_plays_song',
+    'top_users': 'rollup_plays_user',
+}
+
+Plan = namedtuple('Plan', ['sql', 'params', 'groups', 'columns'])
+
+def _alias(column):
+    return column.replace('.', '_')
+
+def build_plan(metrics, limits=None, source=FACT_SOURCE):
+    """Build one GROUPING SETS query computing every requested metric in a single scan of source.
+
+    Returns a Plan whose `groups` maps each GROUPING() id to the metric names it answers.
+    """
+    limits = {**DEFAULT_LIMITS, **(limits or {})}
+    metrics = list(dict.fromkeys(metrics))
+    columns = list(dict.fromkeys(c for m in metrics for c in METRICS[m].columns))
+
+    def expr(column):
+        return source.columns.get(column, column)
+
+    tables = {expr(c).split('.')[0] for c in columns} & set(source.joins)
+    duration = source.duration
+    if 'totals' in metrics and duration == FACT_SOURCE.duration:
+        tables.add('s')  # listening time needs songs.duration
+    joins = '\n        '.join(source.joins[t] for t in ('t', 's', 'a', 'u') if t in tables)
+
+    groups, null_cases, limit_cases, params = {}, [], [], {}
+    for name in metrics:
+        metric = METRICS[name]
+        # GROUPING() sets a bit (leftmost column = highest bit) for every column not grouped
+        gid = sum(1 << (len(columns) - 1 - i) for i, c in enumerate(columns) if c not in metric.columns)
+        if gid in groups:
+            groups[gid].append(name)
+            continue
+        groups[gid] = [name]
+        if metric.columns and not metric.nulls:
+            null_cases.append(f"WHEN {gid} THEN " + ' OR '.join(f"{_alias(c)} IS NULL" for c in metric.columns))
+        if metric.ranked:
+            params[f"limit_{name}"] = limits[name]
+            limit_cases.append(f"WHEN {gid} THEN :limit_{name}")
+
+    select_cols = ''.join(f"{expr(c)} AS {_alias(c)}, " for c in columns)
+    grouping = f"GROUPING({', '.join(expr(c) for c in columns)})" if columns else "0"
+    sets = ', '.join('(' + ', '.join(expr(c) for c in METRICS[m].columns) + ')' for m in metrics)
+    order_keys = ''.join(f", {_alias(c)}" for c in columns)
+    null_key = f"CASE gid {' '.join(null_cases)} ELSE false END" if null_cases else "false"
+    limit = f"CASE gid {' '.join(limit_cases)} ELSE play_rank END" if limit_cases else "play_rank"
+
+    sql = f"""
+        WITH agg AS (
+            SELECT {select_cols}{grouping} AS gid,
+                   {source.plays} AS plays{f', COALESCE({duration}, 0) AS duration' if 'totals' in metrics and duration else ''}
+            FROM {source.relation}
+            {joins}
+            GROUP BY GROUPING SETS ({sets})
+        ), keyed AS (
+            SELECT agg.*, {null_key} AS null_key FROM agg
+        ), ranked AS (
+            SELECT keyed.*, ROW_NUMBER() OVER (PARTITION BY gid, null_key ORDER BY plays DESC{order_keys}) AS play_rank
+            FROM keyed
+        )
+        SELECT * FROM ranked
+        WHERE NOT null_key AND play_rank <= {limit}
+    """
+    return Plan(sql, params, groups, columns)
+
+def split_results(plan, rows):
+    """Turn result rows ({column: value} dicts) into {metric: [row dict, ...]} ordered by rank (top-N) or key."""
+    results = {name: [] for names in plan.groups.values() for name in names}
+    for row in rows:
+        for name in plan.groups.get(row['gid'], ()):
+            metric = METRICS[name]
+            record = {label: row[_alias(c)] for c, label in zip(metric.columns, metric.labels)}
+            record['plays'] = row['plays']
+            if name == 'totals' and 'duration' in row:
+                record['duration'] = row['duration']
+            results[name].append((row['play_rank'], record))
+    for name, records in results.items():
+        metric = METRICS[name]
+        if metric.ranked:
+            records.sort(key=lambda r: r[0])
+        else:
+            # NULL keys sort last, as in ORDER BY ... NULLS LAST
+            records.sort(key=lambda r: tuple((r[1][label] is None, r[1][label]) for label in metric.labels))
+        results[name] = [record for _, record in records]
+    return results
+
+def build_plans(metrics, limits=None, source=ANALYTICS_SOURCE):
+    """Plan metrics against 'fact' (one query) or 'rollup' (one query per rollup table used)."""
+    if source == 'fact':
+        return [build_plan(metrics, limits)]
+    by_rollup = {}
+    for name in dict.fromkeys(metrics):
+        by_rollup.setdefault(ROLLUP_FOR_METRIC[name], []).append(name)
+    return [build_plan(names, limits, ROLLUP_SOURCES[table]) for table, names in by_rollup.items()]
+
+def run_metrics(engine, metrics, limits=None, source=ANALYTICS_SOURCE, executor=None):
+    """Compute the requested play metrics; see METRICS for names and build_plans for sources.
+
+    With an executor, the plans (one per rollup table) run concurrently on it. The 'rollup'
+    source falls back to 'fact' until refresh_rollups has filled the rollups.
+    """
+    if source == 'rollup' and not rollups_ready(engine):
+        source = 'fact'
+    plans = build_plans(metrics, limits, source)
+    if executor is None:
+        row_sets = [fetch_dicts(engine, plan.sql, plan.params) for plan in plans]
+    else:
+        futures = [executor.submit(fetch_dicts, engine, plan.sql, plan.params) for plan in plans]
+        row_sets = [future.result() for future in futures]
+    results = {}
+    for plan, rows in zip(plans, row_sets):
+        results.update(split_results(plan, rows))
+    return results
@@ -0,0 +1,87 @@
+"""
+Columnar Parquet cache of the raw song and log extracts.
+
+Each source tree is split into partitions: one per source directory, and per
+day for files named like `2018-11-01-events.json`. A partition is written once
+as Parquet (already narrowed by the extract schema) under a name that embeds a
+fingerprint of its files' paths, sizes and mtimes, so adding, changing or
+removing a JSON file invalidates exactly that partition. Re-runs and the EDA
+tooling read the typed columns back, memory-mapped and with column pruning,
+instead of parsing JSON again.
+"""
+import hashlib
+import os
+import re
+import pandas as pd
+import pyarrow.parquet as pq
+from config import CACHE_DIR
+from extract import extract_json_data, list_json_files
+from schema import categorize_frame
+
+DATE_PREFIX = re.compile(r'^(\d{4}-\d{2}-\d{2})')
+
+def partition_key(path, root):
+    rel_dir = os.path.relpath(os.path.dirname(path), root)
+    key = 'root' if rel_dir == '.' else rel_dir.replace(os.sep, '_')
+    match = DATE_PREFIX.match(os.path.basename(path))
+    return f"{key}_date={match.group(1)}" if match else key
+
+def fingerprint(files, root):
+    digest = hashlib.blake2b(digest_size=8)
+    for f in sorted(files):
+        st = os.stat(f)
+        digest.update(f"{os.path.relpath(f, root)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def source_cache_dir(filepath, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, os.path.basename(os.path.normpath(filepath)))
+
+def refresh_cache(filepath, schema, cache_dir=CACHE_DIR):
+    """Rebuild stale partitions of filepath's cache; returns the partition files in key order."""
+    partitions = {}
+    for f in list_json_files(filepath):
+        partitions.setdefault(partition_key(f, filepath), []).append(f)
+
+    root = source_cache_dir(filepath, cache_dir)
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for key, files in sorted(partitions.items()):
+        path = os.path.join(root, f"{key}-{fingerprint(files, filepath)}.parquet")
+        if not os.path.exists(path):
+            df = extract_json_data(filepath, files=files, schema=schema)
+            tmp = path + '.tmp'
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        paths.append(path)
+
+    # Drop partitions whose source files changed or disappeared
+    live = {os.path.basename(p) for p in paths}
+    for name in os.listdir(root):
+        if name not in live:
+            os.remove(os.path.join(root, name))
+    return paths
+
+def _columns(parquet_file, columns):
+    if columns is None:
+        return None
+    names = set(parquet_file.schema_arrow.names)
+    return [c for c in columns if c in names]
+
+def read_cache(filepath, schema, columns=None, cache_dir=CACHE_DIR):
+    """Return the whole extract of filepath from the cache, optionally only `columns`."""
+    frames = []
+    for path in refresh_cache(filepath, schema, cache_dir):
+        pf = pq.ParquetFile(path, memory_map=True)
+        frames.append(pf.read(columns=_columns(pf, columns)).to_pandas())
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return categorize_frame(pd.concat(frames, ignore_index=True), schema)
+
+def iter_cached_chunks(filepath, chunksize, schema, columns=None, cache_dir=CACHE_DIR):
+    """Yield the cached extract of filepath in record batches of at most chunksize rows."""
+    for path in refresh_cache(filepath, schema, cache_dir):
+        pf = pq.ParquetFile(path, memory_map=True)
+        for batch in pf.iter_batches(batch_size=chunksize, columns=_columns(pf, columns)):
+            if batch.num_rows:
+                yield categorize_frame(batch.to_pandas(), schema)
@@ -5,4 +5,71 @@ load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 SONG_DATA_PATH = 'data/song_data'
-LOG_DATA_PATH = 'data/log_data'
\ No newline at end of file
+LOG_DATA_PATH = 'data/log_data'
+
+# Extraction: pool size ('process' or 'thread' workers) and files per worker task
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', os.cpu_count() or 1))
+EXTRACT_EXECUTOR = os.getenv('EXTRACT_EXECUTOR', 'process')
+EXTRACT_BATCH_SIZE = int(os.getenv('EXTRACT_BATCH_SIZE', 500))
+
+# Log events are streamed extract -> transform -> load in chunks of this many rows
+LOG_CHUNK_SIZE = int(os.getenv('LOG_CHUNK_SIZE', 100000))
+
+# Rows per in-memory CSV buffer sent through COPY FROM STDIN
+COPY_BATCH_ROWS = int(os.getenv('COPY_BATCH_ROWS', 50000))
+
+# 'upsert' merges dimension loads through staging tables (safe to re-run); 'append' inserts blindly
+LOAD_MODE = os.getenv('LOAD_MODE', 'upsert')
+
+# Incremental runs only extract files that are new or changed since the last recorded run
+ETL_INCREMENTAL = os.getenv('ETL_INCREMENTAL', 'false').lower() in ('1', 'true', 'yes')
+
+# Print per-frame memory before/after the extract-time dtype schema is applied
+DTYPE_REPORT = os.getenv('DTYPE_REPORT', 'false').lower() in ('1', 'true', 'yes')
+
+# Parquet cache of raw extracts, reused by full (non-incremental) re-runs
+EXTRACT_CACHE = os.getenv('EXTRACT_CACHE', 'false').lower() in ('1', 'true', 'yes')
+CACHE_DIR = os.getenv('CACHE_DIR', 'data/cache')
+
+# Concurrent stages share a connection pool of this size; log extraction runs ahead of
+# loading by at most LOG_PREFETCH_CHUNKS transformed chunks
+ETL_POOL_SIZE = int(os.getenv('ETL_POOL_SIZE', 5))
+LOG_PREFETCH_CHUNKS = int(os.getenv('LOG_PREFETCH_CHUNKS', 2))
+
+# EDA/dashboard play metrics are read from the 'rollup' tables or scanned from the 'fact' table
+ANALYTICS_SOURCE = os.getenv('ANALYTICS_SOURCE', 'rollup')
+
+# EDA/dashboard read the 'postgres' warehouse or an embedded 'duckdb' over the Parquet snapshot in
+# STAR_SCHEMA_DIR, which run_etl refreshes after each load when EXPORT_STAR_SCHEMA is set
+ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'postgres')
+STAR_SCHEMA_DIR = os.getenv('STAR_SCHEMA_DIR', 'data/star')
+EXPORT_STAR_SCHEMA = os.getenv('EXPORT_STAR_SCHEMA', 'false').lower() in ('1', 'true', 'yes')
+
+# Cache EDA/dashboard query results on disk until the next ETL load bumps the data generation
+QUERY_CACHE = os.getenv('QUERY_CACHE', 'true').lower() in ('1', 'true', 'yes')
+QUERY_CACHE_DIR = os.getenv('QUERY_CACHE_DIR', os.path.join(CACHE_DIR, 'queries'))
+QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Dashboard queries run concurrently on this many threads/connections (1 runs them one after another)
+DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', 4))
+
+# Check songs, artists, log events and songplays row by row before loading; failing rows go to
+# etl_quarantine with reason codes instead of failing the whole load
+VALIDATE = os.getenv('VALIDATE', 'true').lower() in ('1', 'true', 'yes')
+
+# Fold each loaded songplays batch into the DAU/heavy-hitter sketches (etl_sketches), and
+# have the dashboard read its top-N lists and daily active users from them
+SKETCHES = os.getenv('SKETCHES', 'true').lower() in ('1', 'true', 'yes')
+DASHBOARD_SKETCHES = os.getenv('DASHBOARD_SKETCHES', 'false').lower() in ('1', 'true', 'yes')
+
+# Per-stage/batch metrics are appended to ETL_METRICS_PATH as JSON lines when set; stages matching the
+# comma-separated ETL_PROFILE prefixes ('all' for every stage) run under cProfile/tracemalloc
+ETL_METRICS_PATH = os.getenv('ETL_METRICS_PATH', '')
+ETL_PROFILE = os.getenv('ETL_PROFILE', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'data/profiles')
+
+# Streaming mode (stream.py) tails LOG_DATA_PATH and commits a micro-batch every STREAM_INTERVAL
+# seconds or STREAM_BATCH_ROWS events; at most STREAM_MAX_PENDING batches wait for the database
+STREAM_INTERVAL = float(os.getenv('STREAM_INTERVAL', 2.0))
+STREAM_BATCH_ROWS = int(os.getenv('STREAM_BATCH_ROWS', 5000))
+STREAM_MAX_PENDING = int(os.getenv('STREAM_MAX_PENDING', 2))
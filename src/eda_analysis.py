@@ -7,18 +7,19 @@ and generates key insights about user behavior, song popularity, and trends.
 """
 
 import pandas as pd
-from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 import os
+from analytics import run_metrics
+from query_cache import fetch_all
+from embedded import analytics_engine
 
 # Load environment variables
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
 def connect_to_db():
-    """Create database connection."""
-    engine = create_engine(DATABASE_URL)
-    return engine
+    """Create database connection (the embedded snapshot when ANALYTICS_BACKEND=duckdb)."""
+    return analytics_engine()
 
 def load_table(engine, table_name):
     """Load a table from the database into a DataFrame."""
@@ -39,214 +40,239 @@ def basic_stats(engine):
     
     for table in tables:
         query = f"SELECT COUNT(*) as count FROM {table}"
-        with engine.connect() as conn:
-            count = conn.execute(text(query)).scalar()
+        count = fetch_all(engine, query)[0][0]
         print(f"  • {table.capitalize():12} : {count:,} records")
 
-def user_analysis(engine):
+def _ranked(pairs):
+    """Order (value, count) pairs by count descending, then value, dropping nulls."""
+    pairs = [(value, int(count)) for value, count in pairs if value is not None and not pd.isna(value)]
+    return sorted(pairs, key=lambda p: (-p[1], p[0]))
+
+def _none_if_na(value):
+    return None if pd.isna(value) else value
+
+def user_summary(engine, users_df=None):
+    """Return (total, gender_counts, level_counts) for users.
+
+    Computed server-side with one GROUPING SETS scan; pass users_df to compute the
+    same summary from a DataFrame instead (offline use).
+    """
+    if users_df is not None:
+        return (len(users_df),
+                _ranked(users_df['gender'].value_counts().items()),
+                _ranked(users_df['level'].value_counts().items()))
+    query = """
+        SELECT gender, level, GROUPING(gender) AS by_level, GROUPING(level) AS by_gender, COUNT(*) AS count
+        FROM users
+        GROUP BY GROUPING SETS ((gender), (level), ())
+    """
+    rows = fetch_all(engine, query)
+    total = next((count for _, _, by_level, by_gender, count in rows if by_level and by_gender), 0)
+    gender_counts = _ranked((gender, count) for gender, _, by_level, by_gender, count in rows if by_gender and not by_level)
+    level_counts = _ranked((level, count) for _, level, by_level, by_gender, count in rows if by_level and not by_gender)
+    return total, gender_counts, level_counts
+
+def user_analysis(engine, users_df=None):
     """Analyze user demographics and behavior."""
     print_section("👥 USER ANALYSIS")
     
-    users_df = load_table(engine, 'users')
+    total, gender_counts, level_counts = user_summary(engine, users_df)
     
     # Gender distribution
     print("\n  Gender Distribution:")
-    gender_counts = users_df['gender'].value_counts()
-    for gender, count in gender_counts.items():
+    for gender, count in gender_counts:
         label = "Female" if gender == "F" else "Male"
-        pct = (count / len(users_df)) * 100
+        pct = (count / total) * 100
         print(f"    • {label}: {count} ({pct:.1f}%)")
     
     # Subscription level distribution
     print("\n  Subscription Levels:")
-    level_counts = users_df['level'].value_counts()
-    for level, count in level_counts.items():
-        pct = (count / len(users_df)) * 100
+    for level, count in level_counts:
+        pct = (count / total) * 100
         print(f"    • {level.capitalize()}: {count} ({pct:.1f}%)")
 
-def song_analysis(engine):
+def song_summary(engine, songs_df=None, sample=5):
+    """Return (total, min_year, max_year, avg_duration, sample_songs) for songs.
+
+    Years are taken over year > 0 only (None when there are none); sample_songs is a
+    list of (title, year). Pass songs_df to compute from a DataFrame instead.
+    """
+    if songs_df is not None:
+        valid_years = songs_df[songs_df['year'] > 0]['year']
+        min_year = int(valid_years.min()) if len(valid_years) else None
+        max_year = int(valid_years.max()) if len(valid_years) else None
+        samples = [(title, _none_if_na(year)) for title, year in songs_df[['title', 'year']].head(sample).itertuples(index=False)]
+        return len(songs_df), min_year, max_year, songs_df['duration'].mean(), samples
+    query = """
+        SELECT COUNT(*) AS total,
+               MIN(year) FILTER (WHERE year > 0) AS min_year,
+               MAX(year) FILTER (WHERE year > 0) AS max_year,
+               AVG(duration) AS avg_duration
+        FROM songs
+    """
+    total, min_year, max_year, avg_duration = fetch_all(engine, query)[0]
+    samples = fetch_all(engine, "SELECT title, year FROM songs LIMIT :n", {'n': sample})
+    avg_duration = float('nan') if avg_duration is None else float(avg_duration)
+    return total, min_year, max_year, avg_duration, samples
+
+def song_analysis(engine, songs_df=None):
     """Analyze song catalog."""
     print_section("🎵 SONG CATALOG ANALYSIS")
     
-    songs_df = load_table(engine, 'songs')
+    total, min_year, max_year, avg_duration, samples = song_summary(engine, songs_df)
     
-    print(f"\n  Total Songs: {len(songs_df)}")
+    print(f"\n  Total Songs: {total}")
     
     # Year distribution
-    if songs_df['year'].notna().any() and (songs_df['year'] > 0).any():
-        valid_years = songs_df[songs_df['year'] > 0]['year']
-        print(f"  Oldest Song Year: {int(valid_years.min())}")
-        print(f"  Newest Song Year: {int(valid_years.max())}")
+    if min_year is not None:
+        print(f"  Oldest Song Year: {int(min_year)}")
+        print(f"  Newest Song Year: {int(max_year)}")
     
     # Duration stats
-    avg_duration = songs_df['duration'].mean()
     print(f"  Average Duration: {avg_duration/60:.1f} minutes")
     
     # Sample songs
     print("\n  Sample Songs:")
-    for _, song in songs_df.head(5).iterrows():
-        print(f"    • {song['title']} ({song['year'] if song['year'] > 0 else 'N/A'})")
+    for title, year in samples:
+        print(f"    • {title} ({year if year is not None and year > 0 else 'N/A'})")
+
+def artist_summary(engine, artists_df=None, sample=5):
+    """Return (total, with_location, with_coords, sample_artists) for artists.
 
-def artist_analysis(engine):
+    sample_artists is a list of (name, location). Pass artists_df to compute from a
+    DataFrame instead.
+    """
+    if artists_df is not None:
+        with_location = int((artists_df['location'].notna() & (artists_df['location'] != '')).sum())
+        with_coords = int(artists_df['latitude'].notna().sum())
+        samples = [(name, _none_if_na(loc)) for name, loc in artists_df[['name', 'location']].head(sample).itertuples(index=False)]
+        return len(artists_df), with_location, with_coords, samples
+    query = """
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE location IS NOT NULL AND location <> '') AS with_location,
+               COUNT(latitude) AS with_coords
+        FROM artists
+    """
+    total, with_location, with_coords = fetch_all(engine, query)[0]
+    samples = fetch_all(engine, "SELECT name, location FROM artists LIMIT :n", {'n': sample})
+    return total, with_location, with_coords, samples
+
+def artist_analysis(engine, artists_df=None):
     """Analyze artists."""
     print_section("🎤 ARTIST ANALYSIS")
     
-    artists_df = load_table(engine, 'artists')
+    total, with_location, with_coords, samples = artist_summary(engine, artists_df)
     
-    print(f"\n  Total Artists: {len(artists_df)}")
+    print(f"\n  Total Artists: {total}")
     
     # Artists with location data
-    with_location = artists_df[artists_df['location'].notna() & (artists_df['location'] != '')].shape[0]
     print(f"  Artists with Location: {with_location}")
     
     # Artists with geo coordinates
-    with_coords = artists_df[artists_df['latitude'].notna()].shape[0]
     print(f"  Artists with Coordinates: {with_coords}")
     
     # Sample artists
     print("\n  Artists:")
-    for _, artist in artists_df.head(5).iterrows():
-        loc = artist['location'] if artist['location'] else "Unknown location"
-        print(f"    • {artist['name']} - {loc}")
+    for name, location in samples:
+        loc = location if location else "Unknown location"
+        print(f"    • {name} - {loc}")
+
+def _metrics(engine, metrics, names):
+    """Use precomputed play metrics when given, otherwise compute just `names` in one query."""
+    return metrics if metrics is not None else run_metrics(engine, names)
 
-def listening_patterns(engine):
+def listening_patterns(engine, metrics=None):
     """Analyze listening patterns and trends."""
     print_section("📈 LISTENING PATTERNS")
     
-    # Top played songs
-    query = """
-        SELECT s.title, a.name as artist, COUNT(sp.songplay_id) as play_count
-        FROM songplays sp
-        JOIN songs s ON sp.song_id = s.song_id
-        JOIN artists a ON sp.artist_id = a.artist_id
-        GROUP BY s.title, a.name
-        ORDER BY play_count DESC
-        LIMIT 10
-    """
-    with engine.connect() as conn:
-        top_songs = pd.read_sql(text(query), conn)
+    metrics = _metrics(engine, metrics, ['top_songs', 'hourly_plays', 'weekday_plays'])
     
+    # Top played songs
     print("\n  🏆 Top Played Songs:")
-    for i, (_, row) in enumerate(top_songs.iterrows(), 1):
-        print(f"    {i}. {row['title']} by {row['artist']} ({row['play_count']} plays)")
+    for i, row in enumerate(metrics['top_songs'], 1):
+        print(f"    {i}. {row['title']} by {row['artist']} ({row['plays']} plays)")
     
     # Plays by hour
-    query = """
-        SELECT t.hour, COUNT(sp.songplay_id) as plays
-        FROM songplays sp
-        JOIN time t ON sp.start_time = t.start_time
-        GROUP BY t.hour
-        ORDER BY t.hour
-    """
-    with engine.connect() as conn:
-        hourly = pd.read_sql(text(query), conn)
-    
-    if not hourly.empty:
-        peak_hour = hourly.loc[hourly['plays'].idxmax()]
+    hourly = metrics['hourly_plays']
+    if hourly:
+        peak_hour = max(hourly, key=lambda row: row['plays'])
         print(f"\n  ⏰ Peak Listening Hour: {int(peak_hour['hour'])}:00 ({peak_hour['plays']} plays)")
     
     # Plays by day of week
-    query = """
-        SELECT t.weekday, COUNT(sp.songplay_id) as plays
-        FROM songplays sp
-        JOIN time t ON sp.start_time = t.start_time
-        GROUP BY t.weekday
-        ORDER BY t.weekday
-    """
-    with engine.connect() as conn:
-        daily = pd.read_sql(text(query), conn)
-    
+    daily = metrics['weekday_plays']
     days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    if not daily.empty:
+    if daily:
         print("\n  📅 Plays by Day of Week:")
-        for _, row in daily.iterrows():
+        for row in daily:
             day_name = days[int(row['weekday'])]
             bar = "█" * int(row['plays'])
             print(f"    {day_name:10} {bar} {row['plays']}")
 
-def user_engagement(engine):
+def user_engagement(engine, metrics=None):
     """Analyze user engagement metrics."""
     print_section("💫 USER ENGAGEMENT")
     
-    # Most active users
-    query = """
-        SELECT u.first_name, u.last_name, COUNT(sp.songplay_id) as total_plays
-        FROM songplays sp
-        JOIN users u ON sp.user_id = u.user_id
-        GROUP BY u.user_id, u.first_name, u.last_name
-        ORDER BY total_plays DESC
-        LIMIT 5
-    """
-    with engine.connect() as conn:
-        active_users = pd.read_sql(text(query), conn)
+    metrics = _metrics(engine, metrics, ['top_users', 'level_plays'])
     
+    # Most active users
     print("\n  🌟 Most Active Users:")
-    for i, (_, user) in enumerate(active_users.iterrows(), 1):
-        print(f"    {i}. {user['first_name']} {user['last_name']} - {user['total_plays']} plays")
+    for i, user in enumerate(metrics['top_users'], 1):
+        print(f"    {i}. {user['first_name']} {user['last_name']} - {user['plays']} plays")
     
     # Free vs Paid listening
+    print("\n  💳 Plays by Subscription Level:")
+    for row in metrics['level_plays']:
+        print(f"    • {(row['level'] or 'unknown').capitalize()}: {row['plays']} plays")
+
+def session_summary(engine):
+    """Return [(level, sessions, avg_tracks, avg_minutes), ...] plus an all-levels row (level None)."""
     query = """
-        SELECT level, COUNT(*) as plays
-        FROM songplays
-        GROUP BY level
+        SELECT level, COUNT(*), AVG(tracks), AVG(duration) / 60
+        FROM sessions
+        GROUP BY GROUPING SETS ((level), ())
+        ORDER BY level NULLS LAST
     """
-    with engine.connect() as conn:
-        level_plays = pd.read_sql(text(query), conn)
+    return [(level, count, float(tracks or 0), float(minutes or 0))
+            for level, count, tracks, minutes in fetch_all(engine, query)]
+
+def session_analysis(engine):
+    """Analyze listening sessions."""
+    print_section("🎧 LISTENING SESSIONS")
     
-    print("\n  💳 Plays by Subscription Level:")
-    for _, row in level_plays.iterrows():
-        print(f"    • {row['level'].capitalize()}: {row['plays']} plays")
+    for level, count, avg_tracks, avg_minutes in session_summary(engine):
+        label = level.capitalize() if level is not None else "All"
+        print(f"    • {label}: {count:,} sessions, {avg_tracks:.1f} tracks, {avg_minutes:.1f} minutes on average")
 
-def location_insights(engine):
+def location_insights(engine, metrics=None):
     """Analyze geographic distribution."""
     print_section("🌍 GEOGRAPHIC INSIGHTS")
     
-    query = """
-        SELECT location, COUNT(*) as plays
-        FROM songplays
-        WHERE location IS NOT NULL
-        GROUP BY location
-        ORDER BY plays DESC
-        LIMIT 5
-    """
-    with engine.connect() as conn:
-        locations = pd.read_sql(text(query), conn)
+    metrics = _metrics(engine, metrics, ['top_locations'])
     
     print("\n  📍 Top Listening Locations:")
-    for i, (_, loc) in enumerate(locations.iterrows(), 1):
+    for i, loc in enumerate(metrics['top_locations'], 1):
         print(f"    {i}. {loc['location']} ({loc['plays']} plays)")
 
-def key_insights(engine):
+def key_insights(engine, metrics=None):
     """Generate key business insights."""
     print_section("💡 KEY INSIGHTS & RECOMMENDATIONS")
     
     insights = []
     
     # Check subscription distribution
-    query = "SELECT level, COUNT(*) as count FROM users GROUP BY level"
-    with engine.connect() as conn:
-        levels = pd.read_sql(text(query), conn)
-    
-    free_users = levels[levels['level'] == 'free']['count'].sum() if 'free' in levels['level'].values else 0
-    paid_users = levels[levels['level'] == 'paid']['count'].sum() if 'paid' in levels['level'].values else 0
+    _, _, level_counts = user_summary(engine)
+    levels = dict(level_counts)
+    free_users = levels.get('free', 0)
+    paid_users = levels.get('paid', 0)
     
     if free_users > paid_users:
         insights.append(f"📌 {free_users} free users vs {paid_users} paid - opportunity to convert free users to premium")
     
     # Check for peak hours
-    query = """
-        SELECT t.hour, COUNT(*) as plays
-        FROM songplays sp
-        JOIN time t ON sp.start_time = t.start_time
-        GROUP BY t.hour
-        ORDER BY plays DESC
-        LIMIT 1
-    """
-    with engine.connect() as conn:
-        peak = pd.read_sql(text(query), conn)
-    
-    if not peak.empty:
-        insights.append(f"📌 Peak activity at {int(peak.iloc[0]['hour'])}:00 - optimal time for promotions")
+    hourly = _metrics(engine, metrics, ['hourly_plays'])['hourly_plays']
+    if hourly:
+        peak = max(hourly, key=lambda row: row['plays'])
+        insights.append(f"📌 Peak activity at {int(peak['hour'])}:00 - optimal time for promotions")
     
     # Print insights
     print()
@@ -256,6 +282,9 @@ def key_insights(engine):
     print("\n  📌 Data quality is good - all dimension tables are populated")
     print("  📌 Star schema enables efficient analytical queries")
 
+# Every songplays metric the report needs, computed together in one pass
+EDA_METRICS = ['top_songs', 'hourly_plays', 'weekday_plays', 'top_users', 'level_plays', 'top_locations']
+
 def run_eda():
     """Run complete EDA analysis."""
     print("\n" + "🎵" * 20)
@@ -268,10 +297,12 @@ def run_eda():
     user_analysis(engine)
     song_analysis(engine)
     artist_analysis(engine)
-    listening_patterns(engine)
-    user_engagement(engine)
-    location_insights(engine)
-    key_insights(engine)
+    metrics = run_metrics(engine, EDA_METRICS)
+    listening_patterns(engine, metrics)
+    user_engagement(engine, metrics)
+    session_analysis(engine)
+    location_insights(engine, metrics)
+    key_insights(engine, metrics)
     
     print("\n" + "=" * 60)
     print("  ✅ EDA COMPLETE")
@@ -0,0 +1,112 @@
+"""
+Embedded DuckDB backend for the EDA report and the dashboard.
+
+`export_star_schema` snapshots the warehouse tables into one Parquet file per
+table under STAR_SCHEMA_DIR (run_etl does this after each load when
+EXPORT_STAR_SCHEMA is set). `embedded_engine` opens an in-process DuckDB whose
+connections expose those files as views with the warehouse's table names, so
+the analytics, EDA and dashboard queries run unchanged on DuckDB's vectorized,
+multi-threaded engine without a database server. Set ANALYTICS_BACKEND=duckdb
+to make `analytics_engine` return it.
+
+DuckDB (duckdb, duckdb-engine) is only imported when the embedded engine is used.
+"""
+import os
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, event, inspect, text
+from config import DATABASE_URL, ANALYTICS_BACKEND, STAR_SCHEMA_DIR
+
+# Tables the reports read; those missing from the source database are skipped
+STAR_TABLES = ['users', 'songs', 'artists', 'time', 'songplays', 'sessions',
+               'rollup_plays_hourly', 'rollup_plays_song', 'rollup_plays_user', 'rollup_state',
+               'etl_generation', 'etl_sketches']
+
+EXPORT_CHUNK_ROWS = 250_000
+
+# Generated columns of the warehouse, computed by the views when a snapshot lacks them
+GENERATED_COLUMNS = {'sessions': {'duration': 'epoch(CAST(end_time AS TIMESTAMP)) - epoch(CAST(start_time AS TIMESTAMP))'}}
+
+def _arrow_safe(df):
+    """Convert driver-specific objects (bytea memoryviews, UUIDs) into types Arrow understands."""
+    for col in df.columns:
+        if df[col].dtype == object:
+            sample = df[col].dropna()
+            if len(sample) and isinstance(sample.iloc[0], memoryview):
+                df[col] = df[col].map(lambda v: None if v is None else bytes(v))
+            elif len(sample) and isinstance(sample.iloc[0], uuid.UUID):
+                df[col] = df[col].map(lambda v: None if v is None else str(v))
+    return df
+
+def export_table(engine, table, path, chunksize=EXPORT_CHUNK_ROWS):
+    """Stream one table into a Parquet file (row group per chunk), replacing it atomically."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    writer, rows = None, 0
+    try:
+        with engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True)
+            for chunk in pd.read_sql(text(f"SELECT * FROM {table}"), conn, chunksize=chunksize):
+                batch = pa.Table.from_pandas(_arrow_safe(chunk), schema=writer.schema if writer else None,
+                                             preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, batch.schema)
+                writer.write_table(batch)
+                rows += len(chunk)
+        if writer is None:
+            # Empty table: keep its columns so queries still bind
+            with engine.connect() as conn:
+                columns = conn.execute(text(f"SELECT * FROM {table} WHERE false")).keys()
+            pq.write_table(pa.table({c: pa.array([], pa.null()) for c in columns}), tmp)
+        else:
+            writer.close()
+            writer = None
+        os.replace(tmp, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return rows
+
+def export_star_schema(engine, directory=STAR_SCHEMA_DIR, tables=STAR_TABLES):
+    """Snapshot each existing table to <directory>/<table>.parquet; returns {table: rows}."""
+    os.makedirs(directory, exist_ok=True)
+    existing = set(inspect(engine).get_table_names())
+    return {table: export_table(engine, table, os.path.join(directory, f"{table}.parquet"))
+            for table in tables if table in existing}
+
+def embedded_engine(directory=STAR_SCHEMA_DIR):
+    """In-process DuckDB engine with one view per exported Parquet table."""
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"No star-schema snapshot in {directory}; run export_star_schema first")
+    views = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.parquet'):
+            table, path = name[:-len('.parquet')], os.path.abspath(os.path.join(directory, name))
+            columns = set(pq.read_schema(path).names)
+            select = ['*'] + [f"{expr} AS {column}" for column, expr in GENERATED_COLUMNS.get(table, {}).items()
+                              if column not in columns]
+            quoted = path.replace("'", "''")
+            views[table] = f"SELECT {', '.join(select)} FROM read_parquet('{quoted}')"
+    engine = create_engine('duckdb:///:memory:')
+
+    @event.listens_for(engine, 'connect')
+    def create_views(dbapi_connection, connection_record):
+        for table, query in views.items():
+            dbapi_connection.execute(f"CREATE VIEW {table} AS {query}")
+
+    return engine
+
+def analytics_engine(**kwargs):
+    """Engine the EDA report and dashboard read from: the warehouse or the embedded snapshot."""
+    if ANALYTICS_BACKEND == 'duckdb':
+        return embedded_engine()
+    return create_engine(DATABASE_URL, **kwargs)
+
+if __name__ == "__main__":
+    counts = export_star_schema(create_engine(DATABASE_URL))
+    for table, rows in counts.items():
+        print(f"Exported {table}: {rows:,} rows")
+    print(f"Star schema snapshot written to {STAR_SCHEMA_DIR}")
@@ -1,34 +1,254 @@
+import itertools
+import os
+import queue
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
-from config import DATABASE_URL, SONG_DATA_PATH, LOG_DATA_PATH
-from extract import extract_json_data
+from config import (DATABASE_URL, SONG_DATA_PATH, LOG_DATA_PATH, LOG_CHUNK_SIZE, ETL_INCREMENTAL, SKETCHES,
+                    EXTRACT_CACHE, ETL_POOL_SIZE, LOG_PREFETCH_CHUNKS, EXPORT_STAR_SCHEMA, VALIDATE)
+from extract import extract_json_data, iter_json_chunks, list_json_files
 from transform import transform_song_data, transform_log_data
-from load import load_to_db
+from load import load_to_db, load_batch
+from lookup import SongLookup
+from cache import read_cache, iter_cached_chunks
+from schema import SONG_SCHEMA, LOG_SCHEMA
+from rollups import refresh_rollups
+from query_cache import bump_generation
+from sketches import batch_sketches, ensure_sketch_tables, merge_sketches
+from sessions import build_sessions, ensure_sessions_table
+from embedded import export_star_schema
+from user_versions import (ensure_user_versions_table, user_events, read_user_versions, merge_user_versions,
+                           resolve_user_versions)
+from validate import (dimension_keys, ensure_quarantine_table, quarantine, unloaded_keys, validate,
+                      validate_events)
+from instrument import annotate, drain, instrumented, measure, report_metrics
+from scheduler import Stage, StageCancelled, run_stages, report_timings
+from manifest import ensure_manifest_tables, iter_file_chunks, load_manifest, pending_files, record_files
 
-def run_etl():
-    engine = create_engine(DATABASE_URL)
+@instrumented('join.songplays')
+def build_songplays(log_df, lookup, user_versions=None):
+    """Build the fact rows; with user_versions, each play also gets its user version's valid_from."""
+    song_ids, artist_ids = lookup.resolve(log_df['song'], log_df['artist'], log_df.get('length'))
+    songplays_df = pd.DataFrame({
+        'start_time': log_df['ts'].to_numpy(),
+        'user_id': log_df['userId'].to_numpy(),
+        'level': log_df['level'].to_numpy(),
+        'song_id': song_ids,
+        'artist_id': artist_ids,
+        'session_id': log_df['sessionId'].to_numpy(),
+        'location': log_df['location'].to_numpy(),
+        'user_agent': log_df['userAgent'].to_numpy(),
+    })
+    if user_versions is not None:
+        songplays_df['user_valid_from'] = resolve_user_versions(log_df['userId'], log_df['ts'], user_versions)
+    return songplays_df
+
+def user_version_batch(log_df, engine):
+    """Merge a batch's user versions with the stored history: (all versions, versions to write)."""
+    # Every event is merged, not just the batch's versions, so each play is an observation of its own version
+    events = user_events(log_df)
+    return merge_user_versions(read_user_versions(engine, events['user_id']), events)
+
+def log_chunks(chunksize, entries=None, state=None, cached=False):
+    """Yield (raw log chunk, progress) pairs; entries are the pending manifest entries of an incremental run.
+
+    A full run (entries None) reads every log file, or with `cached` the Parquet extract
+    cache, and has no progress to record. An incremental run reads new files in full and
+    changed ones from their offset (what was appended since they were recorded); progress
+    lists the manifest entries to record with the chunk's songplays (see iter_file_chunks).
+    """
+    state = {} if state is None else state
+    if entries is not None:
+        state['bytes_read'] = sum(e[1] - (e[4] if len(e) > 4 else 0) for e in entries)
+        source = iter_file_chunks(entries, chunksize, LOG_SCHEMA)
+    elif cached:
+        source = ((chunk, []) for chunk in iter_cached_chunks(LOG_DATA_PATH, chunksize, LOG_SCHEMA))
+    else:
+        files = list_json_files(LOG_DATA_PATH)
+        state['bytes_read'] = sum(os.path.getsize(f) for f in files)
+        source = ((chunk, []) for chunk in iter_json_chunks(LOG_DATA_PATH, chunksize, files=files, schema=LOG_SCHEMA))
+    for chunk, progress in source:
+        state['rows'] = state.get('rows', 0) + len(chunk)
+        yield chunk, progress
+
+def _measured(name, func):
+    """Wrap a stage function so each run is recorded as stage.<name>."""
+    def run(results):
+        with measure(f"stage.{name}"):
+            return func(results)
+    return run
+
+def _put(q, item, cancel):
+    """Blocking put that gives up once the pipeline is cancelled."""
+    while True:
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            if cancel.is_set():
+                raise StageCancelled()
+
+def run_etl(chunksize=LOG_CHUNK_SIZE, incremental=ETL_INCREMENTAL, cached=EXTRACT_CACHE, report=True):
+    engine = create_engine(DATABASE_URL, pool_size=ETL_POOL_SIZE)
+    cached = cached and not incremental
+    drain()  # metrics of earlier runs in this process
+    ensure_sessions_table(engine)
+    ensure_user_versions_table(engine)
+    if SKETCHES:
+        ensure_sketch_tables(engine)
+    if VALIDATE:
+        ensure_quarantine_table(engine)
+    
+    song_files = new_logs = None
+    changed_logs = []
+    if incremental:
+        # Only files that are new or changed since the last recorded run are extracted
+        ensure_manifest_tables(engine)
+        manifest = load_manifest(engine)
+        new_songs, changed_songs, touched_songs = pending_files(list_json_files(SONG_DATA_PATH), manifest)
+        song_files = new_songs + changed_songs
+        new_logs, changed_logs, touched_logs = pending_files(list_json_files(LOG_DATA_PATH), manifest)
+        # Files with a new mtime but the recorded content are not hashed again by later runs
+        record_files(engine, touched_songs + touched_logs)
+    
+    # Transformed log chunks flow from extract_logs to load_logs through a bounded queue,
+    # so log extraction overlaps the song stages without holding more than a few chunks
+    log_queue = queue.Queue(maxsize=LOG_PREFETCH_CHUNKS)
+    cancel = threading.Event()
+    state = {}
     
     # 1. Song Data
-    song_raw = extract_json_data(SONG_DATA_PATH)
-    songs_df, artists_df = transform_song_data(song_raw)
-    load_to_db(artists_df, 'artists', engine)
-    load_to_db(songs_df, 'songs', engine)
-    
-    # 2. Log Data
-    log_raw = extract_json_data(LOG_DATA_PATH)
-    time_df, user_df, log_df = transform_log_data(log_raw)
-    load_to_db(time_df, 'time', engine)
-    load_to_db(user_df, 'users', engine)
-    
-    # 3. Fact Table Lookup & Load
-    log_df = log_df.rename(columns={'song': 'title'})  # Align column names for merge
-    songplay_data = log_df.merge(songs_df, on='title', how='left').merge(artists_df, on='artist_id', how='left', suffixes=('', '_artist'))
-    songplays_df = songplay_data[[
-        'ts', 'userId', 'level', 'song_id', 'artist_id', 'sessionId', 'location', 'userAgent'
-    ]]
-    songplays_df.columns = [
-        'start_time', 'user_id', 'level', 'song_id', 'artist_id', 'session_id', 'location', 'user_agent'
+    def extract_songs(results):
+        if cached:
+            song_raw = read_cache(SONG_DATA_PATH, SONG_SCHEMA)
+        else:
+            song_raw = extract_json_data(SONG_DATA_PATH, files=None if song_files is None else [e[0] for e in song_files],
+                                         schema=SONG_SCHEMA)
+        if song_raw.empty:
+            return None
+        songs_df, artists_df = transform_song_data(song_raw)
+        if VALIDATE:
+            songs_df, bad_songs = validate(songs_df, 'songs')
+            artists_df, bad_artists = validate(artists_df, 'artists')
+            quarantine(engine, bad_songs, bad_artists)
+        return songs_df, artists_df
+    
+    def load_artists(results):
+        song_dims = results['extract_songs']
+        return song_dims is None or load_to_db(song_dims[1], 'artists', engine)
+    
+    def load_songs(results):
+        song_dims = results['extract_songs']
+        return song_dims is None or load_to_db(song_dims[0], 'songs', engine)
+    
+    def build_lookup(results):
+        song_dims = results['extract_songs']
+        if incremental or song_dims is None:
+            # Incremental runs only extracted new song files; match against the full loaded catalog
+            return SongLookup.from_db(engine)
+        return SongLookup.from_frames(*song_dims)
+    
+    # 2. Log Data, streamed chunk by chunk so peak memory is bounded by chunksize
+    def extract_logs(results):
+        chunks = log_chunks(chunksize, None if new_logs is None else new_logs + changed_logs, state, cached)
+        try:
+            for chunk, progress in chunks:
+                if VALIDATE:
+                    chunk, rejected = validate_events(chunk)
+                    quarantine(engine, rejected)
+                # Chunks are transformed independently; time and users rows are merged on load
+                _put(log_queue, (*transform_log_data(chunk), progress), cancel)
+        except StageCancelled:
+            raise
+        except Exception as e:
+            _put(log_queue, e, cancel)
+            raise
+        annotate(rows_out=state.get('rows', 0), bytes_read=state.get('bytes_read', 0))
+        _put(log_queue, None, cancel)
+    
+    # 3. Fact Table Lookup & Load; time and users load side by side before each songplays batch
+    def load_logs(results):
+        lookup = results['build_lookup']
+        # Runs after the song loads, so these are the songs and artists that committed
+        known = dimension_keys(engine) if VALIDATE else {}
+        ok = True
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for batch in itertools.count():
+                item = log_queue.get()
+                if item is None:
+                    return ok
+                if isinstance(item, Exception):
+                    raise StageCancelled() from item
+                time_df, user_df, log_df, progress = item
+                with measure('batch.logs', batch=batch, rows_in=len(log_df)) as record:
+                    versions, changed = user_version_batch(log_df, engine)
+                    # Chunks repeat users and timestamps, so these are merged whatever the LOAD_MODE
+                    loads = [pool.submit(load_to_db, time_df, 'time', engine, upsert=True),
+                             pool.submit(load_to_db, user_df, 'users', engine, upsert=True),
+                             pool.submit(load_to_db, changed, 'user_versions', engine)]
+                    time_ok, users_ok, versions_ok = [f.result() for f in loads]
+                    ok &= time_ok and users_ok and versions_ok
+                    songplays_df = build_songplays(log_df, lookup, versions)
+                    if VALIDATE:
+                        # Plays whose time/users rows did not load are quarantined rather than
+                        # failing the songplays load on its foreign keys
+                        unloaded = [name for name, loaded in (('time', time_ok), ('users', users_ok)) if not loaded]
+                        songplays_df, rejected = validate(songplays_df, 'songplays', {**known, **unloaded_keys(unloaded)})
+                        quarantine(engine, rejected)
+                    # Facts, sessions, sketches and the files' progress commit together so they never
+                    # drift apart: a rerun after a failure does not append these songplays again
+                    sketches = batch_sketches(songplays_df) if SKETCHES else {}
+
+                    def finish(conn):
+                        if sketches:
+                            merge_sketches(conn, sketches)
+                        record_files(engine, progress, conn)
+
+                    loaded = load_batch([('songplays', songplays_df), ('sessions', build_sessions(songplays_df))],
+                                        engine, after=finish, report_errors=True)
+                    ok &= loaded
+                    record['rows_out'] = len(songplays_df) if loaded else 0
+    
+    lookup_deps = ('extract_songs', 'load_songs', 'load_artists') if incremental else ('extract_songs',)
+    stages = [
+        Stage('extract_songs', extract_songs),
+        Stage('extract_logs', extract_logs),
+        Stage('load_artists', load_artists, ('extract_songs',)),
+        Stage('load_songs', load_songs, ('extract_songs',)),
+        Stage('build_lookup', build_lookup, lookup_deps),
+        Stage('load_logs', load_logs, ('build_lookup', 'load_songs', 'load_artists'), ('extract_logs',)),
     ]
-    load_to_db(songplays_df, 'songplays', engine)
+    stages = [stage._replace(func=_measured(stage.name, stage.func)) for stage in stages]
+    try:
+        results, timings = run_stages(stages, cancel)
+        if report:
+            report_timings(stages, timings)
+        ok = results['load_artists'] and results['load_songs'] and results['load_logs']
+        
+        # 4. Fold the newly loaded songplays into the analytics rollups
+        if ok:
+            with measure('rollups.refresh'):
+                refresh_rollups(engine)
+    finally:
+        # Any load (even a partly failed or aborted one) may have changed the tables, so
+        # cached EDA/dashboard results from earlier generations must not be served again
+        bump_generation(engine)
+    
+    # Refresh the Parquet snapshot the embedded analytics backend reads
+    if EXPORT_STAR_SCHEMA and ok:
+        with measure('export.star_schema'):
+            export_star_schema(engine)
+    
+    # 5. Remember what was loaded, only once every load succeeded; log files already recorded
+    # their progress chunk by chunk, this also covers files that held no events
+    if incremental and ok:
+        record_files(engine, song_files + new_logs + changed_logs)
+    
+    metrics = drain()
+    if report:
+        report_metrics(metrics)
+    return ok
 
 if __name__ == "__main__":
-    run_etl()
\ No newline at end of file
+    run_etl()
@@ -1,16 +1,132 @@
 import pandas as pd
 import glob
+import io
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from config import EXTRACT_WORKERS, EXTRACT_EXECUTOR, EXTRACT_BATCH_SIZE, DTYPE_REPORT
+from schema import narrow_frame, categorize_frame, frame_memory, report_memory
+from instrument import annotate, instrumented
 
-def extract_json_data(filepath):
+def list_json_files(filepath):
     all_files = []
     for root, dirs, files in os.walk(filepath):
         files = glob.glob(os.path.join(root, '*.json'))
         for f in files:
             all_files.append(os.path.abspath(f))
-    
+    return all_files
+
+def read_json_batch(files, schema=None, measure=False):
+    """Parse a batch of NDJSON files as a single document, one DataFrame per batch.
+
+    Returns (df, raw_bytes); raw_bytes is the memory of the frame before the schema
+    was applied, measured only when `measure` is set.
+    """
+    chunks = []
+    for f in files:
+        with open(f, 'r', encoding='utf-8') as fh:
+            content = fh.read().strip()
+        if content:
+            chunks.append(content)
+    if not chunks:
+        return pd.DataFrame(), 0
+    df = pd.read_json(io.StringIO('\n'.join(chunks)), lines=True)
+    raw_bytes = frame_memory(df) if measure else 0
+    if schema is not None:
+        df = narrow_frame(df, schema)
+    return df, raw_bytes
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _process_context():
+    """Process start method that does not fork the current process.
+
+    Extraction runs on a scheduler thread next to other stage threads and open connections,
+    and forking a multi-threaded process can deadlock.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+@instrumented(lambda filepath, *args, **kwargs: f"extract.{os.path.basename(os.path.normpath(filepath))}")
+def extract_json_data(filepath, workers=None, batch_size=None, executor=None, files=None, schema=None, report=None):
+    workers = EXTRACT_WORKERS if workers is None else workers
+    batch_size = EXTRACT_BATCH_SIZE if batch_size is None else batch_size
+    executor = EXTRACT_EXECUTOR if executor is None else executor
+    report = DTYPE_REPORT if report is None else report
+
+    all_files = list_json_files(filepath) if files is None else list(files)
+    annotate(files=len(all_files), bytes_read=sum(os.path.getsize(f) for f in all_files))
     if not all_files:
         return pd.DataFrame()
-        
-    df_list = [pd.read_json(f, lines=True) for f in all_files]
-    return pd.concat(df_list, ignore_index=True)
\ No newline at end of file
+
+    batches = list(_batches(all_files, max(1, batch_size)))
+    read = partial(read_json_batch, schema=schema, measure=report)
+    if workers <= 1 or len(batches) == 1:
+        results = [read(b) for b in batches]
+    else:
+        if executor == 'thread':
+            pool = ThreadPoolExecutor(max_workers=min(workers, len(batches)))
+        else:
+            pool = ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=_process_context())
+        with pool:
+            results = list(pool.map(read, batches))
+
+    df_list = [df for df, _ in results if not df.empty]
+    if not df_list:
+        return pd.DataFrame()
+    df = pd.concat(df_list, ignore_index=True)
+    if schema is not None:
+        df = categorize_frame(df, schema)
+    if report:
+        report_memory(filepath, sum(raw for _, raw in results), frame_memory(df))
+    return df
+
+def _read_range(path, start, stop):
+    """The bytes [start, stop) of path, for reading only what was appended to a file."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return f.read(stop - start)
+
+def iter_json_chunks(filepath, chunksize, files=None, schema=None, report=None, ranges=None):
+    """Yield the NDJSON rows under filepath (or the given files) as DataFrames of at most chunksize rows.
+
+    ranges maps a file path to the (start, stop) byte range to read instead of the whole file.
+    """
+    report = DTYPE_REPORT if report is None else report
+    pending, pending_rows, raw_bytes = [], 0, 0
+
+    def finish(df, raw):
+        if schema is not None:
+            df = categorize_frame(df, schema)
+        if report:
+            report_memory(f"{filepath} chunk", raw, frame_memory(df))
+        return df
+
+    for f in (list_json_files(filepath) if files is None else files):
+        source = f
+        if ranges and f in ranges:
+            data = _read_range(f, *ranges[f])
+            if not data.strip():
+                continue
+            source = io.BytesIO(data)
+        with pd.read_json(source, lines=True, chunksize=chunksize) as reader:
+            for piece in reader:
+                if report:
+                    raw_bytes += frame_memory(piece)
+                if schema is not None:
+                    piece = narrow_frame(piece, schema)
+                pending.append(piece)
+                pending_rows += len(piece)
+                while pending_rows >= chunksize:
+                    buf = pd.concat(pending, ignore_index=True)
+                    share = raw_bytes * chunksize // pending_rows
+                    yield finish(buf.iloc[:chunksize].reset_index(drop=True), share)
+                    raw_bytes -= share
+                    rest = buf.iloc[chunksize:].reset_index(drop=True)
+                    pending = [rest] if len(rest) else []
+                    pending_rows = len(rest)
+    if pending_rows:
+        yield finish(pd.concat(pending, ignore_index=True), raw_bytes)
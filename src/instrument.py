@@ -0,0 +1,208 @@
+"""
+Instrumentation of ETL stages and batches.
+
+`measure(stage, **fields)` wraps a block of work and records its wall time, the
+CPU time of the calling thread, the peak and change of the process's RSS and
+any fields the block adds (rows_in, rows_out, bytes_read, ...), plus the error
+if it raised. On Linux the RSS high-water mark is reset whenever a block starts
+while no other is running, so peak_rss_mb is the peak since the earliest block
+still running started (for overlapping stages, their shared window) rather than
+the process-lifetime peak; elsewhere it falls back to the lifetime peak. The
+`instrumented` decorator does the same for a function, counting DataFrame rows
+in and out. Records are kept until `drain()` (run_etl prints a per-stage summary)
+and, when ETL_METRICS_PATH is set, appended there as JSON lines.
+
+Stages whose name starts with one of the comma-separated ETL_PROFILE prefixes
+(or all stages, with 'all') also run under cProfile and tracemalloc; the .prof
+file (in PROFILE_DIR) and the traced allocation peak are added to the record.
+"""
+import cProfile
+import functools
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+from config import ETL_METRICS_PATH, ETL_PROFILE, PROFILE_DIR
+
+PROFILE_PREFIXES = [p.strip() for p in ETL_PROFILE.split(',') if p.strip()]
+
+_lock = threading.Lock()
+_records = []
+_profile_ids = itertools.count()
+_tracing_users = 0
+_active = 0
+_local = threading.local()
+
+def _proc_status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux); elsewhere the process-lifetime peak is reported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss (the process-lifetime peak where that is unsupported)."""
+    peak = _proc_status_mb('VmHWM')
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    return round(peak, 1)
+
+def rss_mb():
+    """Current RSS (None where /proc is unavailable)."""
+    rss = _proc_status_mb('VmRSS')
+    return None if rss is None else round(rss, 1)
+
+def _profiled(stage):
+    return any(p == 'all' or stage.startswith(p) for p in PROFILE_PREFIXES)
+
+def _start_tracing():
+    global _tracing_users
+    with _lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+        tracemalloc.reset_peak()
+
+def _stop_tracing():
+    global _tracing_users
+    with _lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+    return round(peak / 1e6, 1)
+
+def emit(record):
+    with _lock:
+        _records.append(record)
+        if ETL_METRICS_PATH:
+            with open(ETL_METRICS_PATH, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+def annotate(**fields):
+    """Add fields to the innermost record being measured on this thread (no-op outside measure)."""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].update(fields)
+
+@contextmanager
+def measure(stage, **fields):
+    """Record wall/CPU time, peak RSS and the yielded record's fields for the enclosed block."""
+    global _active
+    record = {'stage': stage, 'ts': time.time(), 'thread': threading.current_thread().name, **fields}
+    stack = _local.__dict__.setdefault('stack', [])
+    # cProfile allows one active profiler per thread, so nested stages are not profiled again
+    profiler = None
+    if _profiled(stage) and not getattr(_local, 'profiling', False):
+        _start_tracing()
+        profiler = cProfile.Profile()
+        _local.profiling = True
+        profiler.enable()
+    with _lock:
+        if _active == 0:
+            reset_peak_rss()
+        _active += 1
+    rss = rss_mb()
+    stack.append(record)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    except BaseException as e:
+        record.setdefault('error', f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        record['wall_s'] = round(time.perf_counter() - wall, 6)
+        record['cpu_s'] = round(time.thread_time() - cpu, 6)
+        stack.pop()
+        if profiler is not None:
+            profiler.disable()
+            _local.profiling = False
+            record['traced_peak_mb'] = _stop_tracing()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{stage}-{os.getpid()}-{next(_profile_ids)}.prof")
+            profiler.dump_stats(path)
+            record['profile'] = path
+        record['peak_rss_mb'] = peak_rss_mb()
+        if rss is not None:
+            record['rss_delta_mb'] = round(rss_mb() - rss, 1)
+        with _lock:
+            _active -= 1
+        emit(record)
+
+def _rows(value):
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, tuple):
+        counts = [_rows(v) for v in value]
+        return counts if all(c is not None for c in counts) else None
+    return None
+
+def instrumented(stage):
+    """Decorator measuring each call; stage is a name or a callable of the call's arguments."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            name = stage(*args, **kwargs) if callable(stage) else stage
+            with measure(name) as record:
+                if args and isinstance(args[0], pd.DataFrame):
+                    record['rows_in'] = len(args[0])
+                result = func(*args, **kwargs)
+                rows_out = _rows(result)
+                if rows_out is not None:
+                    record['rows_out'] = rows_out
+                return result
+        return wrapper
+    return decorate
+
+def drain():
+    """Return and forget the records collected so far."""
+    with _lock:
+        records = list(_records)
+        _records.clear()
+    return records
+
+def summarize(records):
+    """Aggregate records per stage: calls, wall/CPU seconds, rows, bytes, max peak RSS and errors."""
+    summary = {}
+    for r in records:
+        s = summary.setdefault(r['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                            'bytes_read': 0, 'peak_rss_mb': 0.0, 'errors': []})
+        s['calls'] += 1
+        s['wall_s'] += r['wall_s']
+        s['cpu_s'] += r['cpu_s']
+        for key in ('rows_in', 'rows_out'):
+            value = r.get(key, 0)
+            s[key] += sum(value) if isinstance(value, list) else value
+        s['bytes_read'] += r.get('bytes_read', 0)
+        s['peak_rss_mb'] = max(s['peak_rss_mb'], r['peak_rss_mb'])
+        if 'error' in r:
+            s['errors'].append(r['error'])
+    return summary
+
+def report_metrics(records):
+    for stage, s in sorted(summarize(records).items(), key=lambda item: -item[1]['wall_s']):
+        line = (f"[metrics] {stage}: {s['calls']} call(s), wall {s['wall_s']:.2f}s, cpu {s['cpu_s']:.2f}s, "
+                f"rows {s['rows_in']:,} -> {s['rows_out']:,}")
+        if s['bytes_read']:
+            line += f", read {s['bytes_read'] / 1e6:.1f} MB"
+        print(line + f", peak RSS {s['peak_rss_mb']:.0f} MB")
+        for error in s['errors']:
+            print(f"[metrics]   error: {error}")
@@ -1,8 +1,186 @@
+import io
+from pandas.errors import DatabaseError
 from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
+from config import COPY_BATCH_ROWS, LOAD_MODE
+from partitions import ensure_partitions
+from instrument import measure
 
-def load_to_db(df, table_name, engine):
+COPY_NULL = '\\N'
+
+# Tables merged through a staging table: primary key and conflict action.
+# 'update' overwrites changed attributes (users only with a row at least as new, see NEWEST_WINS), 'nothing' keeps the existing row,
+# 'merge' combines the existing and new row with MERGE_UPDATES (and is used whatever the LOAD_MODE).
+UPSERT_TABLES = {
+    'users': ('user_id', 'update'),
+    'songs': ('song_id', 'update'),
+    'artists': ('artist_id', 'update'),
+    'time': ('start_time', 'nothing'),
+    'sessions': ('user_id, session_id', 'merge'),
+    'user_versions': ('user_id, valid_from', 'merge'),
+}
+
+# 'update' tables whose stored row is only replaced by a row at least as new by this column
+NEWEST_WINS = {'users': 'level_ts'}
+
+# Partial sessions from separate batches are stitched into one row. tracks is recounted from
+# songplays (loaded first, in the same transaction) rather than added up, so merging the same
+# partial session twice cannot inflate it; the time range lets the count prune partitions
+MERGE_UPDATES = {
+    'sessions': {
+        'start_time': 'LEAST(sessions.start_time, EXCLUDED.start_time)',
+        'end_time': 'GREATEST(sessions.end_time, EXCLUDED.end_time)',
+        'tracks': ('(SELECT COUNT(*) FROM songplays sp'
+                   ' WHERE sp.user_id = EXCLUDED.user_id AND sp.session_id = EXCLUDED.session_id'
+                   ' AND sp.start_time BETWEEN LEAST(sessions.start_time, EXCLUDED.start_time)'
+                   ' AND GREATEST(sessions.end_time, EXCLUDED.end_time))'),
+        'level': 'CASE WHEN EXCLUDED.end_time >= sessions.end_time THEN EXCLUDED.level ELSE sessions.level END',
+    },
+    # Versions arrive already merged with the stored history (see user_versions.py)
+    'user_versions': {c: f'EXCLUDED.{c}' for c in ('first_name', 'last_name', 'gender', 'level',
+                                                         'valid_to', 'last_seen')},
+}
+
+def upsert_keys(table_name):
+    return [c.strip() for c in UPSERT_TABLES[table_name][0].split(',')]
+
+def supports_copy(engine):
+    return engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg2'
+
+def frame_to_csv(df):
+    """Render a DataFrame as COPY-ready CSV; integral float columns (ints with NaN) are written as ints."""
+    df = df.copy()
+    for col in df.columns:
+        s = df[col]
+        if s.dtype.kind == 'f':
+            values = s.dropna()
+            if (values % 1 == 0).all():
+                df[col] = s.astype('Int64')
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, na_rep=COPY_NULL)
+    buf.seek(0)
+    return buf
+
+def _copy_frame(cur, df, table_name, batch_size):
+    columns = ', '.join(df.columns)
+    sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    for start in range(0, len(df), batch_size):
+        cur.copy_expert(sql, frame_to_csv(df.iloc[start:start + batch_size]))
+
+def _run_in_transaction(engine, work):
+    conn = engine.raw_connection()
     try:
-        df.to_sql(table_name, engine, if_exists='append', index=False, method='multi')
-    except SQLAlchemyError as e:
-        print(f"Error loading {table_name}: {e}")
\ No newline at end of file
+        with conn.cursor() as cur:
+            work(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def copy_to_db(df, table_name, engine, batch_size=COPY_BATCH_ROWS):
+    """Stream df into table_name with COPY FROM STDIN, batch_size rows per buffer, in one transaction."""
+    _run_in_transaction(engine, lambda cur: _copy_frame(cur, df, table_name, batch_size))
+
+def upsert_sql(table_name, columns):
+    """Build the INSERT ... ON CONFLICT statement merging stage_<table> into table_name."""
+    key, action = UPSERT_TABLES[table_name]
+    column_list = ', '.join(columns)
+    sql = f"INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM stage_{table_name} ON CONFLICT ({key}) "
+    attrs = [c for c in columns if c not in upsert_keys(table_name)]
+    if action == 'nothing' or not attrs:
+        return sql + "DO NOTHING"
+    if action == 'merge':
+        merges = MERGE_UPDATES[table_name]
+        return sql + "DO UPDATE SET " + ', '.join(f"{c} = {merges[c]}" for c in attrs)
+    target = ', '.join(f"{table_name}.{c}" for c in attrs)
+    excluded = ', '.join(f"EXCLUDED.{c}" for c in attrs)
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in attrs)
+    sql += f"DO UPDATE SET {updates} WHERE ({target}) IS DISTINCT FROM ({excluded})"
+    newest = NEWEST_WINS.get(table_name)
+    if newest in attrs:
+        # A NULL on either side (rows loaded before the column existed) does not block the update
+        sql += f" AND (EXCLUDED.{newest} >= {table_name}.{newest}) IS NOT FALSE"
+    return sql
+
+def _upsert_frame(cur, df, table_name, batch_size):
+    df = df.drop_duplicates(upsert_keys(table_name), keep='last')
+    stage = f"stage_{table_name}"
+    # Created from the target in every transaction, so it always has the target's current columns
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+    cur.execute(f"TRUNCATE {stage}")
+    _copy_frame(cur, df, stage, batch_size)
+    cur.execute(upsert_sql(table_name, list(df.columns)))
+
+def upsert_to_db(df, table_name, engine, batch_size=COPY_BATCH_ROWS):
+    """COPY df into a temporary staging table, then merge it into table_name with ON CONFLICT."""
+    _run_in_transaction(engine, lambda cur: _upsert_frame(cur, df, table_name, batch_size))
+
+def load_to_db(df, table_name, engine, upsert=False):
+    """Load df into table_name; returns False (after reporting the error) if the load failed.
+
+    With upsert, tables in UPSERT_TABLES are merged through their staging table even in append mode.
+    """
+    if df.empty:
+        return True
+    with measure(f"load.{table_name}", rows_in=len(df)) as record:
+        try:
+            if supports_copy(engine):
+                if table_name == 'songplays':
+                    ensure_partitions(engine, df['start_time'])
+                if table_name in UPSERT_TABLES and (upsert or LOAD_MODE == 'upsert' or UPSERT_TABLES[table_name][1] == 'merge'):
+                    record['method'] = 'upsert'
+                    upsert_to_db(df, table_name, engine)
+                else:
+                    record['method'] = 'copy'
+                    copy_to_db(df, table_name, engine)
+            else:
+                record['method'] = 'to_sql'
+                df.to_sql(table_name, engine, if_exists='append', index=False, method='multi')
+        except (SQLAlchemyError, DatabaseError, engine.dialect.dbapi.Error) as e:
+            # Reported here and kept in the metrics record, so run_etl's summary shows which load failed
+            record['error'] = f"{type(e).__name__}: {e}"
+            print(f"Error loading {table_name}: {e}")
+            return False
+        record['rows_out'] = len(df)
+    return True
+
+def load_batch(frames, engine, after=None, batch_size=COPY_BATCH_ROWS, report_errors=False):
+    """Load [(table_name, df), ...] and run after(conn) in one transaction: all of it commits or none.
+
+    Dimension tables are always merged (micro-batches overlap on users and timestamps); without
+    COPY support the frames are appended with to_sql on the same connection. With report_errors,
+    a failed load is reported and False returned, as load_to_db does, instead of raising.
+    """
+    rows = sum(len(df) for _, df in frames)
+    with measure('load.batch', rows_in=rows, tables=[t for t, df in frames if not df.empty]) as record:
+        try:
+            copy = supports_copy(engine)
+            for table_name, df in frames:
+                if copy and table_name == 'songplays' and not df.empty:
+                    ensure_partitions(engine, df['start_time'])
+            with engine.begin() as conn:
+                if copy:
+                    with conn.connection.cursor() as cur:
+                        for table_name, df in frames:
+                            if df.empty:
+                                continue
+                            if table_name in UPSERT_TABLES:
+                                _upsert_frame(cur, df, table_name, batch_size)
+                            else:
+                                _copy_frame(cur, df, table_name, batch_size)
+                else:
+                    for table_name, df in frames:
+                        if not df.empty:
+                            df.to_sql(table_name, conn, if_exists='append', index=False, method='multi')
+                if after is not None:
+                    after(conn)
+        except (SQLAlchemyError, DatabaseError, engine.dialect.dbapi.Error) as e:
+            if not report_errors:
+                raise
+            record['error'] = f"{type(e).__name__}: {e}"
+            print(f"Error loading {', '.join(t for t, _ in frames)}: {e}")
+            return False
+        record['rows_out'] = rows
+    return True
@@ -0,0 +1,101 @@
+"""
+In-memory song/artist lookup index for the songplays fact build.
+
+Events are matched to the catalog on the classic song-matching key
+(normalized title, normalized artist name, duration rounded to the second),
+falling back to (title, artist) only when the event has no usable `length` or
+the matched catalog song has no duration; an event whose length differs from
+the catalog's is a different recording and stays unmatched.
+Keys are hashed once into pandas indexes, so each event batch is resolved
+with a vectorized `get_indexer` call instead of a merge against the full
+dimension frames.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+
+def normalize_text(values):
+    """Lower-case, trim and collapse whitespace; normalizes each distinct value once."""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    norm = pd.Index(uniques).astype(str).str.lower().str.strip().str.replace(r'\s+', ' ', regex=True)
+    # code -1 (missing) picks the trailing None
+    return np.append(np.asarray(norm, dtype=object), None)[codes]
+
+
+def round_duration(values):
+    return np.round(pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64'))
+
+
+class SongLookup:
+    """Hash index from (title, artist name, rounded duration) to (song_id, artist_id)."""
+
+    def __init__(self, catalog):
+        catalog = catalog.reset_index(drop=True)
+        titles = normalize_text(catalog['title'])
+        artists = normalize_text(catalog['artist_name'])
+        durations = round_duration(catalog['duration'])
+
+        self.song_ids = catalog['song_id'].to_numpy(dtype=object)
+        self.artist_ids = catalog['artist_id'].to_numpy(dtype=object)
+        self._has_duration = ~np.isnan(durations)
+
+        has_duration = self._has_duration
+        full = pd.MultiIndex.from_arrays([titles[has_duration], artists[has_duration], durations[has_duration]])
+        self._full_index, self._full_pos = self._unique(full, np.flatnonzero(has_duration))
+        name = pd.MultiIndex.from_arrays([titles, artists])
+        self._name_index, self._name_pos = self._unique(name, np.arange(len(catalog)))
+
+    @staticmethod
+    def _unique(index, positions):
+        keep = ~index.duplicated(keep='first')
+        return index[keep], positions[keep]
+
+    @classmethod
+    def from_frames(cls, songs_df, artists_df):
+        """Build the index from the transformed songs and artists dimensions."""
+        catalog = songs_df[['song_id', 'title', 'artist_id', 'duration']].merge(
+            artists_df[['artist_id', 'name']].drop_duplicates('artist_id'), on='artist_id', how='left')
+        return cls(catalog.rename(columns={'name': 'artist_name'}))
+
+    @classmethod
+    def from_db(cls, engine):
+        """Build the index from the loaded songs and artists tables (incremental runs)."""
+        query = """
+            SELECT s.song_id, s.title, s.artist_id, s.duration, a.name AS artist_name
+            FROM songs s
+            LEFT JOIN artists a ON s.artist_id = a.artist_id
+        """
+        return cls(pd.read_sql(text(query), engine))
+
+    def __len__(self):
+        return len(self.song_ids)
+
+    def resolve(self, titles, artists, lengths=None):
+        """Return (song_id, artist_id) object arrays for each event; None where nothing matches."""
+        titles = normalize_text(titles)
+        artists = normalize_text(artists)
+        n = len(titles)
+        pos = np.full(n, -1, dtype=np.int64)
+        durations = np.full(n, np.nan) if lengths is None else round_duration(lengths)
+
+        if len(self._full_index):
+            keys = pd.MultiIndex.from_arrays([titles, artists, durations])
+            hit = self._full_index.get_indexer(keys)
+            pos = np.where(hit >= 0, self._full_pos[np.maximum(hit, 0)], -1)
+
+        missing = pos < 0
+        if missing.any() and len(self._name_index):
+            keys = pd.MultiIndex.from_arrays([titles[missing], artists[missing]])
+            hit = self._name_index.get_indexer(keys)
+            name_pos = np.where(hit >= 0, self._name_pos[np.maximum(hit, 0)], -1)
+            # A name match stands only if one side has no duration to compare
+            usable = np.isnan(durations[missing]) | ~self._has_duration[np.maximum(name_pos, 0)]
+            pos[missing] = np.where(usable, name_pos, -1)
+
+        found = pos >= 0
+        song_ids = np.full(n, None, dtype=object)
+        artist_ids = np.full(n, None, dtype=object)
+        song_ids[found] = self.song_ids[pos[found]]
+        artist_ids[found] = self.artist_ids[pos[found]]
+        return song_ids, artist_ids
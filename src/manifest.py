@@ -0,0 +1,161 @@
+"""
+Processed-file manifest for incremental ETL runs.
+
+Each source file that has been loaded is recorded with its size, mtime and
+content hash; a later run only extracts files that are new or whose content
+changed. A changed file whose recorded content is still its prefix was only
+appended to, so just the bytes after the recorded size are read (like the
+stream's byte offsets) and events already in `songplays` are not loaded again,
+whatever their `ts`. A file rewritten in place is read again in full.
+
+Log files are read with `iter_file_chunks`, whose chunks carry the manifest
+entries of the lines they hold. Recording those in the transaction that loads
+a chunk's songplays means a run that fails part-way resumes each file after
+its last committed line, instead of appending the same plays again.
+"""
+import hashlib
+import io
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from schema import apply_schema
+
+READ_BLOCK_BYTES = 1 << 20
+
+MANIFEST_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_manifest (
+        path varchar PRIMARY KEY,
+        size bigint NOT NULL,
+        mtime double precision NOT NULL,
+        content_hash varchar NOT NULL,
+        processed_at timestamp NOT NULL DEFAULT now()
+    )
+"""
+
+def ensure_manifest_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text(MANIFEST_DDL))
+
+def file_hashes(path, prefix_size=None, block_size=1 << 20):
+    """Return (hash of the file, hash of its first prefix_size bytes) in one read.
+
+    The prefix hash is None without prefix_size or when the file is shorter than that.
+    """
+    digest, prefix = hashlib.blake2b(digest_size=16), None
+    read = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            if prefix_size is not None and read <= prefix_size < read + len(block):
+                head = digest.copy()
+                head.update(block[:prefix_size - read])
+                prefix = head.hexdigest()
+            digest.update(block)
+            read += len(block)
+    if prefix_size is not None and read == prefix_size:
+        prefix = digest.hexdigest()
+    return digest.hexdigest(), prefix
+
+def file_hash(path, block_size=1 << 20):
+    return file_hashes(path, block_size=block_size)[0]
+
+def load_manifest(engine):
+    """Return {path: (size, mtime, content_hash)} for every processed file."""
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT path, size, mtime, content_hash FROM etl_manifest"))
+        return {row[0]: (row[1], row[2], row[3]) for row in rows}
+
+def pending_files(files, manifest):
+    """Split files into (new, changed, touched) lists of (path, size, mtime, hash) entries.
+
+    Files whose size and mtime match the manifest are skipped without hashing. Changed
+    entries carry a fifth field, the byte offset their unread content starts at: the
+    recorded size if the file was only appended to, else 0. Touched files have a new
+    mtime but the recorded content; they need no load, only their manifest entry updated.
+    """
+    new, changed, touched = [], [], []
+    for path in files:
+        st = os.stat(path)
+        known = manifest.get(path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime:
+            continue
+        if not known:
+            new.append((path, st.st_size, st.st_mtime, file_hash(path)))
+            continue
+        digest, prefix = file_hashes(path, known[0])
+        if known[2] == digest:
+            touched.append((path, st.st_size, st.st_mtime, digest))
+        else:
+            changed.append((path, st.st_size, st.st_mtime, digest, known[0] if prefix == known[2] else 0))
+    return new, changed, touched
+
+def _parse_lines(pieces, schema):
+    data = b'\n'.join(line for line in b''.join(pieces).split(b'\n') if line.strip())
+    if not data:
+        return pd.DataFrame()
+    return apply_schema(pd.read_json(io.BytesIO(data), lines=True), schema)
+
+def iter_file_chunks(entries, chunksize, schema, block_size=READ_BLOCK_BYTES):
+    """Yield (df, progress) for the NDJSON lines of pending entries, at most chunksize rows per df.
+
+    Each file is read from its offset (changed entries) or start up to its recorded size.
+    progress holds an entry for every file the chunk read from, sized and hashed up to the
+    chunk's last line of it: once recorded, the next run reads that file from there on.
+    """
+    pieces, rows, progress = [], 0, {}
+    for path, size, mtime, _, *offset in entries:
+        start = offset[0] if offset else 0
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            # The content loaded before, which the recorded hash covers
+            for block in iter(lambda: f.read(min(block_size, start - f.tell())), b''):
+                digest.update(block)
+            end, remaining, buf = start, size - start, b''
+            while True:
+                block = f.read(min(block_size, remaining))
+                remaining -= len(block)
+                buf += block
+                at_end = not remaining or not block
+                # A last line without its newline is complete once the file's recorded size is read
+                data = buf + b'\n' if at_end and buf and not buf.endswith(b'\n') else buf
+                newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+                pos = taken = 0
+                while taken < len(newlines):
+                    take = min(len(newlines) - taken, chunksize - rows)
+                    cut = int(newlines[taken + take - 1]) + 1
+                    pieces.append(data[pos:cut])
+                    content = buf[pos:cut]  # without the newline added above
+                    digest.update(content)
+                    end += len(content)
+                    progress[path] = (path, end, mtime, digest.hexdigest())
+                    rows, taken, pos = rows + take, taken + take, cut
+                    if rows >= chunksize:
+                        df = _parse_lines(pieces, schema)
+                        pieces, rows = [], 0
+                        if not df.empty:  # blank lines only: their progress goes with the next chunk
+                            yield df, list(progress.values())
+                            progress = {}
+                buf = buf[pos:]
+                if at_end:
+                    break
+    df = _parse_lines(pieces, schema)
+    if not df.empty:
+        yield df, list(progress.values())
+
+def _record(conn, entries):
+    conn.execute(text("""
+        INSERT INTO etl_manifest (path, size, mtime, content_hash, processed_at)
+        VALUES (:path, :size, :mtime, :content_hash, now())
+        ON CONFLICT (path) DO UPDATE SET size = EXCLUDED.size, mtime = EXCLUDED.mtime,
+            content_hash = EXCLUDED.content_hash, processed_at = EXCLUDED.processed_at
+    """), [{'path': p, 'size': s, 'mtime': m, 'content_hash': h} for p, s, m, h, *_ in entries])
+
+def record_files(engine, entries, conn=None):
+    """Record (path, size, mtime, hash) entries as processed, within conn's transaction if given."""
+    if not entries:
+        return
+    if conn is not None:
+        _record(conn, entries)
+        return
+    with engine.begin() as conn:
+        _record(conn, entries)
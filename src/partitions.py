@@ -0,0 +1,67 @@
+"""
+Monthly range partitions of the songplays fact table.
+
+`ensure_partitions` creates any missing `songplays_YYYY_MM` partitions for the
+months present in a batch before it is loaded. Partitions already known in
+this process are not looked up again; the cache is keyed by the table's OID,
+which changes whenever `songplays` is dropped and recreated (drop/create_tables.sql
+or the migration), so partitions that went with the old table are created
+again. If `songplays` is still a plain heap table (not yet migrated with
+sql/migrate_songplays_partitioned.sql) nothing is done.
+"""
+import threading
+import pandas as pd
+from sqlalchemy import text
+
+_lock = threading.Lock()
+_known = {}  # (engine url, table) -> (table oid, partition names, or None if not partitioned)
+
+def partition_name(table_name, month):
+    return f"{table_name}_{month:%Y_%m}"
+
+def batch_months(start_times):
+    """Distinct month starts (as Timestamps) of the given timestamps."""
+    months = pd.to_datetime(pd.Series(start_times)).dt.to_period('M').unique()
+    return sorted(m.to_timestamp() for m in months if not pd.isna(m))
+
+def _existing_partitions(conn, table_name):
+    partitioned = conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :table
+    """), {'table': table_name}).scalar()
+    if not partitioned:
+        return None
+    names = conn.execute(text("""
+        SELECT child.relname FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table
+    """), {'table': table_name}).scalars()
+    return set(names)
+
+def ensure_partitions(engine, start_times, table_name='songplays'):
+    """Create the monthly partitions of table_name needed for start_times."""
+    months = batch_months(start_times)
+    if not months:
+        return
+    key = (str(engine.url), table_name)
+    with _lock:
+        with engine.connect() as conn:
+            oid = conn.execute(text("SELECT to_regclass(:table)::oid"), {'table': table_name}).scalar()
+            if key not in _known or _known[key][0] != oid:
+                _known[key] = (oid, _existing_partitions(conn, table_name))
+        known = _known[key][1]
+        if known is None:
+            return
+        missing = [m for m in months if partition_name(table_name, m) not in known]
+        if not missing:
+            return
+        with engine.begin() as conn:
+            for month in missing:
+                name = partition_name(table_name, month)
+                upper = month + pd.DateOffset(months=1)
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+                ))
+        known.update(partition_name(table_name, m) for m in missing)
@@ -0,0 +1,143 @@
+"""
+Result cache for the EDA and dashboard queries.
+
+Entries are keyed by the database, the query text, its parameters and the
+data generation: a counter in `etl_generation` that `run_etl` bumps after each
+successful load, plus a random token that changes whenever the table is
+recreated (e.g. by setup_database_and_data.py). Until the next load, repeated
+reports are served from pickled results on local disk. Entries of older
+generations are removed on the next store, and the rest are evicted least
+recently used first once the cache exceeds its size limit.
+"""
+import hashlib
+import os
+import pickle
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from config import QUERY_CACHE, QUERY_CACHE_DIR, QUERY_CACHE_MAX_BYTES
+
+GENERATION_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_generation (
+        id int PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        generation bigint NOT NULL DEFAULT 0,
+        token uuid NOT NULL DEFAULT gen_random_uuid()
+    )
+"""
+
+def bump_generation(engine):
+    """Mark the warehouse data as changed; called by run_etl after a successful load."""
+    with engine.begin() as conn:
+        conn.execute(text(GENERATION_DDL))
+        return conn.execute(text("""
+            INSERT INTO etl_generation (id, generation) VALUES (1, 1)
+            ON CONFLICT (id) DO UPDATE SET generation = etl_generation.generation + 1
+            RETURNING generation
+        """)).scalar()
+
+def current_generation(engine):
+    """Return a string identifying the current data generation, or None if it is not tracked."""
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(text("SELECT generation, token FROM etl_generation WHERE id = 1")).first()
+    except SQLAlchemyError:
+        return None
+    return None if row is None else f"{row[0]}.{row[1]}"
+
+class QueryCache:
+    """Pickled query results on disk, one file per (generation, key)."""
+
+    def __init__(self, directory=QUERY_CACHE_DIR, max_bytes=QUERY_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _generation_prefix(generation):
+        return hashlib.blake2b(generation.encode(), digest_size=6).hexdigest()
+
+    def _path(self, generation, key):
+        return os.path.join(self.directory, f"{self._generation_prefix(generation)}-{key}.pkl")
+
+    @staticmethod
+    def make_key(engine, sql, params):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(engine.url.render_as_string(hide_password=True).encode())
+        digest.update(repr(sql).encode())
+        digest.update(repr(sorted((params or {}).items())).encode())
+        return digest.hexdigest()
+
+    def get(self, generation, key):
+        path = self._path(generation, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None, False
+        os.utime(path)  # most recently used
+        return value, True
+
+    def put(self, generation, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(generation, key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict(generation)
+
+    def evict(self, generation):
+        """Drop entries of other generations, then least recently used entries over max_bytes."""
+        prefix = self._generation_prefix(generation) + '-'
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                if not name.startswith(prefix):
+                    os.remove(path)
+                    continue
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+_default_cache = QueryCache()
+
+def cached_call(engine, sql, params, compute, cache=None):
+    """Return compute() for this query, served from the cache while the data generation is unchanged."""
+    if not QUERY_CACHE and cache is None:
+        return compute()
+    cache = _default_cache if cache is None else cache
+    generation = current_generation(engine)
+    if generation is None:
+        return compute()
+    key = QueryCache.make_key(engine, sql, params)
+    value, hit = cache.get(generation, key)
+    if hit:
+        return value
+    value = compute()
+    cache.put(generation, key, value)
+    return value
+
+def fetch_all(engine, sql, params=None, cache=None):
+    """Execute sql and return its rows as plain tuples, via the result cache."""
+    def compute():
+        with engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(text(sql), params or {})]
+    return cached_call(engine, sql, params, compute, cache)
+
+def fetch_dicts(engine, sql, params=None, cache=None):
+    """Execute sql and return its rows as {column: value} dicts, via the result cache."""
+    def compute():
+        with engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(text(sql), params or {})]
+    return cached_call(engine, ('dicts', sql), params, compute, cache)
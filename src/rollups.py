@@ -0,0 +1,128 @@
+"""
+Pre-aggregated rollups of the songplays fact table.
+
+The dashboard and EDA read play counts from these small tables instead of
+scanning `songplays`. After each ETL load, `refresh_rollups` aggregates only
+the songplays rows added since the previous refresh (tracked by songplay_id in
+`rollup_state`) and adds them onto the existing rollup rows, so refresh cost
+depends on the new data, not on the total history. Until the first refresh
+(e.g. a database loaded before the rollups existed) `rollups_ready` is false
+and analytics.run_metrics reads the fact table instead.
+
+SERIAL ids are taken at insert but become visible at commit, so with two
+loaders at once (the stream alongside a batch run) a lower id could commit
+after a refresh had moved the watermark past it. A refresh therefore reads its
+upper bound under a SHARE lock on songplays, which waits for the loads in
+flight: every id up to it has committed, and later inserts take higher ids.
+Refreshes are serialized with an advisory lock.
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from query_cache import fetch_all
+
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS rollup_plays_hourly (
+        play_date date NOT NULL,
+        hour smallint NOT NULL,
+        weekday smallint NOT NULL,
+        level varchar,
+        location varchar,
+        plays bigint NOT NULL,
+        duration double precision NOT NULL,
+        UNIQUE NULLS NOT DISTINCT (play_date, hour, level, location)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_plays_song (
+        play_date date NOT NULL,
+        song_id varchar,
+        artist_id varchar,
+        plays bigint NOT NULL,
+        UNIQUE NULLS NOT DISTINCT (play_date, song_id, artist_id)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_plays_user (
+        play_date date NOT NULL,
+        user_id int NOT NULL,
+        plays bigint NOT NULL,
+        PRIMARY KEY (play_date, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name varchar PRIMARY KEY,
+        last_songplay_id bigint NOT NULL
+    );
+"""
+
+ROLLUP_TABLES = ['rollup_plays_hourly', 'rollup_plays_song', 'rollup_plays_user']
+
+# pg_advisory_xact_lock key held by refresh_rollups
+REFRESH_LOCK = 7_001
+
+# Each statement folds songplays in (:lo, :hi] into its rollup
+REFRESH_SQL = [
+    """
+    INSERT INTO rollup_plays_hourly (play_date, hour, weekday, level, location, plays, duration)
+    SELECT sp.start_time::date, t.hour, t.weekday, sp.level, sp.location, COUNT(*), COALESCE(SUM(s.duration), 0)
+    FROM songplays sp
+    JOIN time t ON sp.start_time = t.start_time
+    LEFT JOIN songs s ON sp.song_id = s.song_id
+    WHERE sp.songplay_id > :lo AND sp.songplay_id <= :hi
+    GROUP BY sp.start_time::date, t.hour, t.weekday, sp.level, sp.location
+    ON CONFLICT (play_date, hour, level, location) DO UPDATE
+    SET plays = rollup_plays_hourly.plays + EXCLUDED.plays,
+        duration = rollup_plays_hourly.duration + EXCLUDED.duration
+    """,
+    """
+    INSERT INTO rollup_plays_song (play_date, song_id, artist_id, plays)
+    SELECT sp.start_time::date, sp.song_id, sp.artist_id, COUNT(*)
+    FROM songplays sp
+    WHERE sp.songplay_id > :lo AND sp.songplay_id <= :hi
+    GROUP BY sp.start_time::date, sp.song_id, sp.artist_id
+    ON CONFLICT (play_date, song_id, artist_id) DO UPDATE
+    SET plays = rollup_plays_song.plays + EXCLUDED.plays
+    """,
+    """
+    INSERT INTO rollup_plays_user (play_date, user_id, plays)
+    SELECT sp.start_time::date, sp.user_id, COUNT(*)
+    FROM songplays sp
+    WHERE sp.songplay_id > :lo AND sp.songplay_id <= :hi
+    GROUP BY sp.start_time::date, sp.user_id
+    ON CONFLICT (play_date, user_id) DO UPDATE
+    SET plays = rollup_plays_user.plays + EXCLUDED.plays
+    """,
+]
+
+def ensure_rollup_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text(ROLLUP_DDL))
+
+def refresh_rollups(engine, rebuild=False):
+    """Fold songplays added since the last refresh into the rollups.
+
+    Returns the (lo, hi] songplay_id range folded in. With rebuild, the rollups are
+    emptied and recomputed from the whole fact table.
+    """
+    ensure_rollup_tables(engine)
+    with engine.begin() as conn:
+        # Held only while reading MAX: loaders wait for it as briefly as possible
+        conn.execute(text("LOCK TABLE songplays IN SHARE MODE"))
+        hi = conn.execute(text("SELECT MAX(songplay_id) FROM songplays")).scalar() or 0
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': REFRESH_LOCK})
+        if rebuild:
+            conn.execute(text(f"TRUNCATE {', '.join(ROLLUP_TABLES)}"))
+            conn.execute(text("DELETE FROM rollup_state WHERE name = 'songplays'"))
+        lo = conn.execute(text("SELECT last_songplay_id FROM rollup_state WHERE name = 'songplays'")).scalar() or 0
+        if hi <= lo:
+            return lo, lo
+        for statement in REFRESH_SQL:
+            conn.execute(text(statement), {'lo': lo, 'hi': hi})
+        conn.execute(text("""
+            INSERT INTO rollup_state (name, last_songplay_id) VALUES ('songplays', :hi)
+            ON CONFLICT (name) DO UPDATE SET last_songplay_id = EXCLUDED.last_songplay_id
+        """), {'hi': hi})
+        return lo, hi
+
+def rollups_ready(engine):
+    """Whether songplays have been folded into the rollups (cached until the next load)."""
+    try:
+        return bool(fetch_all(engine, "SELECT 1 FROM rollup_state WHERE name = 'songplays'"))
+    except SQLAlchemyError:
+        return False  # no rollup tables (yet)
@@ -0,0 +1,78 @@
+"""
+Minimal dependency-graph scheduler for the ETL stages.
+
+Each stage is a function of the results of the stages it depends on. A stage
+starts as soon as all of its `deps` have finished, so independent stages run
+concurrently on a thread pool. `streams_from` names producer stages that feed a
+stage through a queue while both run; the scheduler does not wait on them, but
+they count as predecessors when the critical path is reported.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+Stage = namedtuple('Stage', ['name', 'func', 'deps', 'streams_from'], defaults=[(), ()])
+
+class StageCancelled(Exception):
+    """Raised inside a stage that stops early because another stage failed."""
+
+def _timed(stage, results):
+    start = time.perf_counter()
+    value = stage.func(results)
+    return value, (start, time.perf_counter())
+
+def run_stages(stages, cancel=None):
+    """Run stages as their dependencies complete; returns (results, timings).
+
+    timings maps stage name to (start, end) perf_counter values. If a stage raises, no
+    further stages are started, `cancel` is set so blocked producers can stop, and the
+    first error is re-raised once running stages have finished.
+    """
+    cancel = threading.Event() if cancel is None else cancel
+    pending = {s.name: s for s in stages}
+    results, timings, running = {}, {}, {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, len(stages)), thread_name_prefix='etl-stage') as pool:
+        while pending or running:
+            if error is None:
+                for name, stage in list(pending.items()):
+                    if all(d in results for d in stage.deps):
+                        del pending[name]
+                        running[pool.submit(_timed, stage, results)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name], timings[name] = future.result()
+                except Exception as e:
+                    if error is None or isinstance(error, StageCancelled):
+                        error = e
+                    cancel.set()
+    if error is not None:
+        raise error
+    return results, timings
+
+def critical_path(stages, timings):
+    """Walk back from the last stage to finish through the predecessor that finished last."""
+    by_name = {s.name: s for s in stages}
+    name = max(timings, key=lambda n: timings[n][1])
+    path = [name]
+    while True:
+        preds = [p for p in (*by_name[name].deps, *by_name[name].streams_from) if p in timings]
+        if not preds:
+            break
+        name = max(preds, key=lambda n: timings[n][1])
+        path.append(name)
+    return path[::-1]
+
+def report_timings(stages, timings):
+    origin = min(start for start, _ in timings.values())
+    print("[stages] wall time per stage:")
+    for name, (start, end) in sorted(timings.items(), key=lambda item: item[1][0]):
+        print(f"  {name:16} {end - start:8.2f}s  (started +{start - origin:.2f}s)")
+    path = critical_path(stages, timings)
+    total = timings[path[-1]][1] - origin
+    print(f"[stages] critical path: {' -> '.join(path)} ({total:.2f}s)")
@@ -0,0 +1,67 @@
+"""
+Column schemas and dtype handling for the raw song and log frames.
+
+Only the columns the pipeline uses are kept. Repeated low-cardinality strings
+become categoricals and integer columns are downcast; float columns stay
+float64 so durations and coordinates load into Postgres unchanged.
+"""
+import pandas as pd
+
+# column -> 'string' | 'category' | 'integer' | 'float'
+SONG_SCHEMA = {
+    'song_id': 'string',
+    'title': 'string',
+    'artist_id': 'string',
+    'year': 'integer',
+    'duration': 'float',
+    'artist_name': 'string',
+    'artist_location': 'category',
+    'artist_latitude': 'float',
+    'artist_longitude': 'float',
+}
+
+LOG_SCHEMA = {
+    'artist': 'string',
+    'firstName': 'category',
+    'lastName': 'category',
+    'gender': 'category',
+    'itemInSession': 'integer',
+    'length': 'float',
+    'level': 'category',
+    'location': 'category',
+    'page': 'category',
+    'sessionId': 'integer',
+    'song': 'string',
+    'ts': 'integer',
+    'userAgent': 'category',
+    'userId': 'string',
+}
+
+def narrow_frame(df, schema):
+    """Keep only schema columns and downcast numerics; cheap enough to run per worker batch."""
+    df = df[[c for c in schema if c in df.columns]].copy()
+    for col in df.columns:
+        kind = schema[col]
+        if kind == 'integer':
+            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='integer')
+        elif kind == 'float':
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+def categorize_frame(df, schema):
+    """Convert 'category' columns; done after concatenation so batches share one set of categories."""
+    for col in df.columns:
+        if schema.get(col) == 'category' and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def apply_schema(df, schema):
+    return categorize_frame(narrow_frame(df, schema), schema)
+
+def frame_memory(df):
+    """Deep memory usage of df in bytes."""
+    return int(df.memory_usage(deep=True).sum())
+
+def report_memory(label, before, after):
+    saved = (1 - after / before) * 100 if before else 0
+    print(f"[dtypes] {label}: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB ({saved:.0f}% smaller)")
@@ -0,0 +1,49 @@
+"""
+Listening sessions derived from songplays.
+
+Each loaded songplays batch is reduced to one partial session per
+(user_id, session_id) with a single sort and grouped first/last/size reductions.
+Partial sessions are merged into `sessions` with ON CONFLICT (see MERGE_UPDATES in
+load.py): start/end widen, the track count of a session already stored is
+recounted from its songplays (an index lookup on (user_id, session_id)) and the
+level of the latest event wins. A session split across chunks or ETL runs is
+therefore stitched together without re-sorting the fact table, and merging the
+same batch twice leaves the row as it was. Sessions must be loaded in the
+transaction that loads their songplays, after them (`load_batch`).
+"""
+import pandas as pd
+from sqlalchemy import text
+
+SESSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        user_id int NOT NULL,
+        session_id int NOT NULL,
+        start_time timestamp NOT NULL,
+        end_time timestamp NOT NULL,
+        duration double precision GENERATED ALWAYS AS (EXTRACT(EPOCH FROM end_time - start_time)) STORED,
+        tracks int NOT NULL,
+        level varchar,
+        PRIMARY KEY (user_id, session_id)
+    )
+"""
+
+SESSION_COLUMNS = ['user_id', 'session_id', 'start_time', 'end_time', 'tracks', 'level']
+
+def ensure_sessions_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(SESSIONS_DDL))
+
+def build_sessions(songplays_df):
+    """Reduce a songplays batch to one row per (user_id, session_id)."""
+    if songplays_df.empty:
+        return pd.DataFrame(columns=SESSION_COLUMNS)
+    plays = songplays_df[['user_id', 'session_id', 'start_time', 'level']].sort_values(
+        ['user_id', 'session_id', 'start_time'], kind='stable')
+    grouped = plays.groupby(['user_id', 'session_id'], sort=False, observed=True)
+    sessions = pd.DataFrame({
+        'start_time': grouped['start_time'].first(),
+        'end_time': grouped['start_time'].last(),
+        'tracks': grouped.size(),
+        'level': grouped['level'].last(),
+    }).reset_index()
+    return sessions[SESSION_COLUMNS]
@@ -0,0 +1,235 @@
+"""
+Mergeable streaming sketches of the songplays fact table.
+
+The ETL folds every loaded songplays batch into:
+
+* a HyperLogLog of user_ids per day, for daily active users. With the default
+  precision (p=14, 16 KiB per day) the relative standard error of a distinct
+  count is 1.04 / sqrt(2**14) ~= 0.8%. Days merge into week/month counts.
+* Space-Saving heavy-hitter summaries of song_id, artist_id and location over
+  all plays. For a summary of capacity k over N plays, each reported count
+  overestimates the true count by at most its `error`, and error <= N / k; every
+  item played more than N / k times is guaranteed to be reported.
+
+Sketches are stored in `etl_sketches` as (name, bucket) -> bytes and merged
+with the stored value on every update, so reading DAU or top-N costs the same
+however many plays have been loaded. Loaders merge a batch's sketches in the
+transaction that loads the batch (`load_batch(..., after=...)`), so sketches
+and songplays cannot drift apart after a crash.
+"""
+import json
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+SKETCH_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_sketches (
+        name varchar NOT NULL,
+        bucket varchar NOT NULL,
+        sketch bytea NOT NULL,
+        PRIMARY KEY (name, bucket)
+    )
+"""
+
+HLL_PRECISION = 14
+TOP_CAPACITY = 1000
+
+# Heavy-hitter sketches: sketch name -> songplays column
+TOP_SKETCHES = {'top_songs': 'song_id', 'top_artists': 'artist_id', 'top_locations': 'location'}
+ALL_TIME = 'all'
+
+def _leading_zeros(words):
+    """Count leading zero bits of each uint64."""
+    words = words.copy()
+    zeros = np.zeros(len(words), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = words < np.uint64(1 << (64 - shift))
+        zeros[empty] += shift
+        words[empty] <<= np.uint64(shift)
+    zeros[words == 0] += 1
+    return zeros
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 2**p one-byte registers."""
+
+    def __init__(self, p=HLL_PRECISION, registers=None):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8) if registers is None else registers
+
+    def add(self, values):
+        """Add an array of values (hashed with pandas' stable 64-bit hash)."""
+        hashes = pd.util.hash_array(np.asarray(values))
+        if not len(hashes):
+            return self
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        rank = np.minimum(_leading_zeros(hashes << np.uint64(self.p)) + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        """Return the sketch of the union of both inputs."""
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            estimate = m * np.log(m / empty)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(int(len(registers)).bit_length() - 1, registers)
+
+class SpaceSaving:
+    """Space-Saving heavy hitters: at most `capacity` items with (count, error)."""
+
+    def __init__(self, capacity=TOP_CAPACITY, counts=None, errors=None, total=0):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64') if counts is None else counts
+        self.errors = pd.Series(0, index=self.counts.index, dtype='int64') if errors is None else errors
+        self.total = total
+
+    @classmethod
+    def from_values(cls, values, capacity=TOP_CAPACITY):
+        """Summarize an array of items exactly, then trim to capacity; nulls are ignored."""
+        counts = pd.Series(values).dropna().astype(str).value_counts()
+        return cls(capacity, counts, None, int(counts.sum()))._trimmed()
+
+    def _floor(self):
+        """Upper bound on the count of any item not in the summary."""
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def _trimmed(self):
+        if len(self.counts) > self.capacity:
+            keep = self.counts.sort_values(ascending=False, kind='stable').index[:self.capacity]
+            self.counts, self.errors = self.counts[keep], self.errors[keep]
+        return self
+
+    def merge(self, other):
+        """Return the summary of both inputs (items missing from one side count as its floor)."""
+        index = self.counts.index.union(other.counts.index)
+        floor, other_floor = self._floor(), other._floor()
+        counts = self.counts.reindex(index, fill_value=floor) + other.counts.reindex(index, fill_value=other_floor)
+        errors = self.errors.reindex(index, fill_value=floor) + other.errors.reindex(index, fill_value=other_floor)
+        merged = SpaceSaving(max(self.capacity, other.capacity), counts.astype('int64'), errors.astype('int64'),
+                             self.total + other.total)
+        return merged._trimmed()
+
+    def top(self, n):
+        """Return [(item, count, error), ...] for the n largest counts."""
+        order = self.counts.sort_values(ascending=False, kind='stable').index[:n]
+        return [(item, int(self.counts[item]), int(self.errors[item])) for item in order]
+
+    def to_bytes(self):
+        return json.dumps({'capacity': self.capacity, 'total': self.total, 'items': self.counts.index.tolist(),
+                           'counts': self.counts.tolist(), 'errors': self.errors.tolist()}).encode()
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = json.loads(data)
+        index = pd.Index(state['items'], dtype=object)
+        return cls(state['capacity'], pd.Series(state['counts'], index=index, dtype='int64'),
+                   pd.Series(state['errors'], index=index, dtype='int64'), state['total'])
+
+SKETCH_TYPES = {'dau': HyperLogLog, **{name: SpaceSaving for name in TOP_SKETCHES}}
+
+def batch_sketches(songplays_df):
+    """Sketch one songplays batch: {(name, bucket): sketch}."""
+    sketches = {}
+    if songplays_df.empty:
+        return sketches
+    days = pd.to_datetime(songplays_df['start_time']).dt.strftime('%Y-%m-%d')
+    user_ids = songplays_df['user_id'].astype('int64').to_numpy()
+    for day, positions in days.groupby(days, sort=False).indices.items():
+        sketches[('dau', day)] = HyperLogLog().add(user_ids[positions])
+    for name, column in TOP_SKETCHES.items():
+        sketches[(name, ALL_TIME)] = SpaceSaving.from_values(songplays_df[column].to_numpy())
+    return sketches
+
+def ensure_sketch_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text(SKETCH_DDL))
+
+def merge_sketches(conn, sketches):
+    """Merge {(name, bucket): sketch} into the stored sketches within conn's transaction."""
+    names = sorted({name for name, _ in sketches})
+    buckets = sorted({bucket for _, bucket in sketches})
+    # Lock the rows being merged so concurrent loads cannot lose each other's updates
+    stored = conn.execute(text("""
+        SELECT name, bucket, sketch FROM etl_sketches
+        WHERE name = ANY(:names) AND bucket = ANY(:buckets)
+        FOR UPDATE
+    """), {'names': names, 'buckets': buckets}).all()
+    for name, bucket, data in stored:
+        if (name, bucket) in sketches:
+            sketches[(name, bucket)] = SKETCH_TYPES[name].from_bytes(bytes(data)).merge(sketches[(name, bucket)])
+    conn.execute(text("""
+        INSERT INTO etl_sketches (name, bucket, sketch) VALUES (:name, :bucket, :sketch)
+        ON CONFLICT (name, bucket) DO UPDATE SET sketch = EXCLUDED.sketch
+    """), [{'name': name, 'bucket': bucket, 'sketch': sketch.to_bytes()}
+           for (name, bucket), sketch in sketches.items()])
+
+def update_sketches(engine, songplays_df):
+    """Merge a loaded songplays batch into the stored sketches, in one transaction."""
+    sketches = batch_sketches(songplays_df)
+    if not sketches:
+        return 0
+    ensure_sketch_tables(engine)
+    with engine.begin() as conn:
+        merge_sketches(conn, sketches)
+    return len(sketches)
+
+def read_sketches(engine, name, buckets=None):
+    """Return {bucket: sketch} stored under name (all buckets unless given)."""
+    query = "SELECT bucket, sketch FROM etl_sketches WHERE name = :name"
+    params = {'name': name}
+    if buckets is not None:
+        query += " AND bucket = ANY(:buckets)"
+        params['buckets'] = list(buckets)
+    with engine.connect() as conn:
+        rows = conn.execute(text(query), params).all()
+    return {bucket: SKETCH_TYPES[name].from_bytes(bytes(data)) for bucket, data in rows}
+
+def daily_active_users(engine, days=None):
+    """Return [(day, approx distinct users), ...] for the last `days` days with plays (all when None)."""
+    counts = sorted((day, sketch.count()) for day, sketch in read_sketches(engine, 'dau').items())
+    return counts if days is None else counts[-days:]
+
+def top_items(engine, name, n):
+    """Return [(item, count, error), ...] from an all-time heavy-hitter sketch."""
+    sketch = read_sketches(engine, name, [ALL_TIME]).get(ALL_TIME)
+    return [] if sketch is None else sketch.top(n)
+
+def top_metrics(engine, limits):
+    """Top songs/artists/locations from the sketches, shaped like analytics.run_metrics rows.
+
+    limits maps sketch names (TOP_SKETCHES) to N; 'plays' are Space-Saving estimates.
+    """
+    if not limits:
+        return {}
+    results = {name: top_items(engine, name, limit) for name, limit in limits.items()}
+    with engine.connect() as conn:
+        if 'top_songs' in results:
+            ids = [item for item, _, _ in results['top_songs']]
+            names = {row[0]: row[1:] for row in conn.execute(text("""
+                SELECT s.song_id, s.title, a.name FROM songs s LEFT JOIN artists a ON s.artist_id = a.artist_id
+                WHERE s.song_id = ANY(:ids)
+            """), {'ids': ids})}
+            results['top_songs'] = [{'title': names[item][0], 'artist': names[item][1], 'plays': count}
+                                    for item, count, _ in results['top_songs'] if item in names]
+        if 'top_artists' in results:
+            ids = [item for item, _, _ in results['top_artists']]
+            names = dict(conn.execute(text("SELECT artist_id, name FROM artists WHERE artist_id = ANY(:ids)"),
+                                      {'ids': ids}).all())
+            results['top_artists'] = [{'name': names[item], 'plays': count}
+                                      for item, count, _ in results['top_artists'] if item in names]
+    if 'top_locations' in results:
+        results['top_locations'] = [{'location': item, 'plays': count} for item, count, _ in results['top_locations']]
+    return results
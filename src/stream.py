@@ -0,0 +1,270 @@
+"""
+Streaming ingestion of log_data.
+
+`run_stream` is a long-running alternative to the batch log load in run_etl: it
+watches LOG_DATA_PATH for new or appended NDJSON files and tails them from the
+byte offsets saved in `etl_stream_offsets`. Complete lines are collected into a
+micro-batch until STREAM_BATCH_ROWS events or STREAM_INTERVAL seconds, then run
+through transform_log_data and the song lookup like a batch chunk.
+
+Each micro-batch (time, users and their versions, songplays, sessions,
+quarantined rows, sketches and new offsets) commits in one transaction, so
+after a crash the stream resumes from the last committed batch without losing
+or duplicating events. A reader thread prepares batches while the loader
+commits them; at most STREAM_MAX_PENDING batches wait, after which the reader
+stops reading and unread events stay in the files until the database catches
+up.
+
+Songs are still loaded by run_etl; run either the stream or batch log loads
+against a log directory, not both.
+
+    PYTHONPATH=src python src/stream.py
+"""
+import bisect
+import io
+import os
+import queue
+import signal
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from config import (DATABASE_URL, LOG_DATA_PATH, SKETCHES, STREAM_INTERVAL, STREAM_BATCH_ROWS,
+                    STREAM_MAX_PENDING, VALIDATE)
+from extract import list_json_files
+from transform import transform_log_data
+from load import load_batch
+from lookup import SongLookup
+from schema import LOG_SCHEMA, apply_schema
+from rollups import refresh_rollups
+from query_cache import bump_generation
+from sketches import batch_sketches, ensure_sketch_tables, merge_sketches
+from sessions import build_sessions, ensure_sessions_table
+from validate import dimension_keys, ensure_quarantine_table, validate, validate_events
+from instrument import drain, measure
+from user_versions import ensure_user_versions_table
+from etl_pipeline import build_songplays, user_version_batch
+
+OFFSETS_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_stream_offsets (
+        path varchar PRIMARY KEY,
+        inode bigint NOT NULL,
+        position bigint NOT NULL,
+        updated_at timestamp NOT NULL DEFAULT now()
+    )
+"""
+
+POLL_SECONDS = 0.2
+READ_BLOCK_BYTES = 1 << 20
+# Songs loaded by batch runs meanwhile are picked up when the lookup is rebuilt
+LOOKUP_REFRESH_SECONDS = 300
+
+def ensure_offsets_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(OFFSETS_DDL))
+
+def load_offsets(engine):
+    """Return {path: (inode, position)} committed by earlier micro-batches."""
+    with engine.connect() as conn:
+        return {row[0]: (row[1], row[2]) for row in
+                conn.execute(text("SELECT path, inode, position FROM etl_stream_offsets"))}
+
+def save_offsets(conn, offsets):
+    if not offsets:
+        return
+    conn.execute(text("""
+        INSERT INTO etl_stream_offsets (path, inode, position, updated_at)
+        VALUES (:path, :inode, :position, now())
+        ON CONFLICT (path) DO UPDATE SET inode = EXCLUDED.inode, position = EXCLUDED.position,
+            updated_at = EXCLUDED.updated_at
+    """), [{'path': path, 'inode': inode, 'position': position}
+           for path, (inode, position) in offsets.items()])
+
+class LogTailer:
+    """Reads the complete NDJSON lines appended to the files under a directory since its offsets."""
+
+    def __init__(self, directory, offsets=None):
+        self.directory = directory
+        self.offsets = dict(offsets or {})  # path -> (inode, byte position after the last line read)
+        self._resume = None  # file the last read filled max_rows in; the next read starts after it
+
+    def _start(self, path, st):
+        inode, position = self.offsets.get(path, (st.st_ino, 0))
+        if inode != st.st_ino or position > st.st_size:
+            return 0  # replaced or truncated: read it again from the start
+        return position
+
+    def read(self, max_rows, block_size=READ_BLOCK_BYTES):
+        """Return (data, rows): up to max_rows new lines, advancing the offsets past them.
+
+        A trailing line without its newline is still being written and is left for a later read.
+        Files are visited round robin: when max_rows is reached, the next read starts with the
+        file after the one that filled it, so a file appended faster than max_rows per read
+        cannot starve the others.
+        """
+        pieces, rows = [], 0
+        files = sorted(list_json_files(self.directory))
+        start = 0 if self._resume is None else bisect.bisect_right(files, self._resume)
+        self._resume = None
+        for path in files[start:] + files[:start]:
+            if rows >= max_rows:
+                break
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            position = self._start(path, st)
+            if position < st.st_size:
+                with open(path, 'rb') as f:
+                    f.seek(position)
+                    buf = b''
+                    while rows < max_rows:
+                        block = f.read(block_size)
+                        if not block:
+                            break
+                        buf += block
+                        complete = buf.rfind(b'\n') + 1
+                        if not complete:
+                            continue
+                        newlines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8, count=complete) == ord('\n'))
+                        take = min(len(newlines), max_rows - rows)
+                        end = int(newlines[take - 1]) + 1
+                        pieces.append(buf[:end])
+                        rows += take
+                        position += end
+                        buf = buf[end:]
+            self.offsets[path] = (st.st_ino, position)
+            if rows >= max_rows:
+                self._resume = path
+        return b''.join(pieces), rows
+
+def parse_lines(data):
+    """Parse NDJSON bytes into a raw log frame with the batch extract's schema; blank lines are skipped."""
+    if b'\n\n' in data or data[:1] == b'\n':
+        data = b'\n'.join(line for line in data.split(b'\n') if line.strip())
+    if not data.strip():
+        return pd.DataFrame()
+    return apply_schema(pd.read_json(io.BytesIO(data), lines=True), LOG_SCHEMA)
+
+def _put(q, item, abort):
+    """Blocking put that gives up (returning False) once the loader has failed."""
+    while not abort.is_set():
+        try:
+            q.put(item, timeout=POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def read_batches(tailer, batches, stop, abort, interval=STREAM_INTERVAL, batch_rows=STREAM_BATCH_ROWS):
+    """Reader thread: queue (data, rows, offsets, first_read_at) micro-batches until stop, then None.
+
+    The put blocks while the queue is full, so nothing more is read until the loader catches up.
+    """
+    pending, rows, first_at = [], 0, None
+    while not stop.is_set():
+        data, n = tailer.read(batch_rows - rows)
+        if n:
+            pending.append(data)
+            rows += n
+            first_at = first_at or time.monotonic()
+        if rows and (rows >= batch_rows or time.monotonic() - first_at >= interval):
+            if not _put(batches, (b''.join(pending), rows, dict(tailer.offsets), first_at), abort):
+                return
+            pending, rows, first_at = [], 0, None
+        elif not n:
+            stop.wait(POLL_SECONDS)
+    # Events already read are committed before stopping; the rest stay in the files
+    if rows and not _put(batches, (b''.join(pending), rows, dict(tailer.offsets), first_at), abort):
+        return
+    _put(batches, None, abort)
+
+def commit_batch(engine, lookup, data, offsets, known=None):
+    """Transform and load one micro-batch together with its offsets; returns the songplays loaded.
+
+    With VALIDATE, rejected events, and songplays referencing songs or artists not in `known`
+    (see dimension_keys), are quarantined in the same transaction. A play whose artist never
+    loaded would otherwise fail every retry of the batch from the same offsets.
+    """
+    raw = parse_lines(data)
+    frames, sketches = [], {}
+    songplays = 0
+    if VALIDATE and not raw.empty:
+        raw, rejected = validate_events(raw)
+        frames.append(('etl_quarantine', rejected))
+    if not raw.empty:
+        time_df, user_df, log_df = transform_log_data(raw)
+        versions, changed = user_version_batch(log_df, engine)
+        songplays_df = build_songplays(log_df, lookup, versions)
+        if VALIDATE:
+            songplays_df, rejected = validate(songplays_df, 'songplays', known)
+            frames.append(('etl_quarantine', rejected))
+        frames += [('time', time_df), ('users', user_df), ('user_versions', changed),
+                   ('songplays', songplays_df), ('sessions', build_sessions(songplays_df))]
+        sketches = batch_sketches(songplays_df) if SKETCHES else {}
+        songplays = len(songplays_df)
+
+    def finish(conn):
+        if sketches:
+            merge_sketches(conn, sketches)
+        save_offsets(conn, offsets)
+
+    load_batch(frames, engine, after=finish)
+    return songplays
+
+def run_stream(interval=STREAM_INTERVAL, batch_rows=STREAM_BATCH_ROWS, max_pending=STREAM_MAX_PENDING,
+               directory=LOG_DATA_PATH, stop=None):
+    """Tail directory until stop is set (SIGINT/SIGTERM when run as a script); returns batches committed."""
+    engine = create_engine(DATABASE_URL, pool_size=2)
+    stop = threading.Event() if stop is None else stop
+    ensure_offsets_table(engine)
+    ensure_sessions_table(engine)
+    ensure_user_versions_table(engine)
+    if SKETCHES:
+        ensure_sketch_tables(engine)
+    if VALIDATE:
+        ensure_quarantine_table(engine)
+    lookup, lookup_at = SongLookup.from_db(engine), time.monotonic()
+    known = dimension_keys(engine) if VALIDATE else {}
+    tailer = LogTailer(directory, load_offsets(engine))
+    batches = queue.Queue(maxsize=max(1, max_pending))
+    abort = threading.Event()
+    reader = threading.Thread(target=read_batches, args=(tailer, batches, stop, abort, interval, batch_rows),
+                              name='stream-reader', daemon=True)
+    reader.start()
+    committed = 0
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            data, rows, offsets, first_at = item
+            if time.monotonic() - lookup_at >= LOOKUP_REFRESH_SECONDS:
+                lookup, lookup_at = SongLookup.from_db(engine), time.monotonic()
+                known = dimension_keys(engine) if VALIDATE else {}
+            with measure('stream.batch', batch=committed, rows_in=rows, queued=batches.qsize()) as record:
+                songplays = commit_batch(engine, lookup, data, offsets, known)
+                refresh_rollups(engine)
+                bump_generation(engine)
+                record['rows_out'] = songplays
+                record['lag_s'] = round(time.monotonic() - first_at, 3)
+            print(f"[stream] batch {committed}: {rows:,} events -> {songplays:,} songplays, "
+                  f"{record['lag_s']:.2f}s after read, {batches.qsize()}/{batches.maxsize} queued")
+            committed += 1
+            drain()  # a long-running process must not accumulate metrics (ETL_METRICS_PATH keeps them)
+    except BaseException:
+        abort.set()
+        raise
+    finally:
+        stop.set()
+        reader.join()
+        engine.dispose()
+    return committed
+
+if __name__ == "__main__":
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print(f"[stream] tailing {LOG_DATA_PATH} (batches of {STREAM_BATCH_ROWS:,} events or {STREAM_INTERVAL}s)")
+    run_stream(stop=stop)
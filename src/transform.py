@@ -1,5 +1,11 @@
+import numpy as np
 import pandas as pd
+from instrument import instrumented
 
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 86_400_000
+
+@instrumented('transform.songs')
 def transform_song_data(df):
     song_cols = ['song_id', 'title', 'artist_id', 'year', 'duration']
     artist_cols = ['artist_id', 'artist_name', 'artist_location', 'artist_latitude', 'artist_longitude']
@@ -10,16 +16,88 @@ def transform_song_data(df):
     
     return songs_df, artists_df
 
-def transform_log_data(df):
+def civil_from_days(days):
+    """Convert int64 days since 1970-01-01 to (year, month, day) arrays (proleptic Gregorian)."""
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+def days_from_civil(year, month, day):
+    """Inverse of civil_from_days."""
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def build_calendar(first_day, last_day):
+    """Precompute date-level attributes for every epoch day in [first_day, last_day]."""
+    days = np.arange(first_day, last_day + 1, dtype='int64')
+    year, month, day = civil_from_days(days)
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday; Monday == 0
+    # ISO week: the week containing the Thursday, numbered within that Thursday's year
+    thursday = days - weekday + 3
+    iso_year, _, _ = civil_from_days(thursday)
+    week = (thursday - days_from_civil(iso_year, 1, 1)) // 7 + 1
+    return pd.DataFrame({
+        'day': day.astype('int8'),
+        'week': week.astype('int8'),
+        'month': month.astype('int8'),
+        'year': year.astype('int16'),
+        'weekday': weekday.astype('int8'),
+    }, index=pd.Index(days, name='epoch_day'))
+
+def build_time_table(ts_ms, calendar=None):
+    """Build the time dimension from epoch-ms values, deriving attributes once per unique timestamp.
+
+    Date-level attributes come from `calendar` (see build_calendar) when it covers the range,
+    otherwise a calendar spanning just these days is computed.
+    """
+    ms = np.unique(np.asarray(ts_ms, dtype='int64'))
+    days = ms // MS_PER_DAY
+    if not len(ms):
+        calendar = build_calendar(0, -1)
+    elif calendar is None or not len(calendar) or days[0] < calendar.index[0] or days[-1] > calendar.index[-1]:
+        calendar = build_calendar(days[0], days[-1])
+    dates = calendar.iloc[days - calendar.index[0]] if len(ms) else calendar
+    return pd.DataFrame({
+        'start_time': ms.astype('datetime64[ms]'),
+        'hour': ((ms // MS_PER_HOUR) % 24).astype('int8'),
+        'day': dates['day'].to_numpy(),
+        'week': dates['week'].to_numpy(),
+        'month': dates['month'].to_numpy(),
+        'year': dates['year'].to_numpy(),
+        'weekday': dates['weekday'].to_numpy(),
+    })
+
+@instrumented('transform.logs')
+def transform_log_data(df, calendar=None):
     df = df[df['page'] == 'NextSong'].copy()
+    time_df = build_time_table(df['ts'].to_numpy(dtype='int64'), calendar)
     df['ts'] = pd.to_datetime(df['ts'], unit='ms')
     
-    t = df['ts']
-    time_data = (t, t.dt.hour, t.dt.day, t.dt.isocalendar().week, t.dt.month, t.dt.year, t.dt.weekday)
-    column_labels = ('start_time', 'hour', 'day', 'week', 'month', 'year', 'weekday')
-    time_df = pd.DataFrame(dict(zip(column_labels, time_data))).drop_duplicates()
-    
-    user_df = df[['userId', 'firstName', 'lastName', 'gender', 'level']].drop_duplicates()
-    user_df.columns = ['user_id', 'first_name', 'last_name', 'gender', 'level']
+    # One row per user, taken from their most recent event so the newest level wins; level_ts
+    # keeps that event's time so a row from an older file cannot overwrite a newer level
+    latest = df.loc[df.groupby('userId')['ts'].idxmax()]
+    user_df = latest[['userId', 'firstName', 'lastName', 'gender', 'level', 'ts']]
+    user_df.columns = ['user_id', 'first_name', 'last_name', 'gender', 'level', 'level_ts']
     
-    return time_df, user_df, df
\ No newline at end of file
+    return time_df, user_df, df
+
+def transform_log_chunks(chunks, calendar=None):
+    """Apply transform_log_data to each raw chunk, sharing an optional precomputed calendar.
+
+    Nothing is remembered between chunks, so peak memory stays bounded by the chunk size: a
+    user or timestamp seen by several chunks is emitted by each of them, and the loader merges
+    the time and users rows across chunks with ON CONFLICT (see load_logs in etl_pipeline).
+    """
+    for df in chunks:
+        yield transform_log_data(df, calendar)
@@ -0,0 +1,167 @@
+"""
+Type-2 history of the users dimension.
+
+`users` holds one current row per user (the newest level wins); `user_versions`
+keeps every version of a user's attributes with the interval it was valid,
+[valid_from, valid_to), and valid_to NULL for the current version. Versions are
+derived from each log batch with one sort by (user_id, ts) and a diff of the
+attribute codes against the previous event: a row starts a version when the
+user or any attribute changes.
+
+Each version also records `last_seen`, its latest observed event. A batch's
+events are merged with the stored history of the same users in memory, each
+stored version counting as an observation of its attributes at valid_from and
+at last_seen. So a late event that changes the attributes inside a stored
+version only holds until the stored attributes are next observed, where they
+resume as a new version. Stored versions are never removed, so the version keys
+already written to songplays stay valid even when events arrive out of order;
+only valid_to and last_seen move.
+
+The new and changed versions are then upserted with one statement per batch,
+and each songplay gets the `user_valid_from` of the version in effect when it
+was played, found with an as-of join on (user_id, ts).
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+USER_VERSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS user_versions (
+        user_id int NOT NULL,
+        first_name varchar,
+        last_name varchar,
+        gender varchar,
+        level varchar,
+        valid_from timestamp NOT NULL,
+        valid_to timestamp,
+        last_seen timestamp,
+        PRIMARY KEY (user_id, valid_from)
+    )
+"""
+
+ATTRIBUTES = ['first_name', 'last_name', 'gender', 'level']
+VERSION_COLUMNS = ['user_id'] + ATTRIBUTES + ['valid_from', 'valid_to', 'last_seen']
+
+# Log event column -> user_versions column
+EVENT_COLUMNS = {'userId': 'user_id', 'firstName': 'first_name', 'lastName': 'last_name', 'gender': 'gender',
+                 'level': 'level', 'ts': 'valid_from'}
+
+def ensure_user_versions_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(USER_VERSIONS_DDL))
+
+def _user_ids(values):
+    """userId values as float64 user ids (NaN if not numeric), parsed once per distinct value."""
+    codes, uniques = pd.factorize(pd.Series(values).to_numpy())
+    parsed = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype='float64')
+    return np.append(parsed, np.nan)[codes]
+
+def _starts(rows):
+    """Rows (sorted by user_id, valid_from) whose user or attributes differ from the previous row's."""
+    starts = np.ones(len(rows), dtype=bool)
+    if len(rows) > 1:
+        user_ids = rows['user_id'].to_numpy()
+        changed = user_ids[1:] != user_ids[:-1]
+        for column in ATTRIBUTES:
+            codes = pd.factorize(rows[column])[0]  # missing values share code -1
+            changed |= codes[1:] != codes[:-1]
+        starts[1:] = changed
+    return starts
+
+def _with_valid_to(versions):
+    """Set valid_to to the next version's valid_from of the same user (NaT for the current one)."""
+    versions = versions.reset_index(drop=True)
+    following = versions['valid_from'].shift(-1)
+    same_user = versions['user_id'].eq(versions['user_id'].shift(-1))
+    versions['valid_to'] = following.where(same_user)
+    return versions
+
+def _collapse(rows, keys):
+    """Collapse observations (sorted by user_id, valid_from) into versions with their last_seen.
+
+    A row starts a version when keys marks it or its user or attributes differ from the previous row's.
+    """
+    starts = keys | _starts(rows)
+    versions = rows[starts].reset_index(drop=True)
+    versions['last_seen'] = rows['valid_from'].groupby(np.cumsum(starts)).max().to_numpy()
+    return _with_valid_to(versions)
+
+def user_events(log_df):
+    """A batch of NextSong events as one-event versions (sorted by user_id, valid_from)."""
+    if log_df.empty:
+        return pd.DataFrame(columns=VERSION_COLUMNS)
+    rows = log_df[list(EVENT_COLUMNS)].rename(columns=EVENT_COLUMNS)
+    rows['user_id'] = _user_ids(rows['user_id'])
+    rows = rows.dropna(subset=['user_id']).astype({'user_id': 'int64'})
+    rows['valid_from'] = pd.to_datetime(rows['valid_from'])
+    rows = rows.sort_values(['user_id', 'valid_from'], kind='stable').reset_index(drop=True)
+    return rows.assign(valid_to=pd.NaT, last_seen=rows['valid_from'])[VERSION_COLUMNS]
+
+def build_user_versions(log_df):
+    """Collapse a batch of NextSong events into user versions."""
+    rows = user_events(log_df)
+    if rows.empty:
+        return rows
+    return _collapse(rows, np.zeros(len(rows), dtype=bool))[VERSION_COLUMNS]
+
+def read_user_versions(engine, user_ids):
+    """Stored versions of the given users."""
+    ids = [int(i) for i in pd.unique(np.asarray(user_ids))]
+    if not ids:
+        return pd.DataFrame(columns=VERSION_COLUMNS)
+    query = f"SELECT {', '.join(VERSION_COLUMNS)} FROM user_versions WHERE user_id = ANY(:ids)"
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params={'ids': ids})
+
+def _observations(versions, stored):
+    """Each version's attributes observed at its valid_from and at its last_seen."""
+    versions = versions.astype({'user_id': 'int64'})
+    valid_from = pd.to_datetime(versions['valid_from'])
+    # Versions written before last_seen was recorded were at least observed at their start
+    last_seen = pd.to_datetime(versions['last_seen']).fillna(valid_from)
+    rows = versions[['user_id'] + ATTRIBUTES].assign(
+        stored=stored, stored_to=pd.to_datetime(versions['valid_to']) if stored else pd.NaT,
+        stored_seen=last_seen if stored else pd.NaT)
+    return [rows.assign(valid_from=valid_from, key=stored), rows.assign(valid_from=last_seen, key=False)]
+
+def _differs(a, b):
+    return ~((a == b) | (a.isna() & b.isna()))
+
+def merge_user_versions(stored, batch):
+    """Merge batch versions (or the batch's user_events) into the stored history of the same users.
+
+    Returns (versions, changed): the full merged history, for resolving songplays, and the
+    new, re-bounded or extended versions that have to be written. Stored versions are always
+    kept; otherwise a version starts wherever the attributes differ from the observation
+    before it. Only plays that are observations of the merge (the batch's user_events, not
+    just its collapsed versions) are certain to resolve to a version with their attributes.
+    """
+    if batch.empty:
+        return stored, stored.iloc[:0]
+    observed = pd.concat(_observations(stored, True) + _observations(batch, False), ignore_index=True)
+    observed = observed.sort_values(['user_id', 'valid_from', 'stored', 'key'],
+                                    ascending=[True, True, False, False], kind='stable')
+    # A batch observation at the same instant as a stored one keeps the stored attributes and key
+    observed = observed[~observed.duplicated(['user_id', 'valid_from'], keep='first')]
+    merged = _collapse(observed, observed['key'].to_numpy())
+    changed = merged[~merged['key'] | _differs(merged['valid_to'], merged['stored_to'])
+                     | _differs(merged['last_seen'], merged['stored_seen'])]
+    return merged[VERSION_COLUMNS], changed[VERSION_COLUMNS].reset_index(drop=True)
+
+def resolve_user_versions(user_ids, start_times, versions):
+    """As-of join: the valid_from of each play's user version (NaT if the user has none)."""
+    plays = pd.DataFrame({'user_id': _user_ids(user_ids),
+                          'start_time': pd.to_datetime(np.asarray(start_times)),
+                          'position': np.arange(len(user_ids))})
+    known = plays['user_id'].notna()
+    result = np.full(len(plays), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if not known.any() or versions.empty:
+        return result
+    plays = plays[known].astype({'user_id': 'int64'}).sort_values('start_time', kind='stable')
+    keys = versions[['user_id', 'valid_from']].astype({'user_id': 'int64'})
+    keys = keys.assign(valid_from=pd.to_datetime(keys['valid_from']).astype('datetime64[ns]'))
+    plays['start_time'] = plays['start_time'].astype('datetime64[ns]')
+    matched = pd.merge_asof(plays, keys.sort_values('valid_from', kind='stable'), left_on='start_time',
+                            right_on='valid_from', by='user_id', direction='backward')
+    result[matched['position'].to_numpy()] = matched['valid_from'].to_numpy(dtype='datetime64[ns]')
+    return result
@@ -0,0 +1,198 @@
+"""
+Row-level data-quality validation between transform and load.
+
+Each table has a list of checks (types, nullability, value ranges and
+references to dimension keys that actually committed). A check is
+one vectorized expression over the whole batch returning the rows that fail
+it. `validate` splits a frame into the rows that pass every check and a
+quarantine frame holding the others as JSON with their reason codes (e.g.
+'type:userId,range:ts'), which `quarantine` loads into `etl_quarantine`. A bad
+record therefore costs one quarantined row instead of a failed table load.
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from load import load_to_db
+from instrument import measure
+
+QUARANTINE_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_quarantine (
+        id bigserial PRIMARY KEY,
+        table_name varchar NOT NULL,
+        reasons varchar NOT NULL,
+        record jsonb NOT NULL,
+        quarantined_at timestamp NOT NULL DEFAULT now()
+    )
+"""
+
+QUARANTINE_COLUMNS = ['table_name', 'reasons', 'record']
+
+INT_MAX = 2**31 - 1
+# Event timestamps (epoch ms) before 2100-01-01
+MAX_TS = 4_102_444_800_000
+
+# failed(df, known) -> boolean array of the rows violating the check
+Check = namedtuple('Check', ['reason', 'failed'])
+
+def _textual(values):
+    return pd.api.types.is_string_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype)
+
+# Log columns repeat a few distinct values many times, so strings are parsed once per distinct value
+def _numeric(values):
+    """Values as float64 (NaN where missing or not a number)."""
+    if not _textual(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype='float64')
+    return pd.Series(np.append(parsed, np.nan)[codes], index=values.index)
+
+def _blank(values):
+    """Boolean array of the empty or whitespace-only strings."""
+    if not _textual(values):
+        return np.zeros(len(values), dtype=bool)
+    codes, uniques = pd.factorize(values)
+    blank = pd.Series(uniques, dtype='string').str.strip().eq('').fillna(False).to_numpy(dtype=bool)
+    return np.append(blank, False)[codes]
+
+def not_null(column):
+    """Values must be present and, for strings, not blank."""
+    def failed(df, known):
+        return df[column].isna().to_numpy(dtype=bool) | _blank(df[column])
+    return Check(f"null:{column}", failed)
+
+def _digits(values):
+    """Boolean array of the strings that are plain unsigned integers (surrounding whitespace ignored)."""
+    codes, uniques = pd.factorize(values)
+    digits = pd.Series(uniques, dtype='string').str.strip().str.fullmatch('[0-9]+').fillna(False)
+    return np.append(digits.to_numpy(dtype=bool), False)[codes]
+
+def integer(column):
+    """Present values must be whole numbers; strings only as plain digits ('7.0' or '1e1' fail)."""
+    def failed(df, known):
+        values = df[column]
+        present = values.notna().to_numpy(dtype=bool) & ~_blank(values)
+        if _textual(values):
+            return present & ~_digits(values)
+        return present & (values % 1 != 0).to_numpy(dtype=bool)
+    return Check(f"type:{column}", failed)
+
+def between(column, low=None, high=None, low_inclusive=True):
+    """Present numeric values must lie within [low, high] (or (low, high] without low_inclusive)."""
+    def failed(df, known):
+        values = _numeric(df[column])
+        bad = pd.Series(False, index=df.index)
+        if low is not None:
+            bad |= values < low if low_inclusive else values <= low
+        if high is not None:
+            bad |= values > high
+        return bad.to_numpy(dtype=bool)
+    return Check(f"range:{column}", failed)
+
+def one_of(column, allowed):
+    """Present values must be one of allowed."""
+    def failed(df, known):
+        values = df[column]
+        return (values.notna() & ~values.isin(allowed)).to_numpy(dtype=bool)
+    return Check(f"value:{column}", failed)
+
+def references(column, dimension):
+    """Present values must be keys of the dimension in `known`; skipped when it is not given."""
+    def failed(df, known):
+        if known is None or dimension not in known:
+            return np.zeros(len(df), dtype=bool)
+        values = df[column]
+        return (values.notna() & ~values.isin(known[dimension])).to_numpy(dtype=bool)
+    return Check(f"ref:{dimension}", failed)
+
+RULES = {
+    'songs': [
+        not_null('song_id'), not_null('title'),
+        integer('year'), between('year', 0, 2100),
+        between('duration', 0, low_inclusive=False),
+    ],
+    'artists': [
+        not_null('artist_id'), not_null('name'),
+        between('latitude', -90, 90), between('longitude', -180, 180),
+    ],
+    # Raw NextSong log events, checked before the time/users/songplays frames are derived from them
+    'events': [
+        not_null('userId'), integer('userId'), between('userId', 1, INT_MAX),
+        not_null('ts'), integer('ts'), between('ts', 0, MAX_TS),
+        not_null('sessionId'), integer('sessionId'), between('sessionId', 0, INT_MAX),
+        one_of('level', ['free', 'paid']),
+        between('length', 0, low_inclusive=False),
+    ],
+    # Songplays are built from the song lookup and the batch's own time/users rows, so these
+    # only reject plays whose song, artist or dimension rows did not load (which would
+    # otherwise fail the whole songplays load on its foreign keys)
+    'songplays': [
+        references('start_time', 'time'), references('user_id', 'users'),
+        references('song_id', 'songs'), references('artist_id', 'artists'),
+    ],
+}
+
+def dimension_keys(engine):
+    """Song and artist keys songplays may reference: {dimension: Index}, read from what committed.
+
+    The song lookup is not enough: a kept song can name an artist whose row was quarantined.
+    """
+    with engine.connect() as conn:
+        return {dimension: pd.Index(conn.execute(text(f"SELECT {key} FROM {dimension}")).scalars().all())
+                for dimension, key in (('songs', 'song_id'), ('artists', 'artist_id'))}
+
+def unloaded_keys(dimensions):
+    """Known keys for dimensions whose batch load failed: none, so every play referencing them is rejected."""
+    return {dimension: pd.Index([]) for dimension in dimensions}
+
+def quarantine_frame(df, table, reasons):
+    """Rows of df as JSON records tagged with their table and reason codes."""
+    if df.empty:
+        return pd.DataFrame(columns=QUARANTINE_COLUMNS)
+    records = df.to_json(orient='records', lines=True, date_format='iso', default_handler=str).splitlines()
+    return pd.DataFrame({'table_name': table, 'reasons': reasons, 'record': records})
+
+def validate(df, table, known=None):
+    """Split df into (valid rows, quarantine frame) by the checks in RULES[table]."""
+    checks = RULES[table]
+    with measure(f"validate.{table}", rows_in=len(df)) as record:
+        if df.empty:
+            record['rows_out'] = 0
+            return df, quarantine_frame(df, table, [])
+        failures = np.column_stack([check.failed(df, known) for check in checks])
+        bad = failures.any(axis=1)
+        record['rows_out'] = int(len(df) - bad.sum())
+        if not bad.any():
+            return df, quarantine_frame(df.iloc[:0], table, [])
+        codes = np.array([check.reason for check in checks], dtype=object)
+        reasons = [','.join(codes[row]) for row in failures[bad]]
+        record['quarantined'] = len(reasons)
+        return df[~bad], quarantine_frame(df[bad], table, reasons)
+
+def validate_events(df):
+    """Validate the NextSong events of a raw log chunk; other pages are dropped as transform would.
+
+    userId is read as text (see LOG_SCHEMA); valid events get it as int64, so only values the
+    checks accepted reach the int user_id columns.
+    """
+    if 'page' in df.columns:
+        df = df[df['page'] == 'NextSong']
+    valid, rejected = validate(df, 'events')
+    if len(valid) and _textual(valid['userId']):
+        valid = valid.assign(userId=_numeric(valid['userId']).astype('int64'))
+    return valid, rejected
+
+def ensure_quarantine_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(QUARANTINE_DDL))
+
+def quarantine(engine, *frames):
+    """Load quarantine frames into etl_quarantine; returns the number of rows quarantined."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return 0
+    df = pd.concat(frames, ignore_index=True)
+    counts = pd.Series(df['reasons'].str.split(',').explode()).value_counts()
+    print(f"Quarantined {len(df):,} row(s): " + ', '.join(f"{reason} x{n}" for reason, n in counts.items()))
+    load_to_db(df, 'etl_quarantine', engine)
+    return len(df)
@@ -0,0 +1,62 @@
+"""
+Tests for the Shared Analytics Query Engine
+"""
+import pytest
+import pandas as pd
+from sqlalchemy import create_engine
+from analytics import METRICS, build_plan, build_plans, run_metrics
+
+
+class TestBuildPlan:
+    """Tests for single-pass metric planning."""
+
+    def test_one_grouping_set_per_metric(self):
+        """Test that all metrics share one statement and one songplays scan."""
+        plan = build_plan(['hourly_plays', 'weekday_plays', 'top_songs'])
+        assert plan.sql.count('FROM songplays') == 1
+        assert "GROUPING SETS ((t.hour), (t.weekday), (s.title, a.name))" in plan.sql
+        assert sorted(n for names in plan.groups.values() for n in names) == \
+            ['hourly_plays', 'top_songs', 'weekday_plays']
+
+    def test_only_needed_dimensions_are_joined(self):
+        """Test that location metrics do not join any dimension table."""
+        plan = build_plan(['top_locations', 'level_plays'])
+        assert 'JOIN' not in plan.sql
+
+    def test_null_levels_are_counted(self):
+        """Test that plays without a level keep their own row while NULL locations are dropped."""
+        pytest.importorskip('duckdb_engine')
+        engine = create_engine('duckdb:///:memory:')
+        pd.DataFrame({'songplay_id': [1, 2, 3], 'level': ['free', None, 'free'],
+                      'location': ['NY', None, 'NY']}).to_sql('songplays', engine, index=False)
+        metrics = run_metrics(engine, ['level_plays', 'top_locations'], source='fact')
+        assert {row['level']: row['plays'] for row in metrics['level_plays']} == {'free': 2, None: 1}
+        assert [(row['location'], row['plays']) for row in metrics['top_locations']] == [('NY', 2)]
+
+    def test_limits_are_bound_per_metric(self):
+        """Test that top-N limits are parameters, with overrides."""
+        plan = build_plan(['top_songs', 'top_artists'], {'top_songs': 3})
+        assert plan.params == {'limit_top_songs': 3, 'limit_top_artists': 10}
+
+    def test_group_ids_are_distinct(self):
+        """Test that each metric maps to its own GROUPING() id."""
+        plan = build_plan(['hourly_plays', 'weekday_plays', 'top_users', 'totals'])
+        assert len(plan.groups) == 4
+        assert plan.groups[max(plan.groups)] == ['totals']
+
+
+class TestRollupPlans:
+    """Tests for answering metrics from the rollup tables."""
+
+    def test_metrics_grouped_by_rollup(self):
+        """Test that each rollup is scanned once and the fact table not at all."""
+        plans = build_plans(list(METRICS), source='rollup')
+        assert len(plans) == 3
+        assert not any('FROM songplays' in plan.sql for plan in plans)
+
+    def test_hourly_rollup_needs_no_joins(self):
+        """Test that time/location metrics read the hourly rollup directly."""
+        plan, = build_plans(['hourly_plays', 'top_locations', 'totals'], source='rollup')
+        assert 'FROM rollup_plays_hourly r' in plan.sql
+        assert 'JOIN' not in plan.sql
+        assert 'SUM(r.duration)' in plan.sql
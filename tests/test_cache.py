@@ -0,0 +1,52 @@
+"""
+Tests for the Parquet Extract Cache
+"""
+import json
+import os
+import pytest
+import pandas as pd
+from cache import iter_cached_chunks, partition_key, read_cache, refresh_cache
+from schema import LOG_SCHEMA
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    """Write two days of events."""
+    root = tmp_path / 'log_data'
+    root.mkdir()
+    for day in (1, 2):
+        lines = [json.dumps({"ts": 1541030400000 + day * 86400000 + i, "page": "NextSong",
+                             "level": "free", "userId": "8"}) for i in range(3)]
+        (root / f"2018-11-0{day}-events.json").write_text("\n".join(lines))
+    return root
+
+
+class TestExtractCache:
+    """Tests for partitioned Parquet caching of raw extracts."""
+
+    def test_partitions_by_date(self, log_dir):
+        """Test that dated log files get one partition per day."""
+        assert partition_key(str(log_dir / '2018-11-01-events.json'), str(log_dir)) == 'root_date=2018-11-01'
+
+    def test_read_matches_source(self, log_dir, tmp_path):
+        """Test that cached data has the same rows and typed columns."""
+        df = read_cache(str(log_dir), LOG_SCHEMA, cache_dir=str(tmp_path / 'cache'))
+        assert len(df) == 6
+        assert isinstance(df['level'].dtype, pd.CategoricalDtype)
+
+    def test_column_pruning(self, log_dir, tmp_path):
+        """Test that only requested columns are read back."""
+        df = read_cache(str(log_dir), LOG_SCHEMA, columns=['ts', 'missing'], cache_dir=str(tmp_path / 'cache'))
+        assert list(df.columns) == ['ts']
+
+    def test_changed_file_invalidates_its_partition(self, log_dir, tmp_path):
+        """Test that editing one file rebuilds only its partition."""
+        cache_dir = str(tmp_path / 'cache')
+        first = refresh_cache(str(log_dir), LOG_SCHEMA, cache_dir)
+        with open(log_dir / '2018-11-02-events.json', 'a') as f:
+            f.write("\n" + json.dumps({"ts": 1541203200999, "page": "NextSong", "level": "paid", "userId": "8"}))
+        second = refresh_cache(str(log_dir), LOG_SCHEMA, cache_dir)
+        assert first[0] == second[0]
+        assert first[1] != second[1]
+        assert not os.path.exists(first[1])
+        assert sum(len(c) for c in iter_cached_chunks(str(log_dir), 2, LOG_SCHEMA, cache_dir=cache_dir)) == 7
@@ -4,8 +4,8 @@ Tests for EDA Analysis Module
 import pytest
 import pandas as pd
 from sqlalchemy import create_engine, text
-from src.config import DATABASE_URL
-from src.eda_analysis import (
+from config import DATABASE_URL
+from eda_analysis import (
     connect_to_db,
     load_table,
     basic_stats,
@@ -15,6 +15,9 @@ from src.eda_analysis import (
     listening_patterns,
     user_engagement,
     location_insights,
+    user_summary,
+    song_summary,
+    artist_summary,
     run_eda
 )
 
@@ -153,6 +156,40 @@ class TestEDAFunctions:
         assert "GEOGRAPHIC INSIGHTS" in captured.out
 
 
+class TestSummaries:
+    """Tests for server-side summaries and their DataFrame fallbacks."""
+    
+    def test_user_summary_sql_matches_frame(self, engine):
+        """Test that the SQL aggregate equals the DataFrame computation."""
+        users = load_table(engine, 'users')
+        assert user_summary(engine) == user_summary(None, users)
+    
+    def test_song_summary_sql_matches_frame(self, engine):
+        """Test that song stats agree between SQL and DataFrame paths."""
+        songs = load_table(engine, 'songs')
+        total, min_year, max_year, _, _ = song_summary(engine)
+        assert (total, min_year, max_year) == song_summary(None, songs)[:3]
+    
+    def test_artist_summary_sql_matches_frame(self, engine):
+        """Test that artist stats agree between SQL and DataFrame paths."""
+        artists = load_table(engine, 'artists')
+        assert artist_summary(engine)[:3] == artist_summary(None, artists)[:3]
+    
+    def test_offline_analysis_from_frames(self, capsys):
+        """Test that analyses run from DataFrames without a database."""
+        users = pd.DataFrame({'user_id': [8, 9, 10], 'gender': ['F', 'M', 'F'], 'level': ['free', 'paid', 'free']})
+        songs = pd.DataFrame({'title': ['The Ocean', 'Soul Deep'], 'year': [1982, 0], 'duration': [235.4, 148.0]})
+        artists = pd.DataFrame({'name': ['Gipsy Kings'], 'location': [''], 'latitude': [None]})
+        user_analysis(None, users)
+        song_analysis(None, songs)
+        artist_analysis(None, artists)
+        out = capsys.readouterr().out
+        assert "Female: 2 (66.7%)" in out
+        assert "Oldest Song Year: 1982" in out
+        assert "Soul Deep (N/A)" in out
+        assert "Gipsy Kings - Unknown location" in out
+
+
 class TestFullEDA:
     """Integration test for full EDA run."""
     
@@ -0,0 +1,89 @@
+"""
+Tests for the Embedded DuckDB Backend
+"""
+import pytest
+import pandas as pd
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, text
+from embedded import export_star_schema, embedded_engine
+from eda_analysis import session_summary, user_summary
+from analytics import run_metrics
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    """A small star schema in SQLite standing in for the warehouse."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'warehouse.db'}")
+    users = pd.DataFrame({'user_id': [1, 2, 3], 'first_name': ['A', 'B', 'C'], 'last_name': ['X', 'Y', 'Z'],
+                          'gender': ['F', 'M', 'F'], 'level': ['paid', 'free', 'free']})
+    times = pd.DataFrame({'start_time': pd.to_datetime(['2018-11-01 10:00', '2018-11-01 11:00', '2018-11-02 10:00']),
+                          'hour': [10, 11, 10], 'weekday': [3, 3, 4]})
+    songplays = pd.DataFrame({'songplay_id': [1, 2, 3, 4],
+                              'start_time': pd.to_datetime(['2018-11-01 10:00', '2018-11-01 11:00',
+                                                            '2018-11-02 10:00', '2018-11-02 10:00']),
+                              'user_id': [1, 2, 1, 3], 'level': ['paid', 'free', 'paid', 'free'],
+                              'song_id': [None] * 4, 'artist_id': [None] * 4, 'session_id': [1, 2, 1, 3],
+                              'location': ['NY', 'LA', 'NY', 'NY'], 'user_agent': ['ua'] * 4})
+    users.to_sql('users', engine, index=False)
+    times.to_sql('time', engine, index=False)
+    songplays.to_sql('songplays', engine, index=False)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE songs (song_id text, title text, artist_id text, year int, duration float)"))
+        conn.execute(text("CREATE TABLE artists (artist_id text, name text, location text)"))
+    return engine, users, songplays
+
+
+def test_export_writes_one_file_per_existing_table(warehouse, tmp_path):
+    """Test that existing tables are exported (empty ones with their columns) and missing ones skipped."""
+    engine, users, songplays = warehouse
+    counts = export_star_schema(engine, str(tmp_path / 'star'))
+    assert counts == {'users': 3, 'songs': 0, 'artists': 0, 'time': 3, 'songplays': 4}
+    assert pq.read_schema(tmp_path / 'star' / 'songs.parquet').names == \
+        ['song_id', 'title', 'artist_id', 'year', 'duration']
+    assert not list((tmp_path / 'star').glob('*.tmp'))
+
+
+def test_embedded_queries_match_pandas(warehouse, tmp_path):
+    """Test that the shared EDA and metric queries give the same answers on the DuckDB snapshot."""
+    pytest.importorskip('duckdb_engine')
+    engine, users, songplays = warehouse
+    export_star_schema(engine, str(tmp_path / 'star'))
+    duck = embedded_engine(str(tmp_path / 'star'))
+
+    assert user_summary(duck) == user_summary(None, users_df=users)
+    metrics = run_metrics(duck, ['level_plays', 'top_locations', 'totals'], source='fact')
+    assert {row['level']: row['plays'] for row in metrics['level_plays']} == \
+        songplays['level'].value_counts().to_dict()
+    assert [(row['location'], row['plays']) for row in metrics['top_locations']] == [('NY', 3), ('LA', 1)]
+    assert metrics['totals'][0]['plays'] == len(songplays)
+
+
+def test_embedded_engine_requires_snapshot(tmp_path):
+    """Test that a missing snapshot directory is reported clearly."""
+    with pytest.raises(FileNotFoundError):
+        embedded_engine(str(tmp_path / 'missing'))
+
+
+def test_rollup_source_falls_back_before_first_refresh(warehouse, tmp_path):
+    """Test that the default rollup source reads the fact table while the rollups were never refreshed."""
+    pytest.importorskip('duckdb_engine')
+    engine, users, songplays = warehouse
+    export_star_schema(engine, str(tmp_path / 'star'))
+    duck = embedded_engine(str(tmp_path / 'star'))
+    metrics = run_metrics(duck, ['level_plays', 'totals'], source='rollup')
+    assert metrics['totals'][0]['plays'] == len(songplays)
+
+
+def test_sessions_duration_without_generated_column(warehouse, tmp_path):
+    """Test that a sessions snapshot without the generated duration gets it from its view."""
+    pytest.importorskip('duckdb_engine')
+    engine, _, _ = warehouse
+    sessions = pd.DataFrame({'user_id': [1, 2], 'session_id': [1, 2],
+                             'start_time': pd.to_datetime(['2018-11-01 10:00', '2018-11-01 11:00']),
+                             'end_time': pd.to_datetime(['2018-11-01 10:30', '2018-11-01 11:10']),
+                             'tracks': [3, 1], 'level': ['paid', 'free']})
+    sessions.to_sql('sessions', engine, index=False)
+    export_star_schema(engine, str(tmp_path / 'star'))
+    duck = embedded_engine(str(tmp_path / 'star'))
+    rows = {level: minutes for level, _, _, minutes in session_summary(duck)}
+    assert rows == {'free': 10.0, 'paid': 30.0, None: 20.0}
@@ -0,0 +1,92 @@
+"""
+Tests for Extract Module
+"""
+import json
+import pytest
+import pandas as pd
+from extract import extract_json_data, iter_json_chunks, list_json_files
+from schema import LOG_SCHEMA, SONG_SCHEMA
+
+
+@pytest.fixture
+def song_dir(tmp_path):
+    """Write a nested tree of one-record song files."""
+    for i in range(25):
+        sub = tmp_path / chr(ord('A') + i % 3)
+        sub.mkdir(exist_ok=True)
+        record = {"song_id": f"SO{i:03d}", "title": f"Song {i}", "artist_id": f"AR{i % 5}",
+                  "year": 2000 + i, "duration": 200.5 + i}
+        (sub / f"song_{i}.json").write_text(json.dumps(record))
+    return tmp_path
+
+
+class TestExtractJsonData:
+    """Tests for batched / parallel JSON extraction."""
+
+    def test_lists_all_files(self, song_dir):
+        """Test that every file in the tree is discovered."""
+        assert len(list_json_files(str(song_dir))) == 25
+
+    def test_empty_directory_returns_empty_frame(self, tmp_path):
+        """Test that an empty tree yields an empty DataFrame."""
+        assert extract_json_data(str(tmp_path)).empty
+
+    @pytest.mark.parametrize("workers,executor", [(1, 'process'), (4, 'thread'), (2, 'process')])
+    def test_modes_return_same_rows(self, song_dir, workers, executor):
+        """Test that sequential and pooled extraction produce the same frame."""
+        df = extract_json_data(str(song_dir), workers=workers, batch_size=4, executor=executor)
+        assert len(df) == 25
+        assert set(df.columns) == {'song_id', 'title', 'artist_id', 'year', 'duration'}
+        assert sorted(df['song_id']) == [f"SO{i:03d}" for i in range(25)]
+
+    def test_multi_line_files(self, tmp_path):
+        """Test that NDJSON files with several events are fully read."""
+        lines = [json.dumps({"ts": 1541106106796 + i, "page": "NextSong"}) for i in range(3)]
+        (tmp_path / "events.json").write_text("\n".join(lines) + "\n")
+        df = extract_json_data(str(tmp_path), workers=1)
+        assert isinstance(df, pd.DataFrame)
+        assert len(df) == 3
+
+
+class TestIterJsonChunks:
+    """Tests for fixed-size chunked extraction."""
+
+    def test_chunks_span_files(self, tmp_path):
+        """Test that chunks are re-sized across file boundaries."""
+        for n in range(3):
+            lines = [json.dumps({"ts": n * 100 + i, "page": "NextSong"}) for i in range(7)]
+            (tmp_path / f"2018-11-0{n + 1}-events.json").write_text("\n".join(lines))
+        sizes = [len(c) for c in iter_json_chunks(str(tmp_path), 5)]
+        assert sizes == [5, 5, 5, 5, 1]
+
+    def test_byte_ranges(self, tmp_path):
+        """Test that only the given byte range of a file is read, whatever its ts."""
+        path = tmp_path / "events.json"
+        old = "".join(json.dumps({"ts": 500 + i, "page": "NextSong"}) + "\n" for i in range(3))
+        appended = json.dumps({"ts": 1, "page": "NextSong"}) + "\n"
+        path.write_text(old + appended + json.dumps({"ts": 2, "page": "NextSong"}) + "\n")
+        ranges = {str(path): (len(old), len(old) + len(appended))}
+        chunks = list(iter_json_chunks(str(tmp_path), 5, files=[str(path)], ranges=ranges))
+        assert [list(c['ts']) for c in chunks] == [[1]]
+
+
+class TestSchema:
+    """Tests for extract-time column pruning and dtype compaction."""
+
+    def test_song_frame_is_narrowed(self, song_dir, capsys):
+        """Test that integers are downcast and memory is reported."""
+        df = extract_json_data(str(song_dir), workers=1, schema=SONG_SCHEMA, report=True)
+        assert df['year'].dtype == 'int16'
+        assert df['duration'].dtype == 'float64'
+        assert "[dtypes]" in capsys.readouterr().out
+
+    def test_log_chunks_are_categorical_and_pruned(self, tmp_path):
+        """Test that unused columns are dropped and repeated strings become categoricals."""
+        lines = [json.dumps({"ts": 1541106106796 + i, "page": "NextSong", "level": "free",
+                             "method": "PUT", "registration": 1540344794796.0}) for i in range(4)]
+        (tmp_path / "events.json").write_text("\n".join(lines))
+        chunks = list(iter_json_chunks(str(tmp_path), 3, schema=LOG_SCHEMA))
+        assert [len(c) for c in chunks] == [3, 1]
+        assert set(chunks[0].columns) == {'ts', 'page', 'level'}
+        assert isinstance(chunks[0]['level'].dtype, pd.CategoricalDtype)
+        assert chunks[0]['ts'].dtype == 'int64'
@@ -0,0 +1,87 @@
+"""
+Tests for Stage Instrumentation
+"""
+import json
+import os
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+import instrument
+from instrument import annotate, drain, instrumented, measure, peak_rss_mb, summarize
+from load import load_to_db
+
+
+@pytest.fixture(autouse=True)
+def fresh_records():
+    drain()
+    yield
+    drain()
+
+
+class TestMeasure:
+    """Tests for per-stage metric records."""
+
+    def test_records_times_and_fields(self):
+        """Test that a block's wall/CPU time, peak RSS and added fields are recorded."""
+        with measure('extract.test', rows_in=3) as record:
+            annotate(bytes_read=100)
+            record['rows_out'] = 2
+        (r,) = drain()
+        assert r['stage'] == 'extract.test'
+        assert (r['rows_in'], r['rows_out'], r['bytes_read']) == (3, 2, 100)
+        assert r['wall_s'] >= 0 and r['cpu_s'] >= 0 and r['peak_rss_mb'] > 0
+
+    @pytest.mark.skipif(not os.path.exists('/proc/self/clear_refs'), reason="needs a resettable RSS peak (Linux)")
+    def test_peak_rss_is_per_block(self):
+        """Test that a block's peak RSS does not include an earlier, larger block's peak."""
+        with measure('transform.big'):
+            block = bytearray(200 * 1024 * 1024)
+            del block
+        with measure('transform.small'):
+            pass
+        big, small = drain()
+        assert big['peak_rss_mb'] - small['peak_rss_mb'] > 100
+        assert small['peak_rss_mb'] <= peak_rss_mb() + 1
+
+    def test_records_error_and_reraises(self):
+        """Test that an exception is kept in the record and still propagates."""
+        with pytest.raises(ValueError):
+            with measure('transform.test'):
+                raise ValueError('bad row')
+        assert drain()[0]['error'] == 'ValueError: bad row'
+
+    def test_decorator_counts_rows(self):
+        """Test that DataFrame rows in and out (per tuple element) are counted."""
+        split = instrumented('transform.split')(lambda df: (df.head(1), df))
+        split(pd.DataFrame({'a': [1, 2, 3]}))
+        (r,) = drain()
+        assert r['rows_in'] == 3 and r['rows_out'] == [1, 3]
+        assert summarize([r])['transform.split']['rows_out'] == 4
+
+    def test_json_lines_and_profile(self, tmp_path, monkeypatch):
+        """Test that records are appended as JSON and matching stages get a cProfile dump."""
+        path = tmp_path / 'metrics.jsonl'
+        monkeypatch.setattr(instrument, 'ETL_METRICS_PATH', str(path))
+        monkeypatch.setattr(instrument, 'PROFILE_PREFIXES', ['load'])
+        monkeypatch.setattr(instrument, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+        with measure('load.songs'):
+            with measure('load.inner'):
+                [0] * 100_000
+        with measure('extract.songs'):
+            pass
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [r['stage'] for r in lines] == ['load.inner', 'load.songs', 'extract.songs']
+        assert 'profile' in lines[1] and 'traced_peak_mb' in lines[1]
+        assert 'profile' not in lines[0] and 'profile' not in lines[2]
+        assert len(list((tmp_path / 'profiles').iterdir())) == 1
+
+
+def test_failed_load_is_recorded():
+    """Test that load_to_db reports a failed load in its metrics record instead of only printing it."""
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (user_id int)"))
+    assert not load_to_db(pd.DataFrame({'user_id': [1], 'level': ['free']}), 'users', engine)
+    (r,) = drain()
+    assert r['stage'] == 'load.users' and r['method'] == 'to_sql'
+    assert 'DatabaseError' in r['error'] and 'no column named level' in r['error']
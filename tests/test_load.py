@@ -0,0 +1,77 @@
+"""
+Tests for Load Module
+"""
+import pytest
+import pandas as pd
+from sqlalchemy import create_engine, text
+from partitions import batch_months, partition_name
+from load import frame_to_csv, load_to_db, supports_copy, upsert_sql
+
+
+class TestFrameToCsv:
+    """Tests for COPY buffer rendering."""
+
+    def test_nulls_and_integral_floats(self):
+        """Test that NaN becomes \\N and integral floats are written as ints."""
+        df = pd.DataFrame({'user_id': [8.0, None], 'location': ['', 'Memphis, TN'], 'latitude': [35.14968, None]})
+        lines = frame_to_csv(df).read().splitlines()
+        assert lines[0] == '8,,35.14968'
+        assert lines[1] == '\\N,"Memphis, TN",\\N'
+
+
+class TestLoadToDb:
+    """Tests for loader path selection."""
+
+    def test_non_postgres_falls_back_to_to_sql(self):
+        """Test that engines without COPY support still load via to_sql."""
+        engine = create_engine('sqlite://')
+        assert not supports_copy(engine)
+        df = pd.DataFrame({'artist_id': ['AR1', 'AR2'], 'name': ['Gipsy Kings', 'The Box Tops']})
+        load_to_db(df, 'artists', engine)
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM artists")).scalar() == 2
+
+
+class TestUpsertSql:
+    """Tests for staging-table merge statements."""
+
+    def test_users_update_level(self):
+        """Test that users are merged with DO UPDATE so the newest level wins."""
+        sql = upsert_sql('users', ['user_id', 'first_name', 'level'])
+        assert "FROM stage_users ON CONFLICT (user_id) DO UPDATE SET" in sql
+        assert "level = EXCLUDED.level" in sql
+        assert "IS DISTINCT FROM" in sql
+
+    def test_users_older_rows_do_not_win(self):
+        """Test that a users row only replaces a stored row that is not newer than it."""
+        sql = upsert_sql('users', ['user_id', 'level', 'level_ts'])
+        assert sql.endswith("AND (EXCLUDED.level_ts >= users.level_ts) IS NOT FALSE")
+        assert "level_ts" not in upsert_sql('users', ['user_id', 'level']).split("WHERE")[1]
+
+    def test_time_does_nothing(self):
+        """Test that time rows are never rewritten."""
+        assert upsert_sql('time', ['start_time', 'hour']).endswith("ON CONFLICT (start_time) DO NOTHING")
+
+    def test_sessions_are_stitched(self):
+        """Test that partial sessions widen the stored span and recount their tracks from songplays."""
+        sql = upsert_sql('sessions', ['user_id', 'session_id', 'start_time', 'end_time', 'tracks', 'level'])
+        assert "ON CONFLICT (user_id, session_id) DO UPDATE SET" in sql
+        assert "start_time = LEAST(sessions.start_time, EXCLUDED.start_time)" in sql
+        assert "tracks = (SELECT COUNT(*) FROM songplays sp WHERE sp.user_id = EXCLUDED.user_id" in sql
+        assert "sessions.tracks +" not in sql
+
+    def test_user_versions_in_one_statement(self):
+        """Test that new and re-bounded user versions are written by a single upsert."""
+        sql = upsert_sql('user_versions', ['user_id', 'level', 'valid_from', 'valid_to'])
+        assert sql.count("INSERT INTO") == 1
+        assert "ON CONFLICT (user_id, valid_from) DO UPDATE SET level = EXCLUDED.level, valid_to = EXCLUDED.valid_to" in sql
+
+
+class TestPartitions:
+    """Tests for monthly songplays partition naming."""
+
+    def test_months_in_batch(self):
+        """Test that a batch spanning a month boundary needs two partitions."""
+        start_times = pd.to_datetime([1541106106796, 1543622400000, 1541106341796], unit='ms')
+        names = [partition_name('songplays', m) for m in batch_months(start_times)]
+        assert names == ['songplays_2018_11', 'songplays_2018_12']
@@ -0,0 +1,69 @@
+"""
+Tests for the Song Lookup Index
+"""
+import pytest
+import pandas as pd
+from lookup import SongLookup
+
+
+@pytest.fixture
+def lookup():
+    """Catalog with a duplicated title by two different artists."""
+    songs_df = pd.DataFrame({
+        'song_id': ['SOYMRWW', 'SOCIWDW', 'SODUPE1'],
+        'title': ['The Ocean', 'Soul Deep', 'The Ocean'],
+        'artist_id': ['ARJNIQD', 'ARMJAGH', 'ARLEDZP'],
+        'year': [1982, 1969, 1971],
+        'duration': [235.44118, 148.03546, 211.0],
+    })
+    artists_df = pd.DataFrame({
+        'artist_id': ['ARJNIQD', 'ARMJAGH', 'ARLEDZP'],
+        'name': ['Gipsy Kings', 'The Box Tops', 'Led Zeppelin'],
+        'location': ['', 'Memphis, TN', ''],
+        'latitude': [None, 35.14968, None],
+        'longitude': [None, -90.04892, None],
+    })
+    return SongLookup.from_frames(songs_df, artists_df)
+
+
+class TestSongLookup:
+    """Tests for vectorized song/artist resolution."""
+
+    def test_duplicate_titles_resolve_by_artist(self, lookup):
+        """Test that equal titles do not fan out and match the right artist."""
+        song_ids, artist_ids = lookup.resolve(
+            ['The Ocean', 'The Ocean'], ['Led Zeppelin', 'Gipsy Kings'], [211.2, 235.44118])
+        assert list(song_ids) == ['SODUPE1', 'SOYMRWW']
+        assert list(artist_ids) == ['ARLEDZP', 'ARJNIQD']
+
+    def test_normalizes_case_and_whitespace(self, lookup):
+        """Test that title and artist matching ignores case and extra spaces."""
+        song_ids, _ = lookup.resolve(['  soul   DEEP '], ['the box tops'], [148.0])
+        assert list(song_ids) == ['SOCIWDW']
+
+    def test_falls_back_without_length(self, lookup):
+        """Test that events without a length still match on title and artist."""
+        song_ids, _ = lookup.resolve(['Soul Deep'], ['The Box Tops'], [None])
+        assert list(song_ids) == ['SOCIWDW']
+        song_ids, _ = lookup.resolve(['Soul Deep'], ['The Box Tops'])
+        assert list(song_ids) == ['SOCIWDW']
+
+    def test_mismatched_length_is_not_matched_by_name(self, lookup):
+        """Test that an event with a different length does not fall back to title and artist."""
+        song_ids, artist_ids = lookup.resolve(['Soul Deep', 'Soul Deep'], ['The Box Tops'] * 2, [300.0, 148.4])
+        assert list(song_ids) == [None, 'SOCIWDW']
+        assert list(artist_ids) == [None, 'ARMJAGH']
+
+    def test_catalog_song_without_duration_matches_by_name(self):
+        """Test that a catalog song without a duration is still matched by events with a length."""
+        songs_df = pd.DataFrame({'song_id': ['SONODUR'], 'title': ['Intro'], 'artist_id': ['AR1'],
+                                 'year': [0], 'duration': [None]})
+        artists_df = pd.DataFrame({'artist_id': ['AR1'], 'name': ['Nobody Known']})
+        song_ids, _ = SongLookup.from_frames(songs_df, artists_df).resolve(['Intro'], ['Nobody Known'], [61.0])
+        assert list(song_ids) == ['SONODUR']
+
+    def test_unmatched_events_are_none(self, lookup):
+        """Test that unknown songs resolve to None."""
+        song_ids, artist_ids = lookup.resolve(['Unknown', None], ['Nobody', None], [100.0, None])
+        assert list(song_ids) == [None, None]
+        assert list(artist_ids) == [None, None]
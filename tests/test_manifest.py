@@ -0,0 +1,91 @@
+"""
+Tests for the Incremental ETL Manifest
+"""
+import os
+import pytest
+from manifest import file_hash, file_hashes, iter_file_chunks, pending_files
+from schema import LOG_SCHEMA
+
+
+@pytest.fixture
+def log_files(tmp_path):
+    """Write two event files and return their paths."""
+    paths = []
+    for name in ('2018-11-01-events.json', '2018-11-02-events.json'):
+        p = tmp_path / name
+        p.write_text('{"ts": 1541106106796, "page": "NextSong"}\n')
+        paths.append(str(p))
+    return paths
+
+
+def entry(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime, file_hash(path))
+
+
+class TestPendingFiles:
+    """Tests for new/changed file detection."""
+
+    def test_all_new_without_manifest(self, log_files):
+        """Test that every file is new on the first run."""
+        new, changed, touched = pending_files(log_files, {})
+        assert [e[0] for e in new] == log_files
+        assert changed == touched == []
+
+    def test_unchanged_files_skipped(self, log_files):
+        """Test that recorded files are not extracted again."""
+        manifest = {p: entry(p) for p in log_files}
+        assert pending_files(log_files, manifest) == ([], [], [])
+
+    def test_appended_file_is_read_from_recorded_size(self, log_files):
+        """Test that appending events marks a file as changed, with its old size as offset."""
+        manifest = {p: entry(p) for p in log_files}
+        old_size = os.path.getsize(log_files[1])
+        with open(log_files[1], 'a') as f:
+            f.write('{"ts": 1541106341796, "page": "NextSong"}\n')
+        new, changed, touched = pending_files(log_files, manifest)
+        assert new == touched == []
+        assert [(e[0], e[4]) for e in changed] == [(log_files[1], old_size)]
+
+    def test_rewritten_file_is_read_in_full(self, log_files):
+        """Test that a file whose recorded content is no longer its prefix is read from the start."""
+        manifest = {p: entry(p) for p in log_files}
+        with open(log_files[0], 'w') as f:
+            f.write('{"ts": 1541106000000, "page": "NextSong"}\n{"ts": 1541106106796, "page": "NextSong"}\n')
+        _, changed, _ = pending_files(log_files, manifest)
+        assert [(e[0], e[4]) for e in changed] == [(log_files[0], 0)]
+
+    def test_touched_file_with_same_content_skipped(self, log_files):
+        """Test that an mtime-only change does not trigger a reload but is recorded."""
+        manifest = {p: entry(p) for p in log_files}
+        os.utime(log_files[0], (0, 0))
+        new, changed, touched = pending_files(log_files, manifest)
+        assert new == changed == []
+        assert [(e[0], e[2]) for e in touched] == [(log_files[0], 0)]
+
+
+def test_prefix_hash_across_blocks(tmp_path):
+    """Test that the prefix hash equals the hash of a file holding just the prefix."""
+    path, head = tmp_path / 'a.json', tmp_path / 'b.json'
+    path.write_bytes(b'0123456789' * 5)
+    head.write_bytes(b'0123456789' * 2 + b'012')
+    assert file_hashes(str(path), 23, block_size=8)[1] == file_hash(str(head))
+    assert file_hashes(str(path), 50, block_size=10) == (file_hash(str(path)), file_hash(str(path)))
+
+
+def test_chunk_progress_resumes_after_the_last_loaded_line(tmp_path):
+    """Test that recording a chunk's progress makes the next run read only the lines after it."""
+    path = tmp_path / '2018-11-01-events.json'
+    path.write_text(''.join(f'{{"ts": {1541106106796 + i}, "page": "NextSong"}}\n' for i in range(5))
+                    + '{"ts": 1541106106801, "page": "NextSong"}')  # last line without newline
+    new, _, _ = pending_files([str(path)], {})
+    chunks = list(iter_file_chunks(new, 4, LOG_SCHEMA, block_size=16))
+    assert [len(df) for df, _ in chunks] == [4, 2]
+    assert chunks[-1][1] == [new[0]]  # the last chunk completes the file's entry
+
+    # Only the first chunk committed: the file is resumed from its fifth line
+    first = chunks[0][1][0]
+    _, changed, _ = pending_files([str(path)], {first[0]: first[1:]})
+    assert changed[0][4] == first[1]
+    rest = list(iter_file_chunks(changed, 4, LOG_SCHEMA))
+    assert list(rest[0][0]['ts']) == [1541106106800, 1541106106801]
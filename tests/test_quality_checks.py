@@ -1,6 +1,6 @@
 import pytest
 from sqlalchemy import create_engine, text
-from src.config import DATABASE_URL
+from config import DATABASE_URL
 
 @pytest.fixture
 def engine():
@@ -10,4 +10,21 @@ def test_tables_not_empty(engine):
     with engine.connect() as conn:
         for table in ['users', 'songs', 'artists', 'time', 'songplays']:
             result = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
-            assert result >= 0
\ No newline at end of file
+            assert result >= 0
+
+def test_songplays_reference_dimensions(engine):
+    with engine.connect() as conn:
+        orphans = conn.execute(text("""
+            SELECT COUNT(*) FROM songplays sp
+            WHERE NOT EXISTS (SELECT 1 FROM time t WHERE t.start_time = sp.start_time)
+               OR NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = sp.user_id)
+        """)).scalar()
+        assert orphans == 0
+
+def test_quarantined_rows_have_reasons(engine):
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regclass('etl_quarantine') IS NOT NULL")).scalar()
+        if not exists:
+            pytest.skip("no rows have been quarantined yet")
+        missing = conn.execute(text("SELECT COUNT(*) FROM etl_quarantine WHERE reasons = ''")).scalar()
+        assert missing == 0
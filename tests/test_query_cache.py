@@ -0,0 +1,63 @@
+"""
+Tests for the Query Result Cache
+"""
+import os
+import pytest
+from sqlalchemy import create_engine
+import query_cache
+from query_cache import QueryCache, cached_call
+
+
+@pytest.fixture
+def engine():
+    return create_engine('sqlite://')
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    """Pretend the warehouse is at a settable data generation."""
+    state = {'generation': '1.a'}
+    monkeypatch.setattr(query_cache, 'current_generation', lambda engine: state['generation'])
+    return state
+
+
+class TestQueryCache:
+    """Tests for generation-keyed caching of query results."""
+
+    def test_hits_until_generation_changes(self, tmp_path, engine, generation):
+        """Test that results are reused within a generation and recomputed after a load."""
+        cache = QueryCache(str(tmp_path), max_bytes=1 << 20)
+        calls = []
+        compute = lambda: calls.append(1) or [(len(calls),)]
+        assert cached_call(engine, 'SELECT 1', None, compute, cache) == [(1,)]
+        assert cached_call(engine, 'SELECT 1', None, compute, cache) == [(1,)]
+        assert len(calls) == 1
+
+        generation['generation'] = '2.a'
+        assert cached_call(engine, 'SELECT 1', None, compute, cache) == [(2,)]
+        assert len(os.listdir(tmp_path)) == 1  # the old generation was dropped
+
+    def test_params_are_part_of_key(self, tmp_path, engine, generation):
+        """Test that the same query text with other parameters is a different entry."""
+        cache = QueryCache(str(tmp_path), max_bytes=1 << 20)
+        assert cached_call(engine, 'SELECT :n', {'n': 1}, lambda: 1, cache) == 1
+        assert cached_call(engine, 'SELECT :n', {'n': 2}, lambda: 2, cache) == 2
+
+    def test_evicts_least_recently_used(self, tmp_path, engine, generation):
+        """Test that the cache stays under max_bytes by dropping the oldest entries."""
+        cache = QueryCache(str(tmp_path), max_bytes=3500)
+        payload = b'x' * 1000
+        for i in range(3):
+            cached_call(engine, f'SELECT {i}', None, lambda: payload, cache)
+        key = lambda i: QueryCache.make_key(engine, f'SELECT {i}', None)
+        os.utime(cache._path('1.a', key(0)), (0, 0))
+        cached_call(engine, 'SELECT 3', None, lambda: payload, cache)
+        assert cache.get('1.a', key(0)) == (None, False)
+        assert cache.get('1.a', key(3)) == (payload, True)
+
+    def test_untracked_generation_bypasses_cache(self, tmp_path, engine, monkeypatch):
+        """Test that databases without etl_generation are always queried."""
+        monkeypatch.setattr(query_cache, 'current_generation', lambda engine: None)
+        cache = QueryCache(str(tmp_path))
+        assert cached_call(engine, 'SELECT 1', None, lambda: 1, cache) == 1
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,53 @@
+"""
+Tests for the ETL Stage Scheduler
+"""
+import threading
+import time
+import pytest
+from scheduler import Stage, critical_path, report_timings, run_stages
+
+
+class TestRunStages:
+    """Tests for dependency-ordered concurrent execution."""
+
+    def test_independent_stages_overlap(self):
+        """Test that stages without dependencies run at the same time."""
+        barrier = threading.Barrier(2, timeout=5)
+        stages = [
+            Stage('extract_songs', lambda r: (barrier.wait(), 'songs')[1]),
+            Stage('extract_logs', lambda r: (barrier.wait(), 'logs')[1]),
+            Stage('load', lambda r: (r['extract_songs'], r['extract_logs']), ('extract_songs', 'extract_logs')),
+        ]
+        results, timings = run_stages(stages)
+        assert results['load'] == ('songs', 'logs')
+        assert timings['load'][0] >= max(timings['extract_songs'][1], timings['extract_logs'][1])
+
+    def test_failure_stops_dependents_and_cancels(self):
+        """Test that a failing stage re-raises, skips dependents and sets cancel."""
+        cancel = threading.Event()
+        ran = []
+        stages = [
+            Stage('bad', lambda r: 1 / 0),
+            Stage('after', lambda r: ran.append('after'), ('bad',)),
+        ]
+        with pytest.raises(ZeroDivisionError):
+            run_stages(stages, cancel)
+        assert cancel.is_set()
+        assert ran == []
+
+
+class TestCriticalPath:
+    """Tests for critical path reporting."""
+
+    def test_follows_latest_finishing_predecessor(self, capsys):
+        """Test that the path goes through the slowest branch."""
+        stages = [
+            Stage('fast', lambda r: None),
+            Stage('slow', lambda r: time.sleep(0.05)),
+            Stage('producer', lambda r: None),
+            Stage('final', lambda r: None, ('fast', 'slow'), ('producer',)),
+        ]
+        _, timings = run_stages(stages)
+        assert critical_path(stages, timings) == ['slow', 'final']
+        report_timings(stages, timings)
+        assert "critical path: slow -> final" in capsys.readouterr().out
@@ -0,0 +1,38 @@
+"""
+Tests for Sessionization
+"""
+import pandas as pd
+from sessions import SESSION_COLUMNS, build_sessions
+
+
+def make_plays(rows):
+    """Build a songplays frame from (user_id, session_id, start_time, level) rows."""
+    return pd.DataFrame(rows, columns=['user_id', 'session_id', 'start_time', 'level']).assign(
+        start_time=lambda df: pd.to_datetime(df['start_time']))
+
+
+class TestBuildSessions:
+    """Tests for reducing songplays batches to sessions."""
+
+    def test_one_row_per_user_session(self):
+        """Test that unordered plays are reduced to span, track count and latest level."""
+        plays = make_plays([
+            (8, 1, '2018-11-01 10:10', 'paid'),
+            (8, 1, '2018-11-01 10:00', 'free'),
+            (9, 1, '2018-11-01 12:00', 'free'),
+            (8, 1, '2018-11-01 10:05', 'free'),
+        ])
+        sessions = build_sessions(plays).set_index(['user_id', 'session_id'])
+        assert len(sessions) == 2
+        row = sessions.loc[(8, 1)]
+        assert row['start_time'] == pd.Timestamp('2018-11-01 10:00')
+        assert row['end_time'] == pd.Timestamp('2018-11-01 10:10')
+        assert row['tracks'] == 3
+        assert row['level'] == 'paid'
+        assert sessions.loc[(9, 1), 'tracks'] == 1
+
+    def test_empty_batch(self):
+        """Test that an empty batch yields an empty sessions frame."""
+        sessions = build_sessions(make_plays([]))
+        assert sessions.empty
+        assert list(sessions.columns) == SESSION_COLUMNS
@@ -0,0 +1,70 @@
+"""
+Tests for the DAU and Heavy-Hitter Sketches
+"""
+import numpy as np
+import pandas as pd
+from sketches import HyperLogLog, SpaceSaving, batch_sketches
+
+
+class TestHyperLogLog:
+    """Tests for approximate distinct counts."""
+
+    def test_small_counts_are_exact(self):
+        """Test that linear counting is exact for a handful of users."""
+        assert HyperLogLog().add(np.array([1, 2, 3, 3, 2], dtype='int64')).count() == 3
+
+    def test_large_count_within_error_bound(self):
+        """Test that 100k distinct values are estimated within 4 standard errors."""
+        values = np.arange(100_000, dtype='int64')
+        estimate = HyperLogLog().add(values).count()
+        assert abs(estimate - 100_000) / 100_000 < 4 * 1.04 / np.sqrt(2 ** 14)
+
+    def test_merge_equals_union_and_round_trips(self):
+        """Test that merging halves matches sketching everything, also after serialization."""
+        values = np.arange(20_000, dtype='int64')
+        merged = HyperLogLog().add(values[:12_000]).merge(HyperLogLog().add(values[8_000:]))
+        restored = HyperLogLog.from_bytes(merged.to_bytes())
+        assert restored.p == 14
+        assert restored.count() == HyperLogLog().add(values).count()
+
+
+class TestSpaceSaving:
+    """Tests for mergeable heavy-hitter summaries."""
+
+    def test_exact_below_capacity(self):
+        """Test that summaries with room for every item count exactly."""
+        summary = SpaceSaving.from_values(['a', 'b', 'a', None, 'c', 'a'], capacity=10)
+        assert summary.top(2) == [('a', 3, 0), ('b', 1, 0)]
+        assert summary.total == 5
+
+    def test_merged_batches_respect_error_bound(self):
+        """Test that counts merged over batches stay within N / capacity of the truth."""
+        rng = np.random.default_rng(7)
+        plays = rng.zipf(1.5, 50_000)
+        plays = plays[plays < 5_000].astype(str)
+        truth = pd.Series(plays).value_counts()
+        summary = SpaceSaving(capacity=100)
+        for batch in np.array_split(plays, 10):
+            summary = summary.merge(SpaceSaving.from_values(batch, capacity=100))
+        summary = SpaceSaving.from_bytes(summary.to_bytes())
+        assert summary.total == len(plays)
+        for item, count, error in summary.top(10):
+            assert count - error <= truth[item] <= count
+            assert error <= len(plays) / 100
+        assert [item for item, _, _ in summary.top(3)] == truth.index[:3].tolist()
+
+
+def test_batch_sketches_bucket_users_by_day():
+    """Test that a songplays batch yields one DAU sketch per day plus all-time top-N."""
+    songplays = pd.DataFrame({
+        'start_time': pd.to_datetime(['2018-11-01 10:00', '2018-11-01 11:00', '2018-11-02 09:00']),
+        'user_id': [1, 2, 1],
+        'song_id': ['S1', None, 'S1'],
+        'artist_id': ['A1', None, 'A1'],
+        'location': ['X', 'Y', 'X'],
+    })
+    sketches = batch_sketches(songplays)
+    assert sketches[('dau', '2018-11-01')].count() == 2
+    assert sketches[('dau', '2018-11-02')].count() == 1
+    assert sketches[('top_songs', 'all')].top(1) == [('S1', 2, 0)]
+    assert sketches[('top_locations', 'all')].total == 3
@@ -0,0 +1,126 @@
+"""
+Tests for Streaming Ingestion
+"""
+import json
+import queue
+import threading
+import time
+import pytest
+import pandas as pd
+from sqlalchemy import create_engine, text
+from stream import LogTailer, parse_lines, read_batches
+from load import load_batch
+
+
+def event(ts, page='NextSong'):
+    return json.dumps({'ts': ts, 'page': page, 'userId': '7', 'firstName': 'A', 'lastName': 'B', 'gender': 'F',
+                       'level': 'free', 'song': 'S', 'artist': 'X', 'length': 200.0, 'sessionId': 1,
+                       'location': 'NY', 'userAgent': 'ua', 'itemInSession': 0}) + '\n'
+
+
+class TestLogTailer:
+    """Tests for reading appended lines from saved offsets."""
+
+    def test_reads_only_new_complete_lines(self, tmp_path):
+        """Test that a partial trailing line waits until its newline is written."""
+        path = tmp_path / 'events.json'
+        path.write_text(event(1) + event(2) + event(3)[:20])
+        tailer = LogTailer(str(tmp_path))
+        data, rows = tailer.read(100)
+        assert rows == 2
+        assert list(parse_lines(data)['ts']) == [1, 2]
+
+        with open(path, 'a') as f:
+            f.write(event(3)[20:] + event(4))
+        data, rows = tailer.read(100)
+        assert list(parse_lines(data)['ts']) == [3, 4]
+        assert tailer.read(100) == (b'', 0)
+
+    def test_max_rows_and_resume_from_offsets(self, tmp_path):
+        """Test that reads stop at max_rows and a new tailer resumes from the saved offsets."""
+        (tmp_path / 'a.json').write_text(''.join(event(ts) for ts in range(5)))
+        tailer = LogTailer(str(tmp_path))
+        data, rows = tailer.read(3, block_size=16)
+        assert rows == 3
+        resumed = LogTailer(str(tmp_path), tailer.offsets)
+        data, rows = resumed.read(100)
+        assert list(parse_lines(data)['ts']) == [3, 4]
+
+    def test_busy_file_does_not_starve_later_files(self, tmp_path):
+        """Test that a file filling every read still lets later files be read on the next one."""
+        busy, quiet = tmp_path / 'a.json', tmp_path / 'b.json'
+        busy.write_text(''.join(event(ts) for ts in range(3)))
+        quiet.write_text(event(100))
+        tailer = LogTailer(str(tmp_path))
+        assert list(parse_lines(tailer.read(3)[0])['ts']) == [0, 1, 2]
+        with open(busy, 'a') as f:
+            f.write(''.join(event(ts) for ts in range(3, 6)))
+        assert list(parse_lines(tailer.read(3)[0])['ts']) == [100, 3, 4]
+        assert list(parse_lines(tailer.read(3)[0])['ts']) == [5]
+
+    def test_truncated_file_is_read_again(self, tmp_path):
+        """Test that a file rewritten shorter than its offset is read from the start."""
+        path = tmp_path / 'a.json'
+        path.write_text(event(1) + event(2))
+        tailer = LogTailer(str(tmp_path))
+        tailer.read(100)
+        path.write_text(event(9))
+        data, rows = tailer.read(100)
+        assert list(parse_lines(data)['ts']) == [9]
+
+
+def test_parse_lines_skips_blank_lines():
+    """Test that blank lines do not break parsing."""
+    df = parse_lines(b'\n' + event(1).encode() + b'\n\n' + event(2).encode())
+    assert list(df['ts']) == [1, 2]
+
+
+def test_reader_blocks_when_loader_falls_behind(tmp_path):
+    """Test that the reader stops reading while the queue is full and flushes on stop."""
+    path = tmp_path / 'a.json'
+    path.write_text(''.join(event(ts) for ts in range(4)))
+    tailer = LogTailer(str(tmp_path))
+    batches, stop, abort = queue.Queue(maxsize=1), threading.Event(), threading.Event()
+    reader = threading.Thread(target=read_batches, args=(tailer, batches, stop, abort, 60, 2),
+                              daemon=True)
+    reader.start()
+    first = batches.get(timeout=5)
+    second = batches.get(timeout=5)
+    assert (first[1], second[1]) == (2, 2)
+    assert second[2][str(path)][1] == path.stat().st_size
+
+    # Nothing is consumed: one batch waits in the queue, the next blocks and the last event is not read
+    with open(path, 'a') as f:
+        f.write(''.join(event(ts) for ts in range(4, 9)))
+    deadline = time.monotonic() + 5
+    while not (batches.full() and tailer.offsets[str(path)][1] == second[2][str(path)][1] + 4 * len(event(4))):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    stop.set()
+    rest = [batches.get(timeout=5) for _ in range(3)]
+    reader.join(timeout=5)
+    assert [item[1] for item in rest[:-1]] == [2, 2] and rest[-1] is None
+    assert rest[1][2][str(path)][1] == path.stat().st_size - len(event(8))
+
+
+def test_load_batch_is_all_or_nothing():
+    """Test that a failure after the loads rolls every table back."""
+    engine = create_engine('sqlite://')
+    frames = [('users', pd.DataFrame({'user_id': [1], 'level': ['free']})),
+              ('songplays', pd.DataFrame({'user_id': [1], 'song_id': ['S']}))]
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (user_id int, level text)"))
+        conn.execute(text("CREATE TABLE songplays (user_id int, song_id text)"))
+
+    def fail(conn):
+        raise RuntimeError("offsets not saved")
+
+    with pytest.raises(RuntimeError):
+        load_batch(frames, engine, after=fail)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM users")).scalar() == 0
+        assert conn.execute(text("SELECT COUNT(*) FROM songplays")).scalar() == 0
+
+    load_batch(frames, engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM songplays")).scalar() == 1
@@ -0,0 +1,106 @@
+"""
+Tests for Transform Module
+"""
+import pytest
+import pandas as pd
+from transform import (build_calendar, build_time_table, transform_song_data,
+                           transform_log_data, transform_log_chunks)
+
+
+def make_events(n, user_id="8", level="free", start_ts=1541106106796, page="NextSong"):
+    """Build n raw log events spaced one minute apart."""
+    return pd.DataFrame({
+        'artist': ['Gipsy Kings'] * n,
+        'firstName': ['Kaylee'] * n,
+        'lastName': ['Summers'] * n,
+        'gender': ['F'] * n,
+        'level': [level] * n,
+        'location': ['Phoenix-Mesa-Scottsdale, AZ'] * n,
+        'page': [page] * n,
+        'sessionId': [139] * n,
+        'song': ['The Ocean'] * n,
+        'ts': [start_ts + i * 60000 for i in range(n)],
+        'userAgent': ['Mozilla/5.0'] * n,
+        'userId': [user_id] * n,
+    })
+
+
+class TestTransformSongData:
+    """Tests for song/artist dimension extraction."""
+
+    def test_splits_songs_and_artists(self):
+        """Test that song rows produce song and artist dimensions."""
+        raw = pd.DataFrame({
+            'song_id': ['S1', 'S2'], 'title': ['A', 'B'], 'artist_id': ['AR1', 'AR1'],
+            'year': [1982, 0], 'duration': [235.4, 148.0],
+            'artist_name': ['Gipsy Kings'] * 2, 'artist_location': [''] * 2,
+            'artist_latitude': [None] * 2, 'artist_longitude': [None] * 2,
+        })
+        songs_df, artists_df = transform_song_data(raw)
+        assert len(songs_df) == 2
+        assert len(artists_df) == 1
+        assert list(artists_df.columns) == ['artist_id', 'name', 'location', 'latitude', 'longitude']
+
+
+class TestTransformLogData:
+    """Tests for log event transformation."""
+
+    def test_filters_next_song(self):
+        """Test that only NextSong events are kept."""
+        raw = pd.concat([make_events(3), make_events(2, page='Home')], ignore_index=True)
+        time_df, user_df, log_df = transform_log_data(raw)
+        assert len(log_df) == 3
+        assert len(time_df) == 3
+        assert len(user_df) == 1
+
+    def test_newest_level_wins(self):
+        """Test that a user upgrading mid-batch is emitted once with the latest level."""
+        raw = pd.concat([make_events(2, level='paid', start_ts=1541106106796 + 600000), make_events(2)],
+                        ignore_index=True)
+        _, user_df, _ = transform_log_data(raw)
+        assert len(user_df) == 1
+        assert user_df.iloc[0]['level'] == 'paid'
+        assert user_df.iloc[0]['level_ts'] == pd.to_datetime(raw['ts'].max(), unit='ms')
+
+    def test_chunks_keep_later_levels(self):
+        """Test that chunks re-emit users so later levels are merged."""
+        chunks = [make_events(2), make_events(2, level='paid', start_ts=1541106106796 + 600000)]
+        levels = [u.iloc[0]['level'] for _, u, _ in transform_log_chunks(iter(chunks))]
+        assert levels == ['free', 'paid']
+
+    def test_chunks_are_independent(self):
+        """Test that keys repeated by a later chunk are emitted again, leaving the merge to the loader."""
+        chunks = [make_events(3), make_events(3, start_ts=1541106106796 + 120000)]
+        results = list(transform_log_chunks(iter(chunks)))
+        assert [len(u) for _, u, _ in results] == [1, 1]
+        assert [len(t) for t, _, _ in results] == [3, 3]
+        assert sum(len(l) for _, _, l in results) == 6
+
+
+class TestBuildTimeTable:
+    """Tests for the integer-arithmetic time dimension."""
+
+    def test_matches_pandas_datetime_accessors(self):
+        """Test that every attribute equals the pandas .dt / isocalendar result."""
+        ts = [1541106106796, 1546300799000, 1546300800000, 1577836800000, 1609459199999, 1546300800000]
+        time_df = build_time_table(ts)
+        t = pd.Series(pd.to_datetime(sorted(set(ts)), unit='ms'))
+        assert len(time_df) == 5
+        assert list(time_df['hour']) == list(t.dt.hour)
+        assert list(time_df['day']) == list(t.dt.day)
+        assert list(time_df['week']) == list(t.dt.isocalendar().week)
+        assert list(time_df['month']) == list(t.dt.month)
+        assert list(time_df['year']) == list(t.dt.year)
+        assert list(time_df['weekday']) == list(t.dt.weekday)
+
+    def test_compact_dtypes(self):
+        """Test that attributes use small integer dtypes."""
+        dtypes = build_time_table([1541106106796]).dtypes
+        assert dtypes['hour'] == 'int8'
+        assert dtypes['year'] == 'int16'
+
+    def test_precomputed_calendar(self):
+        """Test that a supplied calendar gives the same result."""
+        ts = [1541106106796, 1541106341796]
+        calendar = build_calendar(17800, 17900)
+        pd.testing.assert_frame_equal(build_time_table(ts, calendar), build_time_table(ts))
@@ -0,0 +1,127 @@
+"""
+Tests for the Type-2 Users History
+"""
+import numpy as np
+import pandas as pd
+from user_versions import (VERSION_COLUMNS, build_user_versions, merge_user_versions,
+                               resolve_user_versions, user_events)
+
+
+def make_events(rows):
+    """Build NextSong events from (userId, ts, level) rows."""
+    return pd.DataFrame({
+        'userId': [str(u) for u, _, _ in rows],
+        'firstName': ['Kaylee'] * len(rows), 'lastName': ['Summers'] * len(rows), 'gender': ['F'] * len(rows),
+        'level': pd.Categorical([level for _, _, level in rows]),
+        'ts': pd.to_datetime([ts for _, ts, _ in rows]),
+    })
+
+
+def versions(rows):
+    """Build a versions frame from (user_id, level, valid_from, valid_to[, last_seen]) rows.
+
+    last_seen defaults to valid_from.
+    """
+    return pd.DataFrame({
+        'user_id': [r[0] for r in rows], 'first_name': 'Kaylee', 'last_name': 'Summers', 'gender': 'F',
+        'level': [r[1] for r in rows], 'valid_from': pd.to_datetime([r[2] for r in rows]),
+        'valid_to': pd.to_datetime([r[3] for r in rows]),
+        'last_seen': pd.to_datetime([r[4] if len(r) > 4 else r[2] for r in rows]),
+    })[VERSION_COLUMNS]
+
+
+class TestBuildUserVersions:
+    """Tests for deriving versions from a batch of events."""
+
+    def test_upgrade_starts_a_new_version(self):
+        """Test that unordered events collapse to one version per change of level."""
+        events = make_events([
+            (8, '2018-11-01 12:00', 'paid'), (8, '2018-11-01 10:00', 'free'), (9, '2018-11-01 09:00', 'free'),
+            (8, '2018-11-01 11:00', 'free'), (8, '2018-11-01 13:00', 'paid'),
+        ])
+        result = build_user_versions(events)
+        assert result[['user_id', 'level']].values.tolist() == [[8, 'free'], [8, 'paid'], [9, 'free']]
+        assert list(result['valid_from']) == pd.to_datetime(
+            ['2018-11-01 10:00', '2018-11-01 12:00', '2018-11-01 09:00']).tolist()
+        assert result['valid_to'].iloc[0] == pd.Timestamp('2018-11-01 12:00')
+        assert result['valid_to'].iloc[1:].isna().all()
+        assert list(result['last_seen']) == pd.to_datetime(
+            ['2018-11-01 11:00', '2018-11-01 13:00', '2018-11-01 09:00']).tolist()
+
+    def test_downgrade_and_upgrade_again(self):
+        """Test that returning to an earlier level is a new version, not a merge with the old one."""
+        events = make_events([(8, '2018-11-01', 'free'), (8, '2018-11-02', 'paid'), (8, '2018-11-03', 'free')])
+        assert list(build_user_versions(events)['level']) == ['free', 'paid', 'free']
+
+
+class TestMergeUserVersions:
+    """Tests for merging batch versions into the stored history."""
+
+    def test_continuation_extends_the_current_version(self):
+        """Test that a batch repeating the current attributes only moves its last_seen."""
+        stored = versions([(8, 'free', '2018-11-01', None)])
+        merged, changed = merge_user_versions(stored, versions([(8, 'free', '2018-11-05', None)]))
+        assert len(merged) == 1 and merged['valid_from'].iloc[0] == pd.Timestamp('2018-11-01')
+        assert changed[['valid_from', 'last_seen']].values.tolist() == [
+            [pd.Timestamp('2018-11-01'), pd.Timestamp('2018-11-05')]]
+        _, changed = merge_user_versions(stored, versions([(8, 'free', '2018-11-01', None)]))
+        assert changed.empty
+
+    def test_upgrade_closes_the_current_version(self):
+        """Test that a new level is inserted and bounds the stored version."""
+        stored = versions([(8, 'free', '2018-11-01', None)])
+        merged, changed = merge_user_versions(stored, versions([(8, 'paid', '2018-11-05', None)]))
+        assert changed[['level', 'valid_from', 'valid_to']].values.tolist() == [
+            ['free', pd.Timestamp('2018-11-01'), pd.Timestamp('2018-11-05')],
+            ['paid', pd.Timestamp('2018-11-05'), pd.NaT],
+        ]
+
+    def test_late_events_keep_stored_keys(self):
+        """Test that an out-of-order earlier version is inserted before, never replacing, stored ones."""
+        stored = versions([(8, 'paid', '2018-11-05', None)])
+        merged, changed = merge_user_versions(stored, versions([(8, 'free', '2018-11-01', '2018-11-02'),
+                                                                (8, 'paid', '2018-11-02', None)]))
+        assert list(merged['valid_from']) == pd.to_datetime(['2018-11-01', '2018-11-02', '2018-11-05']).tolist()
+        assert pd.Timestamp('2018-11-05') in list(merged['valid_from'])
+        assert list(changed['valid_from']) == pd.to_datetime(['2018-11-01', '2018-11-02']).tolist()
+
+    def test_late_change_inside_a_version_reopens_it(self):
+        """Test that a late event splitting a stored version holds only until its next observed event."""
+        stored = versions([(8, 'free', '2018-11-01 01:00', None, '2018-11-01 05:00')])
+        merged, changed = merge_user_versions(stored, versions([(8, 'paid', '2018-11-01 03:00', None)]))
+        assert merged[['level', 'valid_from', 'valid_to']].values.tolist() == [
+            ['free', pd.Timestamp('2018-11-01 01:00'), pd.Timestamp('2018-11-01 03:00')],
+            ['paid', pd.Timestamp('2018-11-01 03:00'), pd.Timestamp('2018-11-01 05:00')],
+            ['free', pd.Timestamp('2018-11-01 05:00'), pd.NaT],
+        ]
+        assert len(changed) == 3
+
+    def test_shuffled_batches_keep_each_play_on_its_level(self):
+        """Test that, whatever order events are loaded in, every play's version has the play's level."""
+        rng = np.random.default_rng(25)
+        times = pd.date_range('2018-11-01', periods=80, freq='h')
+        events = [(user, ts, 'paid' if paid else 'free') for user in (8, 9)
+                  for ts, paid in zip(times, np.cumsum(rng.random(len(times)) < 0.2) % 2)]
+        for _ in range(10):
+            order = rng.permutation(len(events))
+            stored, plays = versions([]), []
+            for part in np.array_split(order, rng.integers(2, 12)):
+                batch = make_events([events[i] for i in part])
+                new = user_events(batch)
+                merged, changed = merge_user_versions(stored[stored['user_id'].isin(new['user_id'])], new)
+                keys = resolve_user_versions(batch['userId'], batch['ts'], merged)
+                plays += zip(batch['userId'].astype(int), pd.to_datetime(keys), batch['level'])
+                stored = pd.concat([stored, changed]).drop_duplicates(['user_id', 'valid_from'], keep='last')
+            levels = stored.set_index(['user_id', 'valid_from'])['level']
+            assert [levels[(user, key)] for user, key, _ in plays] == [level for _, _, level in plays]
+
+
+def test_resolve_user_versions_as_of():
+    """Test that each play gets the version in effect at its timestamp."""
+    history = versions([(8, 'free', '2018-11-01', '2018-11-05'), (8, 'paid', '2018-11-05', None),
+                        (9, 'free', '2018-11-03', None)])
+    resolved = resolve_user_versions(['8', '9', '8', '8'],
+                                     pd.to_datetime(['2018-11-06', '2018-11-04', '2018-11-02', '2018-11-05']),
+                                     history)
+    assert list(pd.to_datetime(resolved)) == pd.to_datetime(
+        ['2018-11-05', '2018-11-03', '2018-11-01', '2018-11-05']).tolist()
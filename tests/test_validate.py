@@ -0,0 +1,104 @@
+"""
+Tests for Row-Level Validation and Quarantine
+"""
+import json
+import pandas as pd
+from sqlalchemy import create_engine
+from load import load_to_db
+from validate import validate, validate_events, dimension_keys, unloaded_keys
+from lookup import SongLookup
+
+
+def make_events(user_ids, ts=None, levels=None, pages=None):
+    n = len(user_ids)
+    return pd.DataFrame({
+        'artist': ['Gipsy Kings'] * n, 'firstName': ['Kaylee'] * n, 'lastName': ['Summers'] * n,
+        'gender': ['F'] * n, 'level': levels or ['free'] * n, 'location': ['Phoenix, AZ'] * n,
+        'page': pages or ['NextSong'] * n, 'sessionId': [139] * n, 'song': ['The Ocean'] * n,
+        'length': [215.0] * n, 'ts': ts or [1541106106796 + i for i in range(n)],
+        'userAgent': ['Mozilla/5.0'] * n, 'userId': user_ids,
+    })
+
+
+class TestValidateEvents:
+    """Tests for raw log event checks."""
+
+    def test_bad_rows_are_quarantined_with_reasons(self):
+        """Test that only failing events are removed, each tagged with every failed check."""
+        raw = make_events(['8', 'abc', '', '9'], levels=['free', 'free', 'free', 'gold'])
+        valid, rejected = validate_events(raw)
+        assert list(valid['userId']) == [8]
+        assert list(rejected['reasons']) == ['type:userId', 'null:userId', 'value:level']
+        assert (rejected['table_name'] == 'events').all()
+        assert json.loads(rejected['record'].iloc[0])['userId'] == 'abc'
+
+    def test_user_ids_must_be_plain_digits(self):
+        """Test that numeric-looking but non-integer text is rejected and valid ids become ints."""
+        raw = make_events(['7.0', '1e1', ' 8', '9'])
+        raw['userId'] = raw['userId'].astype('string')
+        valid, rejected = validate_events(raw)
+        assert list(valid['userId']) == [8, 9] and valid['userId'].dtype == 'int64'
+        assert list(rejected['reasons']) == ['type:userId', 'type:userId']
+
+    def test_other_pages_are_not_quarantined(self):
+        """Test that logged-out Home events without a userId are dropped, not quarantined."""
+        raw = make_events(['8', ''], pages=['NextSong', 'Home'])
+        valid, rejected = validate_events(raw)
+        assert len(valid) == 1
+        assert rejected.empty
+
+    def test_timestamp_range(self):
+        """Test that negative and far-future timestamps are rejected."""
+        valid, rejected = validate_events(make_events(['1', '2', '3'], ts=[1541106106796, -5, 10**14]))
+        assert len(valid) == 1
+        assert list(rejected['reasons']) == ['range:ts', 'range:ts']
+
+
+class TestValidateDimensions:
+    """Tests for song and artist checks."""
+
+    def test_songs_and_artists(self):
+        """Test nullability and range checks on the song dimensions."""
+        songs = pd.DataFrame({'song_id': ['S1', 'S2', 'S3'], 'title': ['A', None, 'C'],
+                              'artist_id': ['AR1'] * 3, 'year': [1982, 0, 3000], 'duration': [200.0, 100.0, 0.0]})
+        valid, rejected = validate(songs, 'songs')
+        assert list(valid['song_id']) == ['S1']
+        assert list(rejected['reasons']) == ['null:title', 'range:year,range:duration']
+
+        artists = pd.DataFrame({'artist_id': ['AR1', 'AR2'], 'name': ['X', 'Y'], 'location': [None, None],
+                                'latitude': [40.0, 95.0], 'longitude': [-70.0, 10.0]})
+        valid, rejected = validate(artists, 'artists')
+        assert list(valid['artist_id']) == ['AR1']
+        assert list(rejected['reasons']) == ['range:latitude']
+
+
+def test_songplays_references():
+    """Test that songplays must reference committed songs, artists and dimensions whose batch load succeeded."""
+    engine = create_engine('sqlite://')
+    songs = pd.DataFrame({'song_id': ['S1', 'S2'], 'title': ['A', 'B'], 'artist_id': ['AR1', 'AR2'],
+                          'year': [1982, 1990], 'duration': [200.0, 180.0]})
+    artists = pd.DataFrame({'artist_id': ['AR1', 'AR2'], 'name': ['X', 'Y'], 'location': [None, None],
+                            'latitude': [40.0, 95.0], 'longitude': [-70.0, 10.0]})
+    # AR2 is quarantined, but its song is kept and the lookup still resolves plays to it
+    songs, _ = validate(songs, 'songs')
+    artists, _ = validate(artists, 'artists')
+    load_to_db(songs, 'songs', engine)
+    load_to_db(artists, 'artists', engine)
+    lookup = SongLookup.from_frames(songs, artists)
+    assert list(lookup.artist_ids) == ['AR1', 'AR2']
+
+    songplays = pd.DataFrame({'start_time': pd.to_datetime([1541106106796, 1541106166796, 1541106226796], unit='ms'),
+                              'user_id': [8, 9, 9], 'song_id': ['S1', 'S2', 'S3'], 'artist_id': ['AR1', 'AR2', None]})
+    known = dimension_keys(engine)
+    valid, rejected = validate(songplays, 'songplays', known)
+    assert list(valid['song_id']) == ['S1']
+    assert list(rejected['reasons']) == ['ref:artists', 'ref:songs']
+
+    # Every play of a batch whose time rows failed to load is rejected
+    valid, rejected = validate(songplays, 'songplays', {**known, **unloaded_keys(['time'])})
+    assert valid.empty
+    assert list(rejected['reasons']) == ['ref:time', 'ref:time,ref:artists', 'ref:time,ref:songs']
+
+    # Without known keys there is nothing to check against
+    valid, rejected = validate(songplays, 'songplays')
+    assert len(valid) == 3 and rejected.empty